@@ -0,0 +1,96 @@
+'''
+Benchmark compression codecs on pickled SimpleML artifacts
+
+Compares size, save time and load time for each codec on:
+    - a fitted random forest (SklearnRandomForestClassifier external model)
+    - a processed dataset dataframe
+
+Usage:
+    python benchmarks/bench_compression.py --rows 100000 --trees 100
+'''
+
+__author__ = 'Elisha Yadgaran'
+
+
+import argparse
+import shutil
+import tempfile
+import time
+import dill as pickle
+import numpy as np
+import pandas as pd
+
+from simpleml.models.classifiers.sklearn.ensemble import WrappedSklearnRandomForestClassifier
+from simpleml.persistables.compression import get_codec, CODECS
+from simpleml.persistables.filestore import ContentAddressedFilestore
+
+
+def build_dataset(rows):
+    '''
+    Mixed numeric/categorical frame shaped like a processed dataset
+    '''
+    random_state = np.random.RandomState(0)
+    df = pd.DataFrame(random_state.rand(rows, 20), columns=['feature_{}'.format(i) for i in xrange(20)])
+    df['category'] = random_state.choice(['a', 'b', 'c', 'd'], rows)
+    df['count'] = random_state.poisson(3, rows)
+    df['label'] = (df['feature_0'] + random_state.rand(rows) > 1).astype(int)
+    return df
+
+
+def build_model(df, trees):
+    features = df[['feature_{}'.format(i) for i in xrange(20)] + ['count']]
+    model = WrappedSklearnRandomForestClassifier(n_estimators=trees, random_state=0)
+    model.fit(features, df['label'])
+    return model
+
+
+def bench_artifact(name, artifact, levels):
+    root = tempfile.mkdtemp()
+    try:
+        print '\n{}'.format(name)
+        print '{:8} {:>6} {:>12} {:>10} {:>10}'.format('codec', 'level', 'size (MB)', 'save (s)', 'load (s)')
+
+        for codec_name in [None] + sorted(i for i in CODECS if i is not None):
+            for level in levels.get(codec_name, [None]):
+                try:
+                    codec = get_codec(codec_name, level)
+                except ImportError:
+                    print '{:8} not installed'.format(codec_name)
+                    break
+
+                # Fresh store per run so nothing is deduplicated
+                store = ContentAddressedFilestore(tempfile.mkdtemp(dir=root))
+
+                start = time.time()
+                path = store.put(lambda f: pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL),
+                                 codec=codec)
+                save_time = time.time() - start
+
+                start = time.time()
+                with store.open(path, codec=codec) as f:
+                    pickle.load(f)
+                load_time = time.time() - start
+
+                with open(store.absolute_path(path), 'rb') as f:
+                    f.seek(0, 2)
+                    size = f.tell() / 1e6
+
+                print '{:8} {:>6} {:>12.2f} {:>10.3f} {:>10.3f}'.format(
+                    str(codec_name), str(codec.level), size, save_time, load_time)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--trees', type=int, default=100)
+    args = parser.parse_args()
+
+    levels = {'gzip': [1, 6, 9], 'zstd': [1, 3, 9, 19], 'lz4': [0, 9]}
+
+    dataset = build_dataset(args.rows)
+    model = build_model(dataset, args.trees)
+
+    bench_artifact('RandomForest ({} trees, {} rows)'.format(args.trees, args.rows), model, levels)
+    bench_artifact('Processed dataset ({} rows)'.format(args.rows), dataset, levels)
@@ -0,0 +1,117 @@
+'''
+Benchmark csv vs binary `copy` formats for dataset tables on wide float frames
+
+Usage:
+    python benchmarks/bench_copy_format.py --rows 100000 --columns 200
+    python benchmarks/bench_copy_format.py --encode-only
+
+Without `--encode-only` a postgres database is required (connection
+parameters default to the `Database` defaults)
+'''
+
+__author__ = 'Elisha Yadgaran'
+
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from simpleml.persistables.copy_streams import DataframeCopyStream, encode_binary_chunk,\
+    PGCOPY_HEADER, PGCOPY_TRAILER, decode_binary_copy
+
+
+def timed(func, repeat):
+    '''
+    Best wall time (seconds) over `repeat` runs
+    '''
+    best = float('inf')
+    for _ in xrange(repeat):
+        start = time.time()
+        func()
+        best = min(best, time.time() - start)
+    return best
+
+
+def drain(stream):
+    total = 0
+    while True:
+        chunk = stream.read(65536)
+        if not chunk:
+            break
+        total += len(chunk)
+    stream.close()
+    return total
+
+
+def bench_encoding(df, repeat):
+    '''
+    Serialization only (no database)
+    '''
+    def csv():
+        encoder = lambda chunk: chunk.to_csv(None, sep='|', header=False, index=False)
+        return drain(DataframeCopyStream(df, encoder))
+
+    def binary():
+        return drain(DataframeCopyStream(df, encode_binary_chunk,
+                                         header=PGCOPY_HEADER, footer=PGCOPY_TRAILER))
+
+    payload = PGCOPY_HEADER + encode_binary_chunk(df) + PGCOPY_TRAILER
+    column_names = [str(i) for i in df.columns]
+    type_oids = [701] * df.shape[1]
+
+    def binary_decode():
+        return decode_binary_copy(payload, column_names, type_oids)
+
+    print 'encode csv:     {:.3f}s'.format(timed(csv, repeat))
+    print 'encode binary:  {:.3f}s'.format(timed(binary, repeat))
+    print 'decode binary:  {:.3f}s'.format(timed(binary_decode, repeat))
+
+
+def bench_database(df, repeat, **database_kwargs):
+    '''
+    Round trip through postgres
+    '''
+    from simpleml.persistables.saving import DataframeTableSaveMixin
+    from simpleml.datasets.base_dataset import BaseDataset
+    from simpleml.utils.initialization import Database
+
+    engine = Database(**database_kwargs).engine
+    table = 'simpleml_copy_benchmark'
+
+    for copy_format in ('csv', 'binary'):
+        save = lambda: DataframeTableSaveMixin.df_to_sql(
+            engine, df, table, copy_format=copy_format)
+        print 'save {:6}:    {:.3f}s'.format(copy_format, timed(save, repeat))
+
+        if copy_format == 'csv':
+            load = lambda: BaseDataset.load_sql('select * from "public"."{}"'.format(table), engine)
+        else:
+            load = lambda: DataframeTableSaveMixin.copy_to_df(engine, table)
+        print 'load {:6}:    {:.3f}s'.format(copy_format, timed(load, repeat))
+
+    engine.execute('DROP TABLE IF EXISTS "public"."{}"'.format(table))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--columns', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--encode-only', action='store_true')
+    parser.add_argument('--database', default='SimpleML')
+    parser.add_argument('--user', default='simpleml')
+    parser.add_argument('--password', default='simpleml')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5432)
+    args = parser.parse_args()
+
+    df = pd.DataFrame(np.random.rand(args.rows, args.columns),
+                      columns=['feature_{}'.format(i) for i in xrange(args.columns)])
+    print 'Frame: {} rows x {} float64 columns ({:.1f} MB)'.format(
+        args.rows, args.columns, df.memory_usage().sum() / 1e6)
+
+    bench_encoding(df, args.repeat)
+    if not args.encode_only:
+        bench_database(df, args.repeat, database=args.database, user=args.user,
+                       password=args.password, host=args.host, port=args.port)
@@ -0,0 +1,107 @@
+'''
+Benchmark the persistable hashing engine
+
+Compares the legacy deepcopy/builtin `hash` implementation of
+`custom_hasher` with the streaming blake2b `Hasher` on:
+    - nested config dictionaries (pipeline/model params)
+    - a processed dataset dataframe
+
+and the dataframe fingerprint with one versus `--workers` threads
+
+Usage:
+    python benchmarks/bench_hashing.py --rows 1000000 --configs 10000
+'''
+
+__author__ = 'Elisha Yadgaran'
+
+
+import argparse
+import copy
+import time
+import numpy as np
+import pandas as pd
+from pandas.util import hash_pandas_object
+
+from simpleml.persistables.hashing import CustomHasherMixin, dataframe_fingerprint, DEFAULT_HASH_WORKERS
+
+
+def legacy_hasher(object_to_hash, custom_class_proxy=type(object.__dict__)):
+    '''
+    Previous implementation of `CustomHasherMixin.custom_hasher`
+    '''
+    if type(object_to_hash) == custom_class_proxy:
+        object_to_hash = dict((k, v) for k, v in object_to_hash.items() if not k.startswith('__'))
+
+    if isinstance(object_to_hash, (set, tuple, list)):
+        return tuple([legacy_hasher(e) for e in object_to_hash])
+
+    elif isinstance(object_to_hash, (pd.DataFrame, pd.Series)):
+        return hash_pandas_object(object_to_hash, index=False).sum()
+
+    elif object_to_hash is None:
+        return -12345678987654321
+
+    elif not isinstance(object_to_hash, dict):
+        return hash(object_to_hash)
+
+    new_object_to_hash = copy.deepcopy(object_to_hash)
+    for k, v in new_object_to_hash.items():
+        new_object_to_hash[k] = legacy_hasher(v)
+
+    return hash(tuple(frozenset(sorted(new_object_to_hash.items()))))
+
+
+def build_configs(count):
+    return [{
+        'name': 'model_{}'.format(i),
+        'params': {'n_estimators': i % 100, 'max_depth': None, 'criterion': 'gini',
+                   'class_weight': {0: 1.0, 1: float(i % 7)}},
+        'pipeline': {'split': [0.8, 0.1, 0.1], 'random_state': i, 'transformers': ['scale', 'impute']},
+        'tags': ['nightly', 'v{}'.format(i % 3)],
+    } for i in xrange(count)]
+
+
+def build_dataset(rows):
+    random_state = np.random.RandomState(0)
+    df = pd.DataFrame(random_state.rand(rows, 20), columns=['feature_{}'.format(i) for i in xrange(20)])
+    df['category'] = random_state.choice(['a', 'b', 'c', 'd'], rows)
+    df['label'] = random_state.randint(0, 2, rows)
+    return df
+
+
+def timed(fn, objects, repeat):
+    best = None
+    for _ in xrange(repeat):
+        start = time.time()
+        for obj in objects:
+            fn(obj)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--configs', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=DEFAULT_HASH_WORKERS)
+    args = parser.parse_args()
+
+    hasher = CustomHasherMixin().custom_hasher
+    dataset = build_dataset(args.rows)
+    workloads = [
+        ('{} config dicts'.format(args.configs), build_configs(args.configs)),
+        ('dataframe ({} rows)'.format(args.rows), [dataset]),
+    ]
+
+    print '{:28} {:>12} {:>12} {:>8}'.format('workload', 'legacy (s)', 'blake2b (s)', 'speedup')
+    for name, objects in workloads:
+        legacy_time = timed(legacy_hasher, objects, args.repeat)
+        new_time = timed(hasher, objects, args.repeat)
+        print '{:28} {:>12.3f} {:>12.3f} {:>8.2f}'.format(name, legacy_time, new_time, legacy_time / new_time)
+
+    single = timed(lambda df: dataframe_fingerprint(df, workers=1), [dataset], args.repeat)
+    parallel = timed(lambda df: dataframe_fingerprint(df, workers=args.workers), [dataset], args.repeat)
+    print '\n{:28} {:>12} {:>12} {:>8}'.format('fingerprint', '1 worker (s)', '{} workers (s)'.format(args.workers), 'speedup')
+    print '{:28} {:>12.3f} {:>12.3f} {:>8.2f}'.format('dataframe ({} rows)'.format(args.rows), single, parallel, single / parallel)
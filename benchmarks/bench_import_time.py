@@ -0,0 +1,61 @@
+'''
+Measure the cold import time of simpleml
+
+Each statement is timed in a fresh interpreter (`--runs` times, best and
+median reported) together with the heavy libraries it leaves loaded in
+`sys.modules`. The scoring statement is what a short-lived scoring CLI
+imports before loading a model
+
+Usage:
+    python benchmarks/bench_import_time.py --runs 10
+    python benchmarks/bench_import_time.py --statement "import simpleml.models"
+'''
+
+__author__ = 'Elisha Yadgaran'
+
+
+import argparse
+import json
+import subprocess
+import sys
+
+
+STATEMENTS = [
+    'import simpleml',
+    'from simpleml.utils.scoring.load_persistable import PersistableLoader',
+]
+HEAVY_MODULES = ['sklearn', 'psycopg2', 'dill', 'pandas', 'sqlalchemy', 'pyarrow', 'scipy']
+
+# Runs in the child interpreter: time the statement, report loaded heavy modules
+CHILD = '''
+import json, sys, time
+start = time.time()
+exec({statement!r})
+elapsed = time.time() - start
+print(json.dumps({{'elapsed': elapsed, 'modules': len(sys.modules),
+                  'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def time_statement(statement, runs):
+    results = []
+    for _ in xrange(runs):
+        output = subprocess.check_output(
+            [sys.executable, '-c', CHILD.format(statement=statement, heavy=HEAVY_MODULES)])
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--statement', action='append')
+    args = parser.parse_args()
+
+    for statement in args.statement or STATEMENTS:
+        results = time_statement(statement, args.runs)
+        timings = sorted(result['elapsed'] for result in results)
+        print statement
+        print '    best {:.3f}s  median {:.3f}s  modules {}'.format(
+            timings[0], timings[len(timings) // 2], results[-1]['modules'])
+        print '    heavy modules loaded: {}'.format(', '.join(results[-1]['loaded']) or 'none')
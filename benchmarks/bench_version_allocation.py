@@ -0,0 +1,112 @@
+'''
+Stress test version allocation with concurrent workers saving one name
+
+Each worker process inserts `--saves` persistable rows for the same name,
+allocating versions either from the counter table (`counter`) or with the
+previous `select max(version) + 1` (`max`, retried on unique violations).
+Reports throughput, retries and whether the versions are 1..N
+
+Usage:
+    python benchmarks/bench_version_allocation.py --workers 32 --saves 50
+    python benchmarks/bench_version_allocation.py --sqlite /tmp/stress.sqlite
+
+A postgres database is required unless `--sqlite` is passed (connection
+parameters default to the `Database` defaults)
+'''
+
+__author__ = 'Elisha Yadgaran'
+
+
+import argparse
+import multiprocessing
+import time
+import uuid
+from sqlalchemy import select, func
+from sqlalchemy.exc import IntegrityError
+
+from simpleml.datasets.raw_datasets.base_raw_dataset import BaseRawDataset
+from simpleml.persistables.version_counter import VersionCounter
+from simpleml.utils.initialization import Database, SQLiteDatabase, dispose_engines
+
+
+def get_database(args):
+    if args.sqlite:
+        return SQLiteDatabase(args.sqlite)
+    return Database(database=args.database, user=args.user, password=args.password,
+                    host=args.host, port=args.port)
+
+
+def insert_row(connection, table, name, version):
+    connection.execute(table.insert().values({
+        'id': uuid.uuid4(), 'hash': 0, 'registered_name': 'BaseRawDataset', 'author': 'stress',
+        'name': name, 'version': version, 'has_external_files': False, 'filepaths': {}, 'metadata': {}}))
+
+
+def worker(job):
+    args, name, saves = job
+    database = get_database(args)
+    database.initialize(create_tables=False)
+    engine = database.engine
+    table = BaseRawDataset.__table__
+
+    retries = 0
+    for _ in xrange(saves):
+        if args.allocator == 'counter':
+            version = VersionCounter.allocate(table, name)
+            with engine.begin() as connection:
+                insert_row(connection, table, name, version)
+            continue
+
+        while True:
+            try:
+                with engine.begin() as connection:
+                    version = connection.execute(select([func.coalesce(func.max(table.c.version), 0) + 1])
+                                                 .where(table.c.name == name)).scalar()
+                    insert_row(connection, table, name, version)
+                break
+            except IntegrityError:
+                retries += 1
+    return retries
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--saves', type=int, default=50)
+    parser.add_argument('--allocator', choices=['counter', 'max', 'both'], default='both')
+    parser.add_argument('--sqlite')
+    parser.add_argument('--database', default='SimpleML')
+    parser.add_argument('--user', default='simpleml')
+    parser.add_argument('--password', default='simpleml')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5432)
+    args = parser.parse_args()
+
+    database = get_database(args)
+    database.initialize()
+    table = BaseRawDataset.__table__
+
+    allocators = ['counter', 'max'] if args.allocator == 'both' else [args.allocator]
+    print '{:10} {:>8} {:>10} {:>10} {:>10}'.format('allocator', 'saves', 'saves/s', 'retries', 'gapless')
+    for allocator in allocators:
+        args.allocator = allocator
+        name = 'version_stress_{}'.format(uuid.uuid4().hex)
+
+        # Workers open their own connections
+        dispose_engines()
+        pool = multiprocessing.Pool(args.workers)
+        start = time.time()
+        retries = sum(pool.map(worker, [(args, name, args.saves)] * args.workers))
+        elapsed = time.time() - start
+        pool.close()
+        pool.join()
+
+        total = args.workers * args.saves
+        versions = [row[0] for row in database.engine.execute(
+            select([table.c.version]).where(table.c.name == name).order_by(table.c.version))]
+        print '{:10} {:>8} {:>10.1f} {:>10} {:>10}'.format(
+            allocator, total, total / elapsed, retries, str(versions == range(1, total + 1)))
+
+        with database.engine.begin() as connection:
+            connection.execute(table.delete().where(table.c.name == name))
+            connection.execute(VersionCounter.__table__.delete().where(VersionCounter.__table__.c.name == name))
@@ -19,8 +19,16 @@ setup(
         'psycopg2',
         'scikit-learn',
         'numpy',
-        'dill'
+        'dill',
+        'futures; python_version < "3"',
+        'pyblake2; python_version < "3.6"'
     ],
+    extras_require={
+        'parquet': ['pyarrow'],
+        'zstd': ['zstandard'],
+        'lz4': ['lz4'],
+        's3': ['boto3'],
+    },
     zip_safe=False,
     test_suite='nose.collector',
     tests_require=['nose']
@@ -1,5 +1,5 @@
-# Import utils on load to create expected directories
-import utils
+# Persistable packages (datasets, pipelines, models, metrics) are not
+# imported here; the registry imports them on demand (see `Registry.get`)
 from _version import __version__
 import logging
 
@@ -10,12 +10,3 @@ logging.basicConfig(
 
 
 __author__ = 'Elisha Yadgaran'
-
-
-'''
-Import modules to register class names in global registry
-'''
-import datasets
-import metrics
-import models
-import pipelines
@@ -1,9 +1,9 @@
 '''
-Import modules to register class names in global registry
+Modules imported on demand (see `Registry.get`) to register class
+names in global registry
 '''
-import base_dataset
-import raw_datasets
-import processed_datasets
-
 
 __author__ = 'Elisha Yadgaran'
+
+
+REGISTRY_MODULES = ['base_dataset', 'raw_datasets', 'processed_datasets']
@@ -1,5 +1,7 @@
 from simpleml.persistables.base_persistable import BasePersistable
 from simpleml.persistables.saving import AllSaveMixin
+from simpleml.persistables import fingerprint_cache
+import inspect
 import pandas as pd
 
 
@@ -24,6 +26,10 @@ class BaseDataset(BasePersistable, AllSaveMixin):
 
     __abstract__ = True
 
+    # Column projections read from storage while the dataframe is unloaded,
+    # keyed by column tuple (not persisted)
+    _projections = None
+
     def __init__(self, has_external_files=True, **kwargs):
         # By default assume unsupervised so no targets
         label_columns = kwargs.pop('label_columns', [])
@@ -43,6 +49,8 @@ class BaseDataset(BasePersistable, AllSaveMixin):
         # Return dataframe if generated, otherwise generate first
         if self.unloaded_externals:
             self._load_external_files()
+            # Served from the full dataframe from now on
+            self._projections = None
 
         if self._external_file is None:
             self.build_dataframe()
@@ -56,19 +64,89 @@ class BaseDataset(BasePersistable, AllSaveMixin):
         '''
         return self.config.get('label_columns', [])
 
+    @property
+    def column_names(self):
+        '''
+        Dataframe column names. Read from the saved metadata when the
+        dataframe is not loaded (not `columns`, which sqlalchemy-mixins
+        uses for the table columns in `where()`)
+        '''
+        if self.unloaded_externals and self.metadata_.get('columns') is not None:
+            return self.metadata_['columns']
+        return list(self.dataframe.columns)
+
     @property
     def X(self):
         '''
         Return the subset that isn't in the target labels
         '''
-        return self.dataframe[self.dataframe.columns.difference(self.label_columns)]
+        return self.load_columns(pd.Index(self.column_names).difference(self.label_columns))
 
     @property
     def y(self):
         '''
         Return the target label columns
         '''
-        return self.dataframe[self.label_columns]
+        return self.load_columns(self.label_columns)
+
+    def load_columns(self, columns):
+        '''
+        Return only `columns` of the dataframe
+
+        If the dataframe is not loaded yet, the selection is pushed down to
+        storage (selected columns for tables, column subset for parquet) so
+        memory and load time scale with the requested columns. Projections
+        are kept on the dataset, so repeated `X`/`y` accesses (and subsets
+        of them) only read storage once
+        '''
+        columns = list(columns)
+        if not self.unloaded_externals or not columns:
+            return self.dataframe[columns]
+
+        if self._projections is None:
+            self._projections = {}
+
+        key = tuple(columns)
+        if key in self._projections:
+            return self._projections[key]
+        for projection_columns, projection in self._projections.iteritems():
+            if set(columns).issubset(projection_columns):
+                return projection[columns]
+
+        projection = self._load_external_columns(columns)
+        if self.unloaded_externals:
+            # Formats without column selection load the full dataframe instead
+            self._projections[key] = projection
+        return projection
+
+    def iter_dataframe(self, chunksize=10000, columns=None):
+        '''
+        Iterate over the dataframe (or only `columns` of it) in chunks of
+        `chunksize` rows
+
+        Datasets stored as database tables are streamed from the database
+        without materializing the full dataframe, otherwise the dataframe
+        is loaded (or built) and sliced
+        '''
+        if self.unloaded_externals and self.state['save_method'] in ('database', 'database_binary'):
+            for chunk in self._iter_dataframe_from_table(chunksize=chunksize, columns=columns):
+                yield chunk
+            return
+
+        dataframe = self.dataframe if columns is None else self.load_columns(columns)
+        for start in xrange(0, len(dataframe), chunksize):
+            yield dataframe.iloc[start:start + chunksize]
+
+    def save(self, **kwargs):
+        '''
+        Extend parent function to record the column names, so columns can
+        be selected without loading the dataframe
+        '''
+        columns = list(self.dataframe.columns)
+        if all(isinstance(column, (basestring, int, long)) for column in columns):
+            self.metadata_['columns'] = columns
+
+        super(BaseDataset, self).save(**kwargs)
 
     def build_dataframe(self):
         '''
@@ -85,10 +163,56 @@ class BaseDataset(BasePersistable, AllSaveMixin):
         so overwrite for differing behavior
 
         Hash is the combination of the:
-            1) Dataframe
+            1) Dataframe (row blocks hashed in parallel, see `dataframe_block_digests`)
             2) Config
         '''
-        return hash(self.custom_hasher((self.dataframe, self.config)))
+        # Source identity before and after reading, so a source changing
+        # while it is read is not memoized
+        key = self._fingerprint_key()
+        hash_ = self.custom_hasher((self.dataframe, self.config))
+        if key is not None and key == self._fingerprint_key():
+            fingerprint_cache.FINGERPRINT_CACHE.put(key, hash_)
+        return hash_
+
+    def source_identity(self):
+        '''
+        Stable identity of the data source the dataframe is built from, eg
+        `file_source_identity(path)` or `query_source_identity(query, watermark)`
+        (see simpleml.persistables.fingerprint_cache). Override to let the
+        hash be memoized. None (default) disables memoization
+        '''
+        return None
+
+    def _build_identity(self):
+        '''
+        Source code of the class `build_dataframe`, so editing it invalidates
+        memoized hashes. Changes to code it calls into are not detected,
+        clear the fingerprint cache after changing those
+        '''
+        build_dataframe = type(self).build_dataframe
+        try:
+            return inspect.getsource(build_dataframe)
+        except (IOError, TypeError):
+            return build_dataframe.__func__.__code__.co_code
+
+    def _fingerprint_key(self):
+        identity = self.source_identity()
+        if identity is None:
+            return None
+        return fingerprint_cache.fingerprint_key(
+            self.registered_name, self._build_identity(), self.config, identity)
+
+    def _memoized_hash(self):
+        '''
+        Hash without building the dataframe if the source is unchanged since
+        the last time it was hashed, otherwise falls back to `_hash`
+        '''
+        key = self._fingerprint_key()
+        if key is not None:
+            hash_ = fingerprint_cache.FINGERPRINT_CACHE.get(key)
+            if hash_ is not None:
+                return hash_
+        return self._hash()
 
     @staticmethod
     def load_csv(filename, **kwargs):
@@ -5,9 +5,11 @@ Otherwise, a `raw dataset` needs to be created with a `dataset pipeline`
 to transform it into the processed form.
 
 
-Import modules to register class names in global registry
+Modules imported on demand (see `Registry.get`) to register class
+names in global registry
 '''
-import base_processed_dataset
-
 
 __author__ = 'Elisha Yadgaran'
+
+
+REGISTRY_MODULES = ['base_processed_dataset']
@@ -3,9 +3,11 @@ Directory for Raw, or unprocessed datasets. In situations of clean,
 representative data, this can be bypassed or transformed directly with
 the identity pipeline (no adjustment)
 
-Import modules to register class names in global registry
+Modules imported on demand (see `Registry.get`) to register class
+names in global registry
 '''
-import base_raw_dataset
-
 
 __author__ = 'Elisha Yadgaran'
+
+
+REGISTRY_MODULES = ['base_raw_dataset', 'csv_raw_dataset']
@@ -0,0 +1,26 @@
+from simpleml.datasets.raw_datasets.base_raw_dataset import BaseRawDataset
+from simpleml.persistables.fingerprint_cache import file_source_identity
+
+__author__ = 'Elisha Yadgaran'
+
+
+class CSVRawDataset(BaseRawDataset):
+    '''
+    Raw dataset read from a csv file. The file path, size and modification
+    time identify the source, so strict retrieval reuses the memoized hash
+    until the file changes
+    '''
+    def __init__(self, filepath=None, csv_kwargs=None, **kwargs):
+        '''
+        :param filepath: path of the csv file
+        :param csv_kwargs: keyword arguments passed to `pd.read_csv`
+        '''
+        super(CSVRawDataset, self).__init__(**kwargs)
+        self.config['filepath'] = filepath
+        self.config['csv_kwargs'] = csv_kwargs or {}
+
+    def build_dataframe(self):
+        self._external_file = self.load_csv(self.config['filepath'], **self.config['csv_kwargs'])
+
+    def source_identity(self):
+        return file_source_identity(self.config['filepath'])
@@ -1,8 +1,9 @@
 '''
-Import modules to register class names in global registry
+Modules imported on demand (see `Registry.get`) to register class
+names in global registry
 '''
-import base_metric
-import classification
-
 
 __author__ = 'Elisha Yadgaran'
+
+
+REGISTRY_MODULES = ['base_metric', 'classification']
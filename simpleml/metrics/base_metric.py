@@ -1,7 +1,9 @@
 from simpleml.persistables.base_persistable import BasePersistable, GUID
 from simpleml.utils.errors import MetricError
-from sqlalchemy import Column, ForeignKey, UniqueConstraint, Index, func
-from sqlalchemy.dialects.postgresql import JSONB
+from simpleml.persistables.version_counter import VersionCounter
+from sqlalchemy import Column, ForeignKey, UniqueConstraint, Index
+from simpleml.persistables.json_type import JSONType
+from simpleml.persistables.json_search import add_postgres_index, gin_index, expression_index
 from sqlalchemy.orm import relationship
 
 __author__ = 'Elisha Yadgaran'
@@ -25,7 +27,7 @@ class BaseMetric(BasePersistable):
     '''
     __tablename__ = 'metrics'
 
-    values = Column(JSONB, nullable=False)
+    values = Column(JSONType, nullable=False)
 
     # Only dependency is the model (to score in production)
     model_id = Column(GUID, ForeignKey("models.id"))
@@ -41,6 +43,8 @@ class BaseMetric(BasePersistable):
         UniqueConstraint('name', 'model_id', 'version', name='metric_name_model_version_unique'),
         # Index for searching through friendly names
         Index('metric_name_index', 'name'),
+        # Index for joining metrics onto models
+        Index('metric_model_name_index', 'model_id', 'name'),
      )
 
     def add_model(self, model):
@@ -60,24 +64,15 @@ class BaseMetric(BasePersistable):
         metric = self.__class__.__name__
         config = self.config
 
-        return hash(self.custom_hasher((model_hash, metric, config)))
+        return self.custom_hasher((model_hash, metric, config))
 
     def _get_latest_version(self):
         '''
         Versions should be autoincrementing for each object (constrained over
-        friendly name and model). Executes a database lookup and increments..
+        friendly name and model). Allocated from the atomic counter of the
+        name and model
         '''
-        last_version = self.__class__.query_by(
-            func.max(self.__class__.version)
-        ).filter(
-            self.__class__.name == self.name,
-            self.__class__.model_id == self.model.id
-        ).scalar()
-
-        if last_version is None:
-            last_version = 0
-
-        return last_version + 1
+        return VersionCounter.allocate(self.__table__, self.name, model_id=self.model.id)
 
     def save(self, **kwargs):
         '''
@@ -110,3 +105,8 @@ class BaseMetric(BasePersistable):
         Should set self.values
         '''
         raise NotImplementedError
+
+
+# Metric value search and leaderboards by name (postgres)
+add_postgres_index(BaseMetric.__table__, *gin_index(BaseMetric.__table__, 'values'))
+add_postgres_index(BaseMetric.__table__, *expression_index(BaseMetric.__table__, 'values', 'agg', leading_columns=['name']))
@@ -1,10 +1,9 @@
 '''
-Import modules to register class names in global registry
+Modules imported on demand (see `Registry.get`) to register class
+names in global registry
 '''
-import base_model
-import classifiers
-import clusterers
-import regressors
-
 
 __author__ = 'Elisha Yadgaran'
+
+
+REGISTRY_MODULES = ['base_model', 'classifiers', 'regressors']
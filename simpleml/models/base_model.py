@@ -3,7 +3,8 @@ from simpleml.persistables.saving import AllSaveMixin
 from simpleml.utils.errors import ModelError
 from simpleml.pipelines.base_pipeline import TRAIN_SPLIT
 from sqlalchemy import Column, ForeignKey, UniqueConstraint, Index
-from sqlalchemy.dialects.postgresql import JSONB
+from simpleml.persistables.json_type import JSONType
+from simpleml.persistables.json_search import add_postgres_index, gin_index
 from sqlalchemy.orm import relationship
 import logging
 
@@ -35,8 +36,8 @@ class BaseModel(BasePersistable, AllSaveMixin):
     pipeline = relationship("BaseProductionPipeline", enable_typechecks=False)
 
     # Additional model specific metadata
-    params = Column(JSONB, default={})
-    feature_metadata = Column(JSONB, default={})
+    params = Column(JSONType, default={})
+    feature_metadata = Column(JSONType, default={})
 
     __table_args__ = (
         # Unique constraint for versioning
@@ -100,7 +101,7 @@ class BaseModel(BasePersistable, AllSaveMixin):
         params = self.get_params()
         config = self.config
 
-        return hash(self.custom_hasher((pipeline_hash, model, params, config)))
+        return self.custom_hasher((pipeline_hash, model, params, config))
 
     def save(self, **kwargs):
         '''
@@ -202,3 +203,8 @@ class BaseModel(BasePersistable, AllSaveMixin):
         Should return a dict of feature information (importance, coefficients...)
         '''
         return self.external_model.get_feature_metadata(features=self.pipeline.get_feature_names, **kwargs)
+
+
+# Hyperparameter and metadata search (postgres)
+add_postgres_index(BaseModel.__table__, *gin_index(BaseModel.__table__, 'params'))
+add_postgres_index(BaseModel.__table__, *gin_index(BaseModel.__table__, 'metadata'))
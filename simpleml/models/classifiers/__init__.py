@@ -1,8 +1,9 @@
 '''
-Import modules to register class names in global registry
+Modules imported on demand (see `Registry.get`) to register class
+names in global registry
 '''
-import simpleml.models.classifiers.sklearn
-import simpleml.models.classifiers.keras
-
 
 __author__ = 'Elisha Yadgaran'
+
+
+REGISTRY_MODULES = ['sklearn', 'keras']
@@ -3,20 +3,24 @@ Module for sklearn classifiers. Follows structure implemented by
 scikit-learn; linear models, trees, etc.. one file per module
 
 
-Import modules to register class names in global registry
+Modules imported on demand (see `Registry.get`) to register class
+names in global registry
 '''
-import dummy
-import ensemble
-import gaussian_process
-import linear_model
-import mixture
-import multiclass
-import multioutput
-import naive_bayes
-import neighbors
-import neural_network
-import svm
-import tree
-
 
 __author__ = 'Elisha Yadgaran'
+
+
+REGISTRY_MODULES = [
+    'dummy',
+    'ensemble',
+    'gaussian_process',
+    'linear_model',
+    'mixture',
+    'multiclass',
+    'multioutput',
+    'naive_bayes',
+    'neighbors',
+    'neural_network',
+    'svm',
+    'tree',
+]
@@ -0,0 +1,196 @@
+'''
+Background saving for persistables
+
+External files are serialized and written in a bounded thread pool while
+the caller keeps working. The metadata row is inserted on the caller's
+thread once the files are durable (sessions are thread local and the row
+references objects attached to the caller's session):
+    - when `PendingSave.result()` is called
+    - opportunistically on the next background save submission
+    - on `wait_all()`/`flush()` (also run before synchronous saves and at exit)
+
+Rows are always committed in submission order so parent rows exist
+before children reference them. Failed saves are kept until their
+`result()` or `wait_all()` raises the error, whichever path finalized them.
+'''
+
+__author__ = 'Elisha Yadgaran'
+
+
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, wait
+import atexit
+import logging
+import os
+import threading
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Worker threads serializing and writing external files
+DEFAULT_SAVE_WORKERS = int(os.getenv('SIMPLEML_SAVE_WORKERS', 2))
+# Submissions block once this many saves are in flight (backpressure)
+DEFAULT_MAX_PENDING_SAVES = int(os.getenv('SIMPLEML_MAX_PENDING_SAVES', 8))
+
+
+class PendingSave(object):
+    '''
+    Future-like handle for a background save. `result()` waits for the
+    external files, commits the metadata row and returns the persistable
+    '''
+    def __init__(self, persistable, future=None, saver=None):
+        self.persistable = persistable
+        self._future = future
+        self._saver = saver
+        self._finalized = future is None
+        self._error = None
+
+    def done(self):
+        return self._finalized or self._future.done()
+
+    def _finalize(self):
+        '''
+        Commit the metadata row once the files are written. Errors are
+        kept to be raised by `result()`
+        '''
+        if self._finalized:
+            return
+        try:
+            self._future.result()
+            self.persistable._save_metadata()
+        except Exception as e:
+            self._error = e
+        self._finalized = True
+
+    def result(self, timeout=None):
+        if not self._finalized:
+            wait([self._future], timeout=timeout)
+            if not self._future.done():
+                raise TimeoutError('Background save of {} still running'.format(self.persistable.id))
+            # Earlier submissions first so parent rows exist
+            self._saver.finalize(through=self)
+
+        if self._error is not None:
+            # Reported to the caller, `wait_all()` does not raise it again
+            self._saver._discard_failure(self)
+            raise self._error
+        return self.persistable
+
+
+class BackgroundSaver(object):
+    '''
+    Bounded executor for external file writes plus the queue of saves
+    waiting to be finalized (in submission order). Failed saves are kept
+    until `wait_all()` raises them
+    '''
+    def __init__(self, max_workers=DEFAULT_SAVE_WORKERS, max_pending=DEFAULT_MAX_PENDING_SAVES):
+        self.max_workers = max_workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._pending = []
+        self._failed = []
+        self._lock = threading.Lock()
+        self._finalize_lock = threading.RLock()
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def submit(self, persistable):
+        '''
+        Write external files in the background, returns a `PendingSave`
+        '''
+        self.finalize(completed_only=True)
+
+        self._slots.acquire()
+        try:
+            future = self.executor.submit(persistable._save_external_files)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+
+        pending = PendingSave(persistable, future, saver=self)
+        with self._lock:
+            self._pending.append(pending)
+        return pending
+
+    def finalize(self, through=None, completed_only=False):
+        '''
+        Commit metadata rows in submission order. Returns the finalized saves
+
+        :param through: stop after finalizing this pending save
+        :param completed_only: stop at the first save still writing files
+        '''
+        finalized = []
+        with self._finalize_lock:
+            while True:
+                with self._lock:
+                    if not self._pending:
+                        break
+                    pending = self._pending[0]
+                if completed_only and not pending.done():
+                    break
+
+                pending._finalize()
+                finalized.append(pending)
+                with self._lock:
+                    self._pending.remove(pending)
+
+                if pending is through:
+                    break
+
+        for pending in finalized:
+            if pending._error is not None:
+                LOGGER.error('Background save of {} failed: {}'.format(
+                    pending.persistable.id, pending._error))
+                with self._lock:
+                    self._failed.append(pending)
+        return finalized
+
+    def _discard_failure(self, pending):
+        with self._lock:
+            if pending in self._failed:
+                self._failed.remove(pending)
+
+    def wait_all(self):
+        '''
+        Barrier: wait for every pending save and commit its metadata.
+        Raises the first error not yet raised by `PendingSave.result()`,
+        including saves finalized earlier (by a later submission or a
+        synchronous save), after attempting all of them
+        '''
+        self.finalize()
+        with self._lock:
+            failed, self._failed = self._failed, []
+        if failed:
+            if len(failed) > 1:
+                LOGGER.error('{} background saves failed'.format(len(failed)))
+            raise failed[0]._error
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+
+BACKGROUND_SAVER = BackgroundSaver()
+
+
+def wait_all():
+    '''
+    Wait for all background saves and commit their metadata
+    '''
+    BACKGROUND_SAVER.wait_all()
+
+
+flush = wait_all
+
+
+@atexit.register
+def _wait_at_exit():
+    if BACKGROUND_SAVER.pending_count():
+        LOGGER.warning('Waiting for pending background saves before exit')
+    # Also surfaces failures nobody waited on
+    wait_all()
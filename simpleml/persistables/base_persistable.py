@@ -1,11 +1,14 @@
-from sqlalchemy import MetaData, Column, func, String, Boolean, Integer, BigInteger
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import MetaData, Column, String, Boolean, Integer, BigInteger, event
+from sqlalchemy.orm import configure_mappers, Session
+from simpleml.persistables.json_type import JSONType
 from simpleml.persistables.meta_registry import MetaRegistry, SIMPLEML_REGISTRY
 from simpleml.persistables.guid import GUID
+from simpleml.persistables.version_counter import VersionCounter
 from simpleml.persistables.base_sqlalchemy import BaseSQLAlchemy
-from simpleml.persistables.saving import AllSaveMixin
+from simpleml.persistables.saving import AllSaveMixin, release_external_files
 from simpleml.persistables.hashing import CustomHasherMixin
-from simpleml.utils.library_versions import INSTALLED_LIBRARIES
+from simpleml.persistables.background_saving import BACKGROUND_SAVER, PendingSave
+from simpleml.utils.library_versions import get_installed_libraries
 import uuid
 from abc import abstractmethod
 
@@ -13,6 +16,11 @@ from abc import abstractmethod
 __author__ = 'Elisha Yadgaran'
 
 
+# Session info key for external files of persistables deleted in the
+# current transaction
+RELEASED_FILEPATHS_KEY = 'simpleml_released_filepaths'
+
+
 class BasePersistable(BaseSQLAlchemy, AllSaveMixin, CustomHasherMixin):
     '''
     Base class for all SimpleML database objects. Defaults to PostgreSQL
@@ -31,6 +39,8 @@ class BasePersistable(BaseSQLAlchemy, AllSaveMixin, CustomHasherMixin):
     hash_id: Use hash of object to uniquely identify the contents at train time
     registered_name: class name of object defined when importing
         Can be used for the drag and drop GUI - also for prescribing training config
+    registered_module: fully qualified module path of the class. Imported on load
+        if the class is not registered yet (only the module that is needed)
     author: creator
     name: friendly name - primary way of tracking evolution of "same" object over time
     version: autoincrementing id of "friendly name"
@@ -49,9 +59,38 @@ class BasePersistable(BaseSQLAlchemy, AllSaveMixin, CustomHasherMixin):
                 (schema, table_name), (for files extractable with `select * from`)
                 ....
             ],
+            "database_binary": [
+                (schema, table_name), (tables written and read with binary `copy`)
+                ....
+            ],
             "pickled": [
                 guid, (for files in binary blobs)
                 ...
+            ],
+            "disk_pickled": [
+                path to pickled file, relative to the pickled filestore
+                (content addressed, identical files are shared)
+                ...
+            ],
+            "disk_mmap": [
+                directory with the pickle and memory mappable `.npy` array files,
+                relative to the mmap filestore
+            ],
+            "remote_pickled": [
+                key of the pickled file in the remote filestore
+            ],
+            "disk_delta": [
+                path to the pickled snapshot or delta, relative to the pickled filestore
+            ],
+            "delta_parent": id of the version the delta applies to (None for snapshots),
+            "delta_depth": number of deltas since the last snapshot,
+            "compression": {
+                "codec": compression codec of pickled files (None, gzip, zstd, lz4),
+                "level": compression level
+            },
+            "disk_parquet": [
+                filename, relative to the parquet filestore (for dataframes)
+                ...
             ]
         }
 
@@ -74,6 +113,7 @@ class BasePersistable(BaseSQLAlchemy, AllSaveMixin, CustomHasherMixin):
     # TODO: figure out how to hash objects in a way that signifies code content
     hash_ = Column('hash', BigInteger, nullable=False)
     registered_name = Column(String, nullable=False)
+    registered_module = Column(String)
     author = Column(String, default='default', nullable=False)
     name = Column(String, default='default', nullable=False)
     version = Column(Integer, nullable=False)
@@ -81,17 +121,22 @@ class BasePersistable(BaseSQLAlchemy, AllSaveMixin, CustomHasherMixin):
 
     # Persistence of fitted states
     has_external_files = Column(Boolean, default=False)
-    filepaths = Column(JSONB, default={})
+    filepaths = Column(JSONType, default={})
 
     # Generic store and metadata for all child objects
-    metadata_ = Column('metadata', JSONB, default={})
+    metadata_ = Column('metadata', JSONType, default={})
 
+    # Background save bookkeeping (not persisted)
+    _save_in_background = False
+    _pending_save = None
 
     def __init__(self, name='default', has_external_files=False,
                  author='default', version_description=None,
-                 save_method='disk_pickled', **kwargs):
+                 save_method='disk_pickled', compression=None,
+                 compression_level=None, **kwargs):
         # Initialize values expected to exist at time of instantiation
         self.registered_name = self.__class__.__name__
+        self.registered_module = self.__class__.__module__
         self.id = uuid.uuid4()
         self.author = author
         self.name = name
@@ -109,6 +154,9 @@ class BasePersistable(BaseSQLAlchemy, AllSaveMixin, CustomHasherMixin):
         # Store save method in state metadata as an operational setting, otherwise
         # it could affect the hash and result in a different object per save location
         self.state['save_method'] = save_method
+        # Same for the compression codec (`gzip`, `zstd`, `lz4`) of pickled externals
+        self.state['compression'] = compression
+        self.state['compression_level'] = compression_level
 
     @property
     def config(self):
@@ -129,18 +177,10 @@ class BasePersistable(BaseSQLAlchemy, AllSaveMixin, CustomHasherMixin):
     def _get_latest_version(self):
         '''
         Versions should be autoincrementing for each object (constrained over
-        friendly name). Executes a database lookup and increments..
+        friendly name). Allocated from an atomic per name counter so
+        concurrent saves of the same name get distinct versions
         '''
-        last_version = self.__class__.query_by(
-            func.max(self.__class__.version)
-        ).filter(
-            self.__class__.name == self.name
-        ).scalar()
-
-        if last_version is None:
-            last_version = 0
-
-        return last_version + 1
+        return VersionCounter.allocate(self.__table__, self.name)
 
     def save(self):
         '''
@@ -151,8 +191,20 @@ class BasePersistable(BaseSQLAlchemy, AllSaveMixin, CustomHasherMixin):
         so can still call super(BasePersistable, self).save()
         '''
         if self.has_external_files:
+            if self._save_in_background:
+                self._pending_save = BACKGROUND_SAVER.submit(self)
+                return
             self._save_external_files()
 
+        # Parent rows might still be pending in the background
+        BACKGROUND_SAVER.finalize()
+        self._save_metadata()
+
+    def _save_metadata(self):
+        '''
+        Hash, version and insert the database row. External files must
+        already be written
+        '''
         # Hash contents upon save
         self.hash_ = self._hash()
 
@@ -160,10 +212,29 @@ class BasePersistable(BaseSQLAlchemy, AllSaveMixin, CustomHasherMixin):
         self.version = self._get_latest_version()
 
         # Store library versions in case of future loads into unsupported environments
-        self.metadata_['library_versions'] = INSTALLED_LIBRARIES
+        self.metadata_['library_versions'] = get_installed_libraries()
 
         super(BasePersistable, self).save()
 
+    def save_async(self):
+        '''
+        Save with the external files serialized and written in a background
+        thread pool. Returns a `PendingSave` future; the database row is
+        committed once the files are durable and the future is resolved
+        (`result()`, the next background save, or `wait_all()`)
+        '''
+        self._pending_save = None
+        self._save_in_background = True
+        try:
+            self.save()
+        finally:
+            self._save_in_background = False
+
+        if self._pending_save is None:
+            # Nothing to write in the background, already saved
+            return PendingSave(self)
+        return self._pending_save
+
     def load(self, load_externals=True):
         '''
         Counter operation for save
@@ -187,6 +258,51 @@ class BasePersistable(BaseSQLAlchemy, AllSaveMixin, CustomHasherMixin):
 
     def _load_class(self):
         '''
-        Wrapper function to call global registry of all imported class names
+        Wrapper function to call global registry of all imported class names.
+        Imports the class module on a miss (rows saved before
+        `registered_module` was tracked fall back to importing every class)
         '''
-        return SIMPLEML_REGISTRY.get(self.registered_name)
+        cls = SIMPLEML_REGISTRY.get(self.registered_name, self.registered_module)
+        # Classes imported after the first query have unconfigured mappers,
+        # configure them before switching this instance over (no-op otherwise)
+        configure_mappers()
+        return cls
+
+
+@event.listens_for(Session, 'before_flush')
+def _snapshot_delta_children(session, flush_context, instances):
+    '''
+    Versions stored as deltas against a deleted persistable are rewritten
+    as snapshots first. Their replaced files are released with the deletes
+    '''
+    deleted = set(i for i in session.deleted if isinstance(i, BasePersistable))
+    released = session.info.setdefault(RELEASED_FILEPATHS_KEY, [])
+    for persistable in deleted:
+        if persistable.has_external_files:
+            released.extend(persistable._snapshot_delta_children(exclude=deleted))
+
+
+@event.listens_for(Session, 'after_flush')
+def _queue_released_files(session, flush_context):
+    '''
+    Remember the external files of deleted persistables. Filepaths are
+    copied now, the instances are detached by the time the transaction commits
+    '''
+    released = session.info.setdefault(RELEASED_FILEPATHS_KEY, [])
+    for persistable in session.deleted:
+        if isinstance(persistable, BasePersistable) and persistable.has_external_files:
+            released.append(dict(persistable.filepaths or {}))
+
+
+@event.listens_for(Session, 'after_commit')
+def _release_files(session):
+    '''
+    Release filestore references once the deletes are durable
+    '''
+    for filepaths in session.info.pop(RELEASED_FILEPATHS_KEY, []):
+        release_external_files(filepaths)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_released_files(session):
+    session.info.pop(RELEASED_FILEPATHS_KEY, None)
@@ -1,15 +1,23 @@
 '''
 Optional module to persist pickled objects in database instead of filesystem
+
+Blobs are stored as fixed size chunk rows and read/written as streams so
+artifacts never have to be held in memory (or bound as a single parameter)
+in full. Legacy blobs store the whole payload in `BinaryBlob.binary_blob`
 '''
 
 from simpleml.persistables.guid import GUID
 from simpleml.persistables.base_sqlalchemy import BaseSQLAlchemy
-from sqlalchemy import MetaData, Column, String, LargeBinary, event, DDL
+from simpleml.persistables.streams import ChunkedReader
+from sqlalchemy import MetaData, Column, String, LargeBinary, Integer, ForeignKey, event, DDL, select
+import cStringIO
 import uuid
 
 __author__ = 'Elisha Yadgaran'
 
 BINARY_STORAGE_SCHEMA = 'BINARY'
+# Bytes per chunk row
+DEFAULT_BLOB_CHUNK_SIZE = 4 * 2 ** 20
 
 
 class BinaryBlob(BaseSQLAlchemy):
@@ -21,7 +29,134 @@ class BinaryBlob(BaseSQLAlchemy):
 
     object_type = Column(String, nullable=False)
     object_id = Column(GUID, nullable=False)
-    # TODO: Figure this out and think it through...
+    # Legacy single row storage. Null for chunked blobs
     binary_blob = Column(LargeBinary)
 
-    event.listen(metadata, 'before_create', DDL('''CREATE SCHEMA IF NOT EXISTS "{}";'''.format(BINARY_STORAGE_SCHEMA)))
+    event.listen(metadata, 'before_create',
+                 DDL('''CREATE SCHEMA IF NOT EXISTS "{}";'''.format(BINARY_STORAGE_SCHEMA)).execute_if(dialect='postgresql'))
+
+    @classmethod
+    def writer(cls, object_type, object_id, chunk_size=DEFAULT_BLOB_CHUNK_SIZE):
+        '''
+        Write-only stream into a new chunked blob. The blob is committed
+        when the stream is closed
+        '''
+        return BinaryBlobWriter(cls.metadata.bind, object_type, object_id, chunk_size=chunk_size)
+
+    @classmethod
+    def reader(cls, blob_id):
+        '''
+        Read-only stream over a chunked blob
+        '''
+        return BinaryBlobReader(cls.metadata.bind, blob_id)
+
+
+class BinaryBlobChunk(BaseSQLAlchemy):
+    __tablename__ = 'binary_blob_chunks'
+    # Same schema (and create/drop lifecycle) as the blob headers
+    metadata = BinaryBlob.metadata
+
+    blob_id = Column(GUID, ForeignKey(BinaryBlob.id, ondelete='CASCADE'), primary_key=True)
+    seq = Column(Integer, primary_key=True, autoincrement=False)
+    data = Column(LargeBinary, nullable=False)
+
+
+class BinaryBlobWriter(object):
+    '''
+    Write-only file-like object that buffers up to `chunk_size` bytes and
+    inserts each full chunk as a row. The header and chunks are written in
+    one transaction, committed on close (rolled back if the context exits
+    with an exception)
+    '''
+    def __init__(self, engine, object_type, object_id, chunk_size=DEFAULT_BLOB_CHUNK_SIZE):
+        self.blob_id = uuid.uuid4()
+        self.chunk_size = chunk_size
+        self._seq = 0
+        self._buffer = cStringIO.StringIO()
+        self._closed = False
+
+        self._connection = engine.connect()
+        self._transaction = self._connection.begin()
+        self._connection.execute(BinaryBlob.__table__.insert().values(
+            id=self.blob_id, object_type=object_type, object_id=object_id))
+
+    def _insert(self, data):
+        self._connection.execute(BinaryBlobChunk.__table__.insert().values(
+            blob_id=self.blob_id, seq=self._seq, data=data))
+        self._seq += 1
+
+    def write(self, data):
+        self._buffer.write(data)
+        if self._buffer.tell() < self.chunk_size:
+            return
+
+        data = self._buffer.getvalue()
+        start = 0
+        while len(data) - start >= self.chunk_size:
+            self._insert(data[start:start + self.chunk_size])
+            start += self.chunk_size
+
+        self._buffer = cStringIO.StringIO()
+        self._buffer.write(data[start:])
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self._closed:
+            return
+        try:
+            if self._buffer.tell():
+                self._insert(self._buffer.getvalue())
+            self._transaction.commit()
+        finally:
+            self._closed = True
+            self._buffer = None
+            self._connection.close()
+
+    def abort(self):
+        '''
+        Discard everything written
+        '''
+        if self._closed:
+            return
+        self._closed = True
+        self._buffer = None
+        self._transaction.rollback()
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class BinaryBlobReader(ChunkedReader):
+    '''
+    Read-only file-like object over the chunk rows of a blob. Only one
+    chunk is held in memory at a time
+    '''
+    def __init__(self, engine, blob_id):
+        super(BinaryBlobReader, self).__init__()
+        self.blob_id = blob_id
+        self._seq = 0
+        self._connection = engine.connect()
+        table = BinaryBlobChunk.__table__
+        self._query = select([table.c.data]).where(table.c.blob_id == blob_id)
+
+    def _next_chunk(self):
+        table = BinaryBlobChunk.__table__
+        data = self._connection.execute(self._query.where(table.c.seq == self._seq)).scalar()
+        if data is None:
+            return None
+        self._seq += 1
+        # psycopg2 returns buffers for bytea
+        return str(data)
+
+    def close(self):
+        super(BinaryBlobReader, self).close()
+        self._connection.close()
@@ -0,0 +1,254 @@
+'''
+Pluggable compression codecs for serialized external files
+
+Each codec exposes streaming compressor/decompressor objects so pickles
+can be written into (and read from) compressed files without buffering
+the whole payload, plus one-shot helpers for in-memory bytes.
+
+Supported codecs:
+    - None (no compression)
+    - gzip (stdlib)
+    - zstd (requires `zstandard`)
+    - lz4 (requires `lz4`)
+'''
+
+__author__ = 'Elisha Yadgaran'
+
+
+import zlib
+
+from simpleml.persistables.streams import ChunkedReader
+
+# Optional dependencies
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+
+# Size of compressed blocks read from the underlying file at a time
+READ_BLOCK_SIZE = 2 ** 20
+
+
+class _IdentityCompressor(object):
+    def compress(self, data):
+        return data
+
+    def flush(self):
+        return ''
+
+
+class _IdentityDecompressor(object):
+    def decompress(self, data):
+        return data
+
+
+class BaseCodec(object):
+    '''
+    Base class for codecs. Subclasses define the streaming compressor
+    and decompressor factories
+    '''
+    name = None
+    extension = ''
+    default_level = None
+
+    def __init__(self, level=None):
+        self.level = self.default_level if level is None else level
+
+    def compressor(self):
+        '''
+        Object with `compress(bytes) -> bytes` and `flush() -> bytes`
+        '''
+        raise NotImplementedError
+
+    def decompressor(self):
+        '''
+        Object with `decompress(bytes) -> bytes`
+        '''
+        raise NotImplementedError
+
+    def compress(self, data):
+        compressor = self.compressor()
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data):
+        return self.decompressor().decompress(data)
+
+    def writer(self, fileobj):
+        return CompressedWriter(fileobj, self.compressor())
+
+    def reader(self, fileobj):
+        return CompressedReader(fileobj, self.decompressor())
+
+    def to_dict(self):
+        '''
+        Settings to record in persistable filepaths
+        '''
+        return {'codec': self.name, 'level': self.level}
+
+
+class NoCompressionCodec(BaseCodec):
+    def compressor(self):
+        return _IdentityCompressor()
+
+    def decompressor(self):
+        return _IdentityDecompressor()
+
+
+class GzipCodec(BaseCodec):
+    name = 'gzip'
+    extension = '.gz'
+    default_level = 6
+
+    # Gzip container (zlib with gzip header and trailer). The header
+    # carries no timestamp so output is deterministic
+    WBITS = 16 + zlib.MAX_WBITS
+
+    def compressor(self):
+        return zlib.compressobj(self.level, zlib.DEFLATED, self.WBITS)
+
+    def decompressor(self):
+        return zlib.decompressobj(self.WBITS)
+
+
+class ZstdCodec(BaseCodec):
+    name = 'zstd'
+    extension = '.zst'
+    default_level = 3
+
+    def __init__(self, *args, **kwargs):
+        if zstandard is None:
+            raise ImportError('zstandard is required to use the zstd codec')
+        super(ZstdCodec, self).__init__(*args, **kwargs)
+
+    def compressor(self):
+        return zstandard.ZstdCompressor(level=self.level).compressobj()
+
+    def decompressor(self):
+        return zstandard.ZstdDecompressor().decompressobj()
+
+
+class Lz4Codec(BaseCodec):
+    name = 'lz4'
+    extension = '.lz4'
+    default_level = 0
+
+    def __init__(self, *args, **kwargs):
+        if lz4_frame is None:
+            raise ImportError('lz4 is required to use the lz4 codec')
+        super(Lz4Codec, self).__init__(*args, **kwargs)
+
+    def compressor(self):
+        return _Lz4Compressor(self.level)
+
+    def decompressor(self):
+        return lz4_frame.LZ4FrameDecompressor()
+
+
+class _Lz4Compressor(object):
+    '''
+    Adapt the lz4 frame compressor to the compress/flush interface
+    '''
+    def __init__(self, level):
+        self._compressor = lz4_frame.LZ4FrameCompressor(compression_level=level)
+        self._started = False
+
+    def _header(self):
+        if self._started:
+            return ''
+        self._started = True
+        return self._compressor.begin()
+
+    def compress(self, data):
+        header = self._header()
+        return header + self._compressor.compress(data)
+
+    def flush(self):
+        header = self._header()
+        return header + self._compressor.flush()
+
+
+class CompressedWriter(object):
+    '''
+    Write-only file-like object that compresses into `fileobj`.
+    `close` writes the end of the compressed stream but leaves the
+    underlying file open
+    '''
+    def __init__(self, fileobj, compressor):
+        self.fileobj = fileobj
+        self._compressor = compressor
+        self._closed = False
+
+    def write(self, data):
+        compressed = self._compressor.compress(data)
+        if compressed:
+            self.fileobj.write(compressed)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if not self._closed:
+            self.fileobj.write(self._compressor.flush())
+            self._closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class CompressedReader(ChunkedReader):
+    '''
+    Read-only file-like object that decompresses from `fileobj`.
+    Closing the reader closes the underlying file
+    '''
+    def __init__(self, fileobj, decompressor):
+        super(CompressedReader, self).__init__()
+        self.fileobj = fileobj
+        self._decompressor = decompressor
+
+    def _next_chunk(self):
+        block = self.fileobj.read(READ_BLOCK_SIZE)
+        if not block:
+            return None
+        return self._decompressor.decompress(block)
+
+    def close(self):
+        super(CompressedReader, self).close()
+        self.fileobj.close()
+
+
+CODECS = {
+    None: NoCompressionCodec,
+    'gzip': GzipCodec,
+    'zstd': ZstdCodec,
+    'lz4': Lz4Codec,
+}
+
+
+def get_codec(name=None, level=None):
+    '''
+    Codec instance by name
+
+    :param name: one of None, `gzip`, `zstd`, `lz4`
+    :param level: compression level, uses the codec default if None
+    '''
+    if name not in CODECS:
+        raise ValueError('Unsupported compression codec: {}. Choose from {}'.format(
+            name, sorted(i for i in CODECS if i is not None)))
+    return CODECS[name](level=level)
+
+
+def codec_from_filepaths(filepaths):
+    '''
+    Codec recorded in persistable filepaths (no compression if not recorded)
+    '''
+    settings = filepaths.get('compression') or {}
+    return get_codec(settings.get('codec'), settings.get('level'))
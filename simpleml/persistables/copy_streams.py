@@ -0,0 +1,444 @@
+'''
+File-like streams to feed dataframes into database `copy` commands without
+rendering the whole payload in memory first
+
+Also includes encoders/decoders for the PostgreSQL binary copy format
+(`COPY ... WITH (FORMAT binary)`), built directly from numpy column arrays
+'''
+
+__author__ = 'Elisha Yadgaran'
+
+
+from collections import OrderedDict
+from itertools import izip
+import Queue
+import struct
+import threading
+import numpy as np
+import pandas as pd
+
+from simpleml.persistables.streams import ChunkedReader
+
+
+# Number of dataframe rows serialized per chunk
+DEFAULT_CHUNKSIZE = 10000
+# Number of serialized chunks allowed to wait for the consumer
+DEFAULT_QUEUED_CHUNKS = 2
+
+# PostgreSQL binary copy framing
+PGCOPY_SIGNATURE = 'PGCOPY\n\xff\r\n\x00'
+PGCOPY_HEADER = PGCOPY_SIGNATURE + struct.pack('>ii', 0, 0)
+PGCOPY_TRAILER = struct.pack('>h', -1)
+NULL_FIELD = struct.pack('>i', -1)
+
+# Timestamps are sent as microseconds since the postgres epoch
+POSTGRES_EPOCH = np.datetime64('2000-01-01T00:00:00', 'us')
+
+# Fixed width wire types by postgres type oid (None for variable width text)
+BINARY_TYPE_OIDS = {
+    16: '?',  # boolean
+    20: '>i8',  # bigint
+    21: '>i2',  # smallint
+    23: '>i4',  # integer
+    700: '>f4',  # real
+    701: '>f8',  # double precision
+    1114: '>i8',  # timestamp
+    1184: '>i8',  # timestamp with time zone
+    25: None,  # text
+    1043: None,  # varchar
+}
+TIMESTAMP_OIDS = (1114, 1184)
+
+# In memory dtypes by postgres type oid for rows fetched through a cursor
+# (anything not listed is kept as python objects)
+CURSOR_TYPE_OIDS = {
+    16: np.bool_,
+    20: np.int64,
+    21: np.int16,
+    23: np.int32,
+    700: np.float32,
+    701: np.float64,
+    1700: np.float64,  # numeric, coerced like `pd.read_sql`
+    1114: 'datetime64[ns]',
+}
+
+
+class _StreamError(object):
+    '''
+    Container to hand an exception from the producer thread to the reader
+    '''
+    def __init__(self, error):
+        self.error = error
+
+
+class DataframeCopyStream(ChunkedReader):
+    '''
+    Read-only file-like object that serializes a dataframe in row chunks
+
+    Chunks are encoded on a background thread and passed to the reader
+    over a bounded queue, so encoding overlaps with the database write and
+    peak memory is limited to a few chunks regardless of dataframe size
+
+    Usage:
+        stream = DataframeCopyStream(df, encoder=lambda chunk: chunk.to_csv(...))
+        cursor.copy_from(stream, table)
+    '''
+    def __init__(self, df, encoder, chunksize=DEFAULT_CHUNKSIZE,
+                 max_queued_chunks=DEFAULT_QUEUED_CHUNKS, threaded=True,
+                 header='', footer=''):
+        '''
+        :param df: dataframe to stream
+        :param encoder: callable that takes a dataframe chunk and returns
+            the serialized bytes
+        :param chunksize: number of rows to encode at a time
+        :param max_queued_chunks: number of encoded chunks to buffer ahead
+            of the reader
+        :param threaded: whether to encode on a background thread or inline
+            on each read
+        :param header: bytes to emit before the first chunk
+        :param footer: bytes to emit after the last chunk
+        '''
+        self.df = df
+        self.encoder = encoder
+        self.chunksize = max(int(chunksize), 1)
+        self.header = header
+        self.footer = footer
+
+        super(DataframeCopyStream, self).__init__()
+        self._closed = threading.Event()
+
+        if threaded:
+            self._queue = Queue.Queue(maxsize=max(int(max_queued_chunks), 1))
+            self._thread = threading.Thread(target=self._produce)
+            self._thread.daemon = True
+            self._thread.start()
+        else:
+            self._thread = None
+            self._chunks = self._iter_chunks()
+
+    def _iter_chunks(self):
+        '''
+        Generator over the encoded chunks of the dataframe
+        '''
+        if self.header:
+            yield self.header
+
+        for start in xrange(0, len(self.df), self.chunksize):
+            chunk = self.encoder(self.df.iloc[start:start + self.chunksize])
+            if isinstance(chunk, unicode):
+                chunk = chunk.encode('utf8')
+            yield chunk
+
+        if self.footer:
+            yield self.footer
+
+    def _produce(self):
+        '''
+        Background thread target. Pushes encoded chunks onto the queue until
+        the dataframe is exhausted or the reader closes the stream
+        '''
+        try:
+            for chunk in self._iter_chunks():
+                if not self._put(chunk):
+                    return
+        except Exception as e:
+            self._put(_StreamError(e))
+            return
+
+        self._put(None)
+
+    def _put(self, item):
+        '''
+        Blocking put that gives up once the stream is closed
+        '''
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                continue
+        return False
+
+    def _next_chunk(self):
+        if self._thread is None:
+            return next(self._chunks, None)
+
+        item = self._queue.get()
+        if isinstance(item, _StreamError):
+            raise item.error
+        return item
+
+    def close(self):
+        '''
+        Stop the producer thread and release buffered chunks
+        '''
+        self._closed.set()
+        super(DataframeCopyStream, self).close()
+
+        if self._thread is not None:
+            self._thread.join()
+
+
+def _wire_dtype(series, oid=None):
+    '''
+    Binary wire type for a dataframe column. Uses the destination column
+    type when its postgres `oid` is known, otherwise mirrors the column
+    types pandas assigns in `DataFrame.to_sql`. Integer (and float into
+    integer) columns are checked to fit the wire type without loss.
+    Returns None for variable width (text) columns
+    '''
+    if oid is None:
+        wire_dtype = _default_wire_dtype(series)
+    elif oid in BINARY_TYPE_OIDS:
+        wire_dtype = BINARY_TYPE_OIDS[oid]
+    else:
+        raise TypeError('Binary copy does not support postgres type {} for column {}'.format(
+            oid, series.name))
+
+    if wire_dtype is not None and np.dtype(wire_dtype).kind == 'i' and series.dtype.kind == 'f':
+        values = series.values
+        if not np.isfinite(values).all():
+            raise ValueError('Column {} has NaN or infinite values, which {} cannot represent'.format(
+                series.name, np.dtype(wire_dtype).name))
+        if (values != np.trunc(values)).any():
+            raise ValueError('Column {} has non integral values, which {} cannot represent'.format(
+                series.name, np.dtype(wire_dtype).name))
+
+    if wire_dtype is not None and series.dtype.kind in 'iuf' and np.dtype(wire_dtype).kind == 'i' \
+            and len(series):
+        info = np.iinfo(wire_dtype)
+        # Compare as python ints, numpy promotes uint64 against int64 to float
+        if int(series.min()) < info.min or int(series.max()) > info.max:
+            raise ValueError('Column {} has values outside the range of {}'.format(
+                series.name, np.dtype(wire_dtype).name))
+
+    return wire_dtype
+
+
+def _default_wire_dtype(series):
+    '''
+    Wire type matching the sql type pandas creates for a column dtype
+    '''
+    dtype = series.dtype
+    if dtype.kind == 'f':
+        return '>f4' if dtype == np.float32 else '>f8'
+    if dtype.kind in 'iu':
+        if dtype in (np.int8, np.uint8, np.int16):
+            return '>i2'
+        if dtype in (np.uint16, np.int32):
+            return '>i4'
+        return '>i8'
+    if dtype.kind == 'b':
+        return '?'
+    if dtype.kind == 'M' or pd.api.types.is_datetime64_any_dtype(dtype):
+        return '>i8'
+    if dtype.kind == 'O':
+        inferred = pd.api.types.infer_dtype(series, skipna=True)
+        if inferred in ('string', 'unicode', 'bytes', 'empty'):
+            return None
+
+    raise TypeError(
+        'Binary copy does not support column {} with dtype {}, use the csv format instead'.format(
+            series.name, dtype))
+
+
+def _wire_values(series, wire_dtype):
+    '''
+    Numpy array of the column values in wire representation
+    '''
+    if series.dtype.kind == 'M' or pd.api.types.is_datetime64_any_dtype(series.dtype):
+        values = pd.DatetimeIndex(series)
+        if values.tz is not None:
+            # Tz aware columns are stored (and sent) in UTC
+            values = values.tz_convert('UTC').tz_localize(None)
+        micros = (values.values.astype('datetime64[us]') - POSTGRES_EPOCH).astype(np.int64)
+        return micros.astype(wire_dtype)
+
+    return series.values.astype(wire_dtype)
+
+
+def _encode_fields(series, wire_dtype):
+    '''
+    List of encoded (length prefixed) fields, one per row
+    '''
+    if wire_dtype is None:
+        fields = []
+        for value in series.values:
+            if value is None or (isinstance(value, float) and np.isnan(value)):
+                fields.append(NULL_FIELD)
+                continue
+            if isinstance(value, unicode):
+                value = value.encode('utf8')
+            fields.append(struct.pack('>i', len(value)) + value)
+        return fields
+
+    itemsize = np.dtype(wire_dtype).itemsize
+    encoded = np.empty(len(series), dtype=[('length', '>i4'), ('value', wire_dtype)])
+    encoded['length'] = itemsize
+    encoded['value'] = _wire_values(series, wire_dtype)
+    buf = encoded.tobytes()
+    step = 4 + itemsize
+    fields = [buf[i:i + step] for i in xrange(0, len(buf), step)]
+
+    nulls = series.isnull().values
+    if nulls.any():
+        for i in np.flatnonzero(nulls):
+            fields[i] = NULL_FIELD
+
+    return fields
+
+
+def encode_binary_chunk(df, type_oids=None):
+    '''
+    Encode dataframe rows in the postgres binary copy tuple format (without
+    the file header and trailer)
+
+    Values are cast to the destination column types when `type_oids` (in
+    column order) are given, otherwise to the types pandas would create
+
+    Frames made up only of fixed width columns without nulls are encoded
+    in one vectorized pass as a packed numpy record array. Text columns
+    or missing values fall back to per row assembly.
+    NaN in float columns is sent as the float NaN value, not NULL
+    '''
+    columns = [df.iloc[:, i] for i in xrange(df.shape[1])]
+    type_oids = type_oids or [None] * len(columns)
+    wire_dtypes = [_wire_dtype(column, oid) for column, oid in zip(columns, type_oids)]
+
+    fixed_width = all(wire_dtype is not None for wire_dtype in wire_dtypes) and \
+        not any(column.dtype.kind != 'f' and column.isnull().values.any() for column in columns)
+
+    if fixed_width:
+        record_dtype = [('count', '>i2')]
+        for i, wire_dtype in enumerate(wire_dtypes):
+            record_dtype.extend([('length_{}'.format(i), '>i4'), ('value_{}'.format(i), wire_dtype)])
+
+        records = np.empty(len(df), dtype=record_dtype)
+        records['count'] = len(columns)
+        for i, (column, wire_dtype) in enumerate(zip(columns, wire_dtypes)):
+            records['length_{}'.format(i)] = np.dtype(wire_dtype).itemsize
+            records['value_{}'.format(i)] = _wire_values(column, wire_dtype)
+
+        return records.tobytes()
+
+    count = struct.pack('>h', len(columns))
+    fields = [_encode_fields(column, wire_dtype) for column, wire_dtype in zip(columns, wire_dtypes)]
+    output = []
+    for row in izip(*fields):
+        output.append(count)
+        output.extend(row)
+
+    return ''.join(output)
+
+
+def _decode_column(raw, oid):
+    '''
+    Convert a list of raw field bytes (None for NULL) into a numpy array
+    '''
+    wire_dtype = BINARY_TYPE_OIDS[oid]
+    if wire_dtype is None:
+        return np.array([None if value is None else value.decode('utf8') for value in raw], dtype=object)
+
+    nulls = np.array([value is None for value in raw], dtype=bool)
+    values = np.frombuffer(''.join(value for value in raw if value is not None), dtype=wire_dtype)
+
+    if not nulls.any():
+        return _native_column(values, oid)
+
+    values = _native_column(values, oid)
+    if oid in TIMESTAMP_OIDS:
+        output = np.empty(len(raw), dtype='datetime64[ns]')
+        output[nulls] = np.datetime64('NaT')
+    elif values.dtype.kind == 'b':
+        output = np.empty(len(raw), dtype=object)
+        output[nulls] = None
+    else:
+        # Match pandas sql behavior of upcasting integers with nulls to floats
+        output = np.empty(len(raw), dtype=np.float64)
+        output[nulls] = np.nan
+    output[~nulls] = values
+
+    return output
+
+
+def _native_column(values, oid):
+    '''
+    Convert wire values into native byte order numpy values
+    '''
+    if oid in TIMESTAMP_OIDS:
+        return (POSTGRES_EPOCH + values.astype(np.int64).astype('timedelta64[us]')).astype('datetime64[ns]')
+
+    return values.astype(values.dtype.newbyteorder('='))
+
+
+def _to_frame(columns, column_names, type_oids):
+    '''
+    Assemble decoded column arrays into a dataframe
+    '''
+    df = pd.DataFrame(OrderedDict(zip(column_names, columns)), columns=column_names)
+    for name, oid in zip(column_names, type_oids):
+        if oid == 1184:
+            df[name] = df[name].dt.tz_localize('UTC')
+
+    return df
+
+
+def decode_binary_copy(payload, column_names, type_oids):
+    '''
+    Decode a full postgres binary copy payload into a dataframe
+
+    :param payload: bytes returned by `COPY ... TO STDOUT WITH (FORMAT binary)`
+    :param column_names: list of column names in table order
+    :param type_oids: list of postgres type oids in table order
+    '''
+    unsupported = [oid for oid in type_oids if oid not in BINARY_TYPE_OIDS]
+    if unsupported:
+        raise TypeError('Binary copy does not support postgres types: {}'.format(unsupported))
+
+    if not payload.startswith(PGCOPY_SIGNATURE):
+        raise ValueError('Payload is not in postgres binary copy format')
+
+    extension_length = struct.unpack_from('>i', payload, len(PGCOPY_SIGNATURE) + 4)[0]
+    offset = len(PGCOPY_SIGNATURE) + 8 + extension_length
+    end = len(payload) - len(PGCOPY_TRAILER)
+
+    wire_dtypes = [BINARY_TYPE_OIDS[oid] for oid in type_oids]
+
+    # Fast path: fixed width rows without nulls can be viewed as one record array
+    if all(wire_dtype is not None for wire_dtype in wire_dtypes):
+        record_dtype = [('count', '>i2')]
+        for i, wire_dtype in enumerate(wire_dtypes):
+            record_dtype.extend([('length_{}'.format(i), '>i4'), ('value_{}'.format(i), wire_dtype)])
+        record_dtype = np.dtype(record_dtype)
+
+        if (end - offset) % record_dtype.itemsize == 0:
+            records = np.frombuffer(payload, dtype=record_dtype,
+                                    count=(end - offset) // record_dtype.itemsize, offset=offset)
+            if (records['count'] == len(wire_dtypes)).all() and all(
+                    (records['length_{}'.format(i)] == np.dtype(wire_dtype).itemsize).all()
+                    for i, wire_dtype in enumerate(wire_dtypes)):
+                return _to_frame([
+                    _native_column(records['value_{}'.format(i)], oid) for i, oid in enumerate(type_oids)
+                ], column_names, type_oids)
+
+    # Row by row parse
+    raw_columns = [[] for _ in column_names]
+    unpack_from = struct.unpack_from
+    while offset < end:
+        count = unpack_from('>h', payload, offset)[0]
+        offset += 2
+        if count == -1:
+            break
+
+        for i in xrange(count):
+            length = unpack_from('>i', payload, offset)[0]
+            offset += 4
+            if length == -1:
+                raw_columns[i].append(None)
+                continue
+            raw_columns[i].append(payload[offset:offset + length])
+            offset += length
+
+    return _to_frame([
+        _decode_column(raw, oid) for raw, oid in zip(raw_columns, type_oids)
+    ], column_names, type_oids)
@@ -16,10 +16,13 @@ RAW_DATASET_SCHEMA = 'RAW_DATASETS'
 class DatasetStorage(BaseSQLAlchemy):
     __abstract__ = True
     metadata = MetaData(schema=DATASET_SCHEMA)
-    event.listen(metadata, 'before_create', DDL('''CREATE SCHEMA IF NOT EXISTS "{}";'''.format(DATASET_SCHEMA)))
+    # Postgres only, other backends map schemas to attached databases
+    event.listen(metadata, 'before_create',
+                 DDL('''CREATE SCHEMA IF NOT EXISTS "{}";'''.format(DATASET_SCHEMA)).execute_if(dialect='postgresql'))
 
 
 class RawDatasetStorage(BaseSQLAlchemy):
     __abstract__ = True
     metadata = MetaData(schema=RAW_DATASET_SCHEMA)
-    event.listen(metadata, 'before_create', DDL('''CREATE SCHEMA IF NOT EXISTS "{}";'''.format(RAW_DATASET_SCHEMA)))
+    event.listen(metadata, 'before_create',
+                 DDL('''CREATE SCHEMA IF NOT EXISTS "{}";'''.format(RAW_DATASET_SCHEMA)).execute_if(dialect='postgresql'))
@@ -0,0 +1,126 @@
+'''
+Delta encoding of a dataframe relative to a parent dataframe
+
+Rows are matched by a hash of their values and index. A delta holds the
+rows not found in the parent plus a run length encoding of the new row
+order, where each run is a contiguous range of either parent rows or added
+rows. Parent rows not referenced by any run are the removed rows
+
+Appending rows to (or deleting a range from) a frame encodes as a couple
+of runs, so the delta is proportional to the change
+'''
+
+__author__ = 'Elisha Yadgaran'
+
+
+import numpy as np
+import pandas as pd
+
+
+# Run kinds
+PARENT_RUN = 0
+ADDED_RUN = 1
+
+
+def row_hashes(df):
+    '''
+    uint64 hash per row of values and index
+    '''
+    return pd.util.hash_pandas_object(df, index=True).values
+
+
+def _occurrence(hashes):
+    '''
+    Occurrence number of each hash (0 for the first time it is seen), so
+    duplicate rows are matched one to one
+    '''
+    return pd.Series(hashes).groupby(hashes).cumcount().values
+
+
+def encode_delta(parent, df):
+    '''
+    Encode df relative to parent. Returns (added, runs) where added is the
+    dataframe of new rows and runs an (n, 3) int64 array of
+    (kind, start, length) in terms of parent or added row positions
+    '''
+    return encode_delta_from_hashes(row_hashes(parent), df, row_hashes(df))
+
+
+def encode_delta_from_hashes(parent_hashes, df, hashes):
+    '''
+    Same as `encode_delta` with the row hashes already computed, so the
+    parent dataframe itself is not needed
+    '''
+    parent_keys = pd.DataFrame({'hash': parent_hashes, 'occurrence': _occurrence(parent_hashes),
+                                'parent_position': np.arange(len(parent_hashes), dtype=np.int64)})
+    keys = pd.DataFrame({'hash': hashes, 'occurrence': _occurrence(hashes)})
+    # Left merge keeps the row order of df
+    source = keys.merge(parent_keys, on=['hash', 'occurrence'], how='left')['parent_position']
+    source = source.fillna(-1).values.astype(np.int64)
+
+    is_added = source < 0
+    added = df.iloc[np.flatnonzero(is_added)]
+    if not len(source):
+        return added, np.empty((0, 3), dtype=np.int64)
+
+    # A row continues the previous run if both are added rows, or both
+    # are parent rows at consecutive positions
+    continues = np.r_[False, (is_added[1:] & is_added[:-1]) |
+                      (~is_added[1:] & ~is_added[:-1] & (source[1:] == source[:-1] + 1))]
+    starts = np.flatnonzero(~continues)
+    lengths = np.diff(np.r_[starts, len(source)])
+    added_positions = np.cumsum(is_added) - 1
+    run_starts = np.where(is_added[starts], added_positions[starts], source[starts])
+    kinds = np.where(is_added[starts], ADDED_RUN, PARENT_RUN)
+
+    return added, np.column_stack([kinds, run_starts, lengths]).astype(np.int64)
+
+
+def apply_delta(parent, added, runs):
+    '''
+    Reconstruct a dataframe from its parent and delta
+    '''
+    if not len(runs):
+        return pd.concat([parent, added]).iloc[:0]
+
+    offsets = np.where(runs[:, 0] == ADDED_RUN, len(parent), 0)
+    positions = np.concatenate([np.arange(start, start + length) + offset
+                                for (_, start, length), offset in zip(runs, offsets)])
+    return pd.concat([parent, added]).iloc[positions]
+
+
+def removed_count(parent, runs):
+    '''
+    Number of parent rows (or parent row hashes) not carried over by the delta
+    '''
+    return len(parent) - int(runs[runs[:, 0] == PARENT_RUN, 2].sum())
+
+
+def schema_signature(df):
+    '''
+    JSON serializable columns, dtypes and index layout. Deltas are only
+    encoded between frames with the same signature
+    '''
+    return {'columns': [[repr(column), str(dtype)] for column, dtype in df.dtypes.iteritems()],
+            'index': [str(df.index.dtype)] + [repr(name) for name in df.index.names]}
+
+
+def hashes_string_forms(df):
+    '''
+    Whether row hashes are computed from the string form of some values
+    (object columns or index), so equal hashes do not imply equal values
+    '''
+    return df.index.dtype == object or (df.dtypes == object).any()
+
+
+def frames_identical(left, right):
+    '''
+    Exact equality of values, dtypes, columns and index
+    '''
+    return (left.shape == right.shape and
+            left.columns.equals(right.columns) and
+            left.index.equals(right.index) and
+            list(left.index.names) == list(right.index.names) and
+            left.index.dtype == right.index.dtype and
+            (left.dtypes == right.dtypes).all() and
+            left.equals(right))
@@ -0,0 +1,154 @@
+'''
+Process-wide cache of deserialized external files
+
+Persistables are immutable once saved, so the loaded `_external_file` of
+an id can be shared by every object loaded with that id. Entries are
+evicted least recently used first to stay within a byte budget.
+
+Note: cached objects are shared, not copied. Mutating a loaded external
+in place mutates it for every holder
+'''
+
+__author__ = 'Elisha Yadgaran'
+
+
+from collections import OrderedDict
+import numpy as np
+import os
+import pandas as pd
+import sys
+import threading
+
+# Optional dependency
+try:
+    import scipy.sparse as sparse
+except ImportError:
+    sparse = None
+
+
+# Byte budget of the process-wide cache (0 disables caching)
+DEFAULT_EXTERNAL_CACHE_BYTES = int(os.getenv('SIMPLEML_EXTERNAL_CACHE_BYTES', 512 * 2 ** 20))
+
+
+def estimate_size(obj, _seen=None):
+    '''
+    Approximate in-memory size (bytes) of a deserialized external.
+    Counts array buffers and walks containers and object state
+    '''
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        memory = obj.memory_usage(deep=True)
+        return int(memory.sum() if isinstance(obj, pd.DataFrame) else memory)
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.hasobject:
+            return obj.nbytes + sum(estimate_size(i, _seen) for i in obj.flat)
+        return obj.nbytes
+    if sparse is not None and sparse.issparse(obj):
+        return sum(estimate_size(getattr(obj, i), _seen) for i in ('data', 'indices', 'indptr', 'row', 'col')
+                   if hasattr(obj, i))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (basestring, int, long, float, bool, type(None))):
+        return size
+    if isinstance(obj, dict):
+        return size + sum(estimate_size(k, _seen) + estimate_size(v, _seen) for k, v in obj.iteritems())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return size + sum(estimate_size(i, _seen) for i in obj)
+    if hasattr(obj, '__dict__'):
+        return size + estimate_size(obj.__dict__, _seen)
+    if hasattr(obj, '__getstate__'):
+        # Extension types (eg sklearn trees) expose their buffers as state
+        try:
+            return size + estimate_size(obj.__getstate__(), _seen)
+        except Exception:
+            pass
+    return size
+
+
+class ExternalFileCache(object):
+    '''
+    Thread safe LRU cache keyed by persistable id with a byte budget and
+    hit/miss counters
+    '''
+    def __init__(self, max_bytes=DEFAULT_EXTERNAL_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def get(self, key):
+        '''
+        Returns (True, value) on a hit and (False, None) on a miss
+        '''
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return False, None
+
+            value, size = self._entries.pop(key)
+            # Reinsert as most recently used
+            self._entries[key] = (value, size)
+            self.hits += 1
+            return True, value
+
+    def put(self, key, value, size=None):
+        '''
+        Cache value, evicting least recently used entries to stay within
+        budget. Values larger than the budget are not cached
+        '''
+        if not self.enabled:
+            return False
+
+        if size is None:
+            size = estimate_size(value)
+
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return False
+
+            while self._entries and self._bytes + size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+            self._entries[key] = (value, size)
+            self._bytes += size
+            return True
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+EXTERNAL_FILE_CACHE = ExternalFileCache()
@@ -0,0 +1,314 @@
+'''
+Content addressed (deduplicated) filestore for external files
+
+Files are keyed by a strong digest of their serialized bytes, so saving
+content that already exists in the store only adds a reference and disk
+usage scales with the number of unique artifacts instead of versions.
+
+Layout (relative to the store root):
+    ab/abcdef0123...[.zst]       file content, named by the sha256 digest of
+                                 the serialized (uncompressed) bytes and
+                                 the compression codec extension
+    ab/abcdef0123...[.zst].refs  number of persistables referencing the content
+
+Also holds the size capped local disk cache used as a read-through tier
+in front of database stored artifacts
+'''
+
+__author__ = 'Elisha Yadgaran'
+
+
+import errno
+import fcntl
+import hashlib
+import os
+import tempfile
+from os.path import join, exists, dirname
+
+from simpleml.persistables.compression import get_codec
+from simpleml.utils.system_path import ensure_directory
+
+
+# Byte budget of the local cache of database artifacts (0 disables it)
+DEFAULT_DISK_CACHE_BYTES = int(os.getenv('SIMPLEML_DISK_CACHE_BYTES', 5 * 2 ** 30))
+
+
+def atomic_write(path, writer):
+    '''
+    Write the bytes produced by `writer` through a temporary file in the
+    same directory and rename it into place, so readers never see a
+    partial file
+
+    :param writer: callable that takes a file-like object and writes
+        the content into it
+    '''
+    handle, tmp_path = tempfile.mkstemp(dir=ensure_directory(dirname(path)), prefix='.tmp-')
+    try:
+        with os.fdopen(handle, 'wb') as tmp_file:
+            writer(tmp_file)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.rename(tmp_path, path)
+    except Exception:
+        if exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class HashingWriter(object):
+    '''
+    Write-only file-like object that digests everything written to it
+    and optionally tees the bytes into another file object
+    '''
+    def __init__(self, algorithm='sha256', fileobj=None):
+        self._hash = hashlib.new(algorithm)
+        self.fileobj = fileobj
+        self.size = 0
+
+    def write(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+        if self.fileobj is not None:
+            self.fileobj.write(data)
+
+    def flush(self):
+        if self.fileobj is not None:
+            self.fileobj.flush()
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+
+class ContentAddressedFilestore(object):
+    '''
+    Filestore that names files by the digest of their content and keeps
+    a reference count per unique file
+
+    Usage:
+        store = ContentAddressedFilestore('/path/to/root')
+        path = store.put(lambda f: pickle.dump(obj, f))
+        with store.open(path) as f:
+            obj = pickle.load(f)
+    '''
+    def __init__(self, root, algorithm='sha256'):
+        self.root = root
+        self.algorithm = algorithm
+
+    def relative_path(self, digest, codec):
+        return join(digest[:2], digest + codec.extension)
+
+    def absolute_path(self, path):
+        return join(self.root, path)
+
+    def exists(self, path):
+        return exists(self.absolute_path(path))
+
+    def digest(self, writer):
+        '''
+        Digest the bytes produced by `writer` without writing them anywhere
+
+        :param writer: callable that takes a file-like object and writes
+            the serialized content into it
+        '''
+        hashing_writer = HashingWriter(self.algorithm)
+        writer(hashing_writer)
+        return hashing_writer.hexdigest()
+
+    def put(self, writer, codec=None):
+        '''
+        Store the bytes produced by `writer` and add a reference to them.
+        Returns the path of the content relative to the store root
+
+        The content is serialized once, into a temporary file digested while
+        it is written. The file is renamed to its digest path, or discarded
+        if that content is already stored
+
+        :param writer: callable that takes a file-like object and writes
+            the serialized content into it
+        :param codec: compression codec (`simpleml.persistables.compression`)
+            to store the content with, defaults to no compression
+        '''
+        if codec is None:
+            codec = get_codec()
+
+        ensure_directory(self.root)
+        handle, tmp_path = tempfile.mkstemp(dir=self.root, prefix='.tmp-')
+        try:
+            with os.fdopen(handle, 'wb') as tmp_file:
+                with codec.writer(tmp_file) as compressed_file:
+                    hashing_writer = HashingWriter(self.algorithm, fileobj=compressed_file)
+                    writer(hashing_writer)
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+            path = self.relative_path(hashing_writer.hexdigest(), codec)
+
+            # Reference first so a concurrent release cannot delete the content
+            # between the existence check and the return
+            self.add_reference(path)
+            try:
+                absolute_path = self.absolute_path(path)
+                if not exists(absolute_path):
+                    ensure_directory(dirname(absolute_path))
+                    os.rename(tmp_path, absolute_path)
+            except Exception:
+                self.release(path)
+                raise
+        finally:
+            if exists(tmp_path):
+                os.remove(tmp_path)
+
+        return path
+
+    def open(self, path, codec=None):
+        '''
+        Open the content at path for reading, decompressing with codec
+        '''
+        if codec is None:
+            codec = get_codec()
+        return codec.reader(open(self.absolute_path(path), 'rb'))
+
+    def references(self, path):
+        '''
+        Number of persistables referencing the content at path
+        '''
+        return self._update_references(path, 0)
+
+    def add_reference(self, path):
+        return self._update_references(path, 1)
+
+    def release(self, path):
+        '''
+        Remove a reference to the content at path. The file is deleted
+        once nothing references it anymore
+        '''
+        return self._update_references(path, -1)
+
+    def _references_path(self, path):
+        return self.absolute_path(path) + '.refs'
+
+    def _update_references(self, path, increment):
+        '''
+        Atomically read and update the reference count (deleting the content
+        when it drops to zero). Uses an exclusive file lock so concurrent
+        processes on the same host stay consistent
+        '''
+        references_path = self._references_path(path)
+        ensure_directory(dirname(references_path))
+
+        with open(references_path, 'a+') as references_file:
+            fcntl.flock(references_file, fcntl.LOCK_EX)
+            try:
+                references_file.seek(0)
+                content = references_file.read().strip()
+                count = max(int(content or 0) + increment, 0)
+                if increment:
+                    references_file.seek(0)
+                    references_file.truncate()
+                    references_file.write(str(count))
+                    references_file.flush()
+
+                if count == 0 and increment < 0 and self.exists(path):
+                    os.remove(self.absolute_path(path))
+            finally:
+                fcntl.flock(references_file, fcntl.LOCK_UN)
+
+        return count
+
+
+class LocalDiskCache(object):
+    '''
+    Size capped read-through cache of immutable artifacts on local disk.
+    Keys must change whenever the content could (eg persistable id + hash),
+    entries are never updated in place
+
+    Files are written to a temporary name and atomically renamed, so
+    concurrent processes only ever see complete entries. Reads refresh the
+    file mtime and the least recently used entries are evicted after each
+    write to stay within `max_bytes`
+    '''
+    def __init__(self, root, max_bytes=DEFAULT_DISK_CACHE_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def absolute_path(self, key):
+        return join(self.root, key)
+
+    def open(self, key):
+        '''
+        Open the cached file for key, returns None on a miss
+        '''
+        if not self.enabled:
+            return None
+
+        path = self.absolute_path(key)
+        try:
+            cached_file = open(path, 'rb')
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+
+        try:
+            os.utime(path, None)
+        except OSError:
+            # Evicted concurrently, the open handle stays readable
+            pass
+        return cached_file
+
+    def put(self, key, writer):
+        '''
+        Cache the bytes produced by `writer` under key. Content larger
+        than the whole budget is discarded instead of evicting every entry
+
+        :param writer: callable that takes a file-like object and writes
+            the content into it
+        '''
+        if not self.enabled:
+            return False
+
+        ensure_directory(self.root)
+        handle, tmp_path = tempfile.mkstemp(dir=self.root, prefix='.tmp-')
+        try:
+            with os.fdopen(handle, 'wb') as tmp_file:
+                writer(tmp_file)
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+            if os.path.getsize(tmp_path) > self.max_bytes:
+                os.remove(tmp_path)
+                return False
+            os.rename(tmp_path, self.absolute_path(key))
+        except Exception:
+            if exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self.evict()
+        return True
+
+    def evict(self):
+        '''
+        Delete least recently used entries until the cache fits its budget
+        '''
+        entries = []
+        for filename in os.listdir(self.root):
+            if filename.startswith('.tmp-'):
+                continue
+            try:
+                stat = os.stat(join(self.root, filename))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, filename))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, filename in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(join(self.root, filename))
+            except OSError:
+                pass
+            total -= size
@@ -0,0 +1,112 @@
+'''
+Persistent memoization of dataset hashes
+
+Hashing a dataset requires building its dataframe. When a dataset can
+describe where its data comes from (file paths with size and mtime, or a
+query with a watermark of the underlying tables), the computed `hash_` is
+stored under that source identity in a local sqlite database. As long as
+the source is unchanged, the hash is returned without rebuilding the data.
+
+Entries are never stale by construction: a changed source (or a changed
+`build_dataframe` definition) produces a different key. Clear the cache if
+a source can change without changing its identity (eg a table without a
+reliable watermark), or after changing code `build_dataframe` calls into
+'''
+
+__author__ = 'Elisha Yadgaran'
+
+
+from simpleml.utils.system_path import FINGERPRINT_CACHE_PATH, ensure_directory
+from simpleml.persistables.hashing import Hasher
+import os
+import sqlite3
+import time
+
+
+def file_source_identity(*paths):
+    '''
+    Identity of file sources: absolute path, size and modification time
+    of each file
+    '''
+    identity = []
+    for path in paths:
+        stat = os.stat(path)
+        identity.append((os.path.abspath(path), stat.st_size, repr(stat.st_mtime)))
+    return ('files', identity)
+
+
+def query_source_identity(query, watermark):
+    '''
+    Identity of a SQL source: the query and a watermark that changes
+    whenever the queried tables change (eg `max(updated_at)`, a sequence
+    value or row count, queried by the caller)
+    '''
+    return ('query', query, str(watermark))
+
+
+def fingerprint_key(*components):
+    '''
+    Cache key for a combination of class, config and source identity
+    '''
+    return Hasher().update(components).hexdigest()
+
+
+class FingerprintCache(object):
+    '''
+    sqlite backed map of source key -> hash_. A connection is opened per
+    operation so the cache is safe to share between threads and processes
+    '''
+    def __init__(self, path=FINGERPRINT_CACHE_PATH):
+        self.path = path
+        self._initialized = False
+
+    def _connect(self):
+        if not self._initialized:
+            ensure_directory(os.path.dirname(os.path.abspath(self.path)))
+        connection = sqlite3.connect(self.path, timeout=30)
+        if not self._initialized:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS fingerprints '
+                               '(key TEXT PRIMARY KEY, hash INTEGER NOT NULL, created REAL NOT NULL)')
+            connection.commit()
+            self._initialized = True
+        return connection
+
+    def get(self, key):
+        '''
+        Memoized hash for key or None
+        '''
+        connection = self._connect()
+        try:
+            row = connection.execute('SELECT hash FROM fingerprints WHERE key = ?', (key,)).fetchone()
+        finally:
+            connection.close()
+        return None if row is None else row[0]
+
+    def put(self, key, hash_):
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute('INSERT OR REPLACE INTO fingerprints (key, hash, created) VALUES (?, ?, ?)',
+                                   (key, hash_, time.time()))
+        finally:
+            connection.close()
+
+    def invalidate(self, key):
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute('DELETE FROM fingerprints WHERE key = ?', (key,))
+        finally:
+            connection.close()
+
+    def clear(self):
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute('DELETE FROM fingerprints')
+        finally:
+            connection.close()
+
+
+FINGERPRINT_CACHE = FingerprintCache()
@@ -1,14 +1,337 @@
 '''
 Mixin classes to handle hashing
+
+Hashes are computed with a streaming blake2b hasher over a type tagged,
+length prefixed encoding of the object, so they are identical across
+processes, hosts and python versions (unlike the builtin `hash`, which is
+salted per process for strings on Python 3)
 '''
 
 __author__ = 'Elisha Yadgaran'
 
 
-import copy
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from multiprocessing import cpu_count
+import datetime
+import numpy as np
+import os
+import struct
+import types
 import pandas as pd
 from pandas.util import hash_pandas_object
 
+# Optional dependency
+try:
+    import scipy.sparse as sparse
+except ImportError:
+    sparse = None
+
+# blake2 is in hashlib from python 3.6, use the backport before that
+try:
+    from hashlib import blake2b
+except ImportError:
+    try:
+        from pyblake2 import blake2b
+    except ImportError:
+        blake2b = None
+
+
+DIGEST_SIZE = 16
+
+# Rows per dataframe block. Part of the hash definition: changing it
+# changes every dataframe hash, so it is not configurable per environment
+# (only the explicit `block_rows` arguments, for tests)
+DEFAULT_BLOCK_ROWS = 2 ** 18
+# Threads hashing dataframe blocks
+DEFAULT_HASH_WORKERS = int(os.getenv('SIMPLEML_HASH_WORKERS', cpu_count()))
+
+# Length prefix packer
+_LENGTH = struct.Struct('<Q')
+
+# Exact scalar types encoded without the isinstance chain (hot path for configs)
+_SCALAR_ENCODERS = {
+    type(None): lambda obj: ('N', ''),
+    bool: lambda obj: ('B', '1' if obj else '0'),
+    int: lambda obj: ('I', str(obj)),
+    long: lambda obj: ('I', str(obj)),
+    float: lambda obj: ('F', repr(obj)),
+    str: lambda obj: ('S', obj),
+    unicode: lambda obj: ('S', obj.encode('utf8')),
+}
+
+
+def _column_bytes(values, start, stop):
+    '''
+    Hashable buffer for rows [start, stop) of a column
+    '''
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'biufcmM':
+        # Fixed width buffers are hashed as is
+        return np.ascontiguousarray(values[start:stop]).view(np.uint8)
+    return hash_pandas_object(pd.Series(values[start:stop]), index=False).values
+
+
+def _block_digest(columns, start, stop):
+    block_hash = blake2b(digest_size=DIGEST_SIZE)
+    for values in columns:
+        block_hash.update(_column_bytes(values, start, stop))
+    return block_hash.digest()
+
+
+def dataframe_block_digests(df, block_rows=DEFAULT_BLOCK_ROWS, workers=DEFAULT_HASH_WORKERS):
+    '''
+    Digest of each block of `block_rows` rows (all columns, index excluded),
+    in row order. Blocks are hashed in a thread pool; numeric buffers and
+    blake2b release the GIL, object columns are hashed under it
+
+    Comparing the digests of two versions of a frame identifies the changed
+    row ranges (see `changed_blocks`)
+    '''
+    if blake2b is None:
+        raise ImportError('pyblake2 is required for hashing on python < 3.6')
+
+    columns = [column.values for _, column in df.iteritems()]
+    starts = range(0, len(df), block_rows)
+    if workers <= 1 or len(starts) <= 1:
+        return [_block_digest(columns, start, start + block_rows) for start in starts]
+
+    executor = ThreadPoolExecutor(max_workers=min(workers, len(starts)))
+    try:
+        return list(executor.map(lambda start: _block_digest(columns, start, start + block_rows), starts))
+    finally:
+        executor.shutdown()
+
+
+def changed_blocks(digests, other_digests):
+    '''
+    Indices of blocks that differ between two lists of block digests
+    (blocks present in only one of them count as changed)
+    '''
+    return [i for i in xrange(max(len(digests), len(other_digests)))
+            if i >= len(digests) or i >= len(other_digests) or digests[i] != other_digests[i]]
+
+
+def dataframe_fingerprint(df, block_rows=DEFAULT_BLOCK_ROWS, workers=DEFAULT_HASH_WORKERS):
+    '''
+    Hex digest of a dataframe (shape, columns, dtypes and values), computed
+    from its block digests in parallel
+    '''
+    return Hasher(block_rows=block_rows, workers=workers).update(df).hexdigest()
+
+
+class Hasher(object):
+    '''
+    Streaming, process stable hasher for (nested) python and pandas objects
+
+    Every value is written as a type tag, the payload length and the payload
+    so different structures can not produce the same byte stream:
+        - None, booleans, integers (python and numpy), floats and text
+          (str and unicode are treated the same)
+        - lists and tuples, in order
+        - sets, frozensets and dicts, independent of iteration order
+        - numpy arrays by dtype, shape and (C ordered) buffer, object arrays
+          element by element
+        - scipy sparse matrices by format, shape and the data/indices/indptr
+          buffers in canonical form (formats other than CSR/CSC as CSR)
+        - pandas DataFrames by column names and dtypes then the ordered
+          digests of row blocks (see `dataframe_block_digests`), Series
+          over their hashed numpy buffer (index excluded)
+        - functions and classes by qualified name, code objects by bytecode
+        - other numpy scalars as 0-d arrays; complex, decimal and datetime
+          values by their repr
+        - other objects by class and attributes (`__dict__`, else
+          `__getstate__`). Anything else raises TypeError
+
+    Nothing is copied; containers are walked in place
+    '''
+    def __init__(self, custom_class_proxy=type(object.__dict__),
+                 block_rows=DEFAULT_BLOCK_ROWS, workers=DEFAULT_HASH_WORKERS, _active=None):
+        if blake2b is None:
+            raise ImportError('pyblake2 is required for hashing on python < 3.6')
+        self._hash = blake2b(digest_size=DIGEST_SIZE)
+        self.custom_class_proxy = custom_class_proxy
+        self.block_rows = block_rows
+        self.workers = workers
+        # Ids of the containers being walked, to stop at reference cycles
+        self._active = set() if _active is None else _active
+
+    def _child(self):
+        return Hasher(custom_class_proxy=self.custom_class_proxy, block_rows=self.block_rows,
+                      workers=self.workers, _active=self._active)
+
+    def _write(self, tag, payload=''):
+        self._hash.update(tag + _LENGTH.pack(len(payload)) + payload)
+
+    @staticmethod
+    def _encode_scalars(items):
+        '''
+        Encoded bytes of each item, or None if any is not a plain scalar
+        '''
+        encoded = []
+        for item in items:
+            encoder = _SCALAR_ENCODERS.get(type(item))
+            if encoder is None:
+                return None
+            tag, payload = encoder(item)
+            encoded.append(tag + _LENGTH.pack(len(payload)) + payload)
+        return encoded
+
+    def _write_unordered(self, tag, digests):
+        '''
+        Order independent encoding of a collection from its item digests
+        '''
+        self._write(tag, ''.join(sorted(digests)))
+
+    def update(self, obj):
+        '''
+        Feed obj into the hash, returns the hasher for chaining
+        '''
+        encoder = _SCALAR_ENCODERS.get(type(obj))
+        if encoder is not None:
+            self._write(*encoder(obj))
+            return self
+
+        if type(obj) == self.custom_class_proxy:
+            obj = dict((k, v) for k, v in obj.items() if not k.startswith('__'))
+
+        if id(obj) in self._active:
+            self._write('Z')
+            return self
+
+        self._active.add(id(obj))
+        try:
+            self._update(obj)
+        finally:
+            self._active.discard(id(obj))
+        return self
+
+    def _update(self, obj):
+        if obj is None:
+            self._write('N')
+
+        elif isinstance(obj, (bool, np.bool_)):
+            self._write('B', '1' if obj else '0')
+
+        elif isinstance(obj, (int, long, np.integer)):
+            self._write('I', str(int(obj)))
+
+        elif isinstance(obj, (float, np.floating)):
+            self._write('F', repr(float(obj)))
+
+        elif isinstance(obj, basestring):
+            self._write('S', obj.encode('utf8') if isinstance(obj, unicode) else obj)
+
+        elif isinstance(obj, (list, tuple)):
+            self._write('L', _LENGTH.pack(len(obj)))
+            for item in obj:
+                self.update(item)
+
+        elif isinstance(obj, (set, frozenset)):
+            encoded = self._encode_scalars(obj)
+            if encoded is not None:
+                # Plain scalars sort by their encoding, no per item digests
+                self._write('e', ''.join(sorted(encoded)))
+            else:
+                self._write_unordered('E', [self._child().update(item).digest() for item in obj])
+
+        elif isinstance(obj, dict):
+            keys = obj.keys()
+            encoded = self._encode_scalars(keys)
+            if encoded is not None:
+                # Scalar keys (the config case) are walked in encoded order
+                self._write('m', _LENGTH.pack(len(keys)))
+                for key_bytes, key in sorted(zip(encoded, keys), key=lambda i: i[0]):
+                    self._hash.update(key_bytes)
+                    self.update(obj[key])
+            else:
+                self._write_unordered('M', [self._child().update(k).update(v).digest()
+                                            for k, v in obj.iteritems()])
+
+        elif isinstance(obj, np.ndarray):
+            self._update_array(obj)
+
+        elif sparse is not None and sparse.issparse(obj):
+            self._update_sparse(obj)
+
+        elif isinstance(obj, pd.DataFrame):
+            self._update_dataframe(obj)
+
+        elif isinstance(obj, pd.Series):
+            self._write('R')
+            self._update_series(obj)
+
+        elif isinstance(obj, (types.FunctionType, types.BuiltinFunctionType, type, types.ClassType)):
+            self._write('C', '{}.{}'.format(obj.__module__, obj.__name__))
+
+        elif isinstance(obj, types.CodeType):
+            self._write('K', obj.co_code)
+            self.update(obj.co_consts)
+            self.update(obj.co_names)
+
+        elif isinstance(obj, np.generic):
+            # Remaining numpy scalars (datetime64, complex...) as 0-d arrays
+            self._update_array(np.asarray(obj))
+
+        elif isinstance(obj, (complex, datetime.date, datetime.time, datetime.timedelta, Decimal)):
+            # Value types with a constructor style repr (no memory address)
+            self._write('X', '{}:{!r}'.format(type(obj).__name__, obj))
+
+        elif hasattr(obj, '__dict__'):
+            self._write('O', '{}.{}'.format(type(obj).__module__, type(obj).__name__))
+            self.update(vars(obj))
+
+        elif hasattr(obj, '__getstate__'):
+            self._write('O', '{}.{}'.format(type(obj).__module__, type(obj).__name__))
+            self.update(obj.__getstate__())
+
+        else:
+            # A default repr embeds the memory address, so it is not stable
+            raise TypeError('Unable to hash object of type {}: define `__getstate__` or '
+                            'hash its pertinent attributes instead'.format(type(obj).__name__))
+
+    def _update_array(self, array):
+        self._write('A', '{}:{}'.format(array.dtype.str, array.shape))
+        if array.dtype.hasobject:
+            for item in array.flat:
+                self.update(item)
+        else:
+            self._hash.update(np.ascontiguousarray(array).view(np.uint8))
+
+    def _update_sparse(self, matrix):
+        if matrix.format not in ('csr', 'csc'):
+            matrix = matrix.tocsr()
+        if not matrix.has_canonical_format:
+            # Duplicate entries summed and indices sorted so equal matrices hash equal
+            matrix = matrix.copy()
+            matrix.sum_duplicates()
+        self._write('P', '{}:{}'.format(matrix.format, matrix.shape))
+        for array in (matrix.data, matrix.indices, matrix.indptr):
+            self._update_array(array)
+
+    def _update_series(self, series):
+        self.update(series.name)
+        self._write('T', str(series.dtype))
+        self._hash.update(_column_bytes(series.values, 0, len(series)))
+
+    def _update_dataframe(self, df):
+        self._write('D', _LENGTH.pack(df.shape[0]) + _LENGTH.pack(df.shape[1]))
+        for name, dtype in df.dtypes.iteritems():
+            self.update(name)
+            self._write('T', str(dtype))
+        self._write('V', ''.join(dataframe_block_digests(df, self.block_rows, self.workers)))
+
+    def digest(self):
+        return self._hash.digest()
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def intdigest(self):
+        '''
+        Signed 64 bit integer digest (fits a BigInteger column)
+        '''
+        return struct.unpack('<q', self.digest()[:8])[0]
+
 
 class CustomHasherMixin(object):
     '''
@@ -16,11 +339,10 @@ class CustomHasherMixin(object):
     '''
     def custom_hasher(self, object_to_hash, custom_class_proxy=type(object.__dict__)):
         """
-        Adapted from: https://stackoverflow.com/questions/5884066/hashing-a-dictionary
-        Makes a hash from a dictionary, list, tuple or set to any level, that
-        contains only other hashable types (including any lists, tuples, sets, and
-        dictionaries). In the case where other kinds of objects (like classes) need
-        to be hashed, pass in a collection of object attributes that are pertinent.
+        Process stable 64 bit hash of (nested) dictionaries, lists, tuples,
+        sets, pandas objects and plain python values (see `Hasher`). In the
+        case where other kinds of objects (like classes) need to be hashed,
+        pass in a collection of object attributes that are pertinent.
         For example, a class can be hashed in this fashion:
 
         custom_hasher([cls.__dict__, cls.__name__])
@@ -29,28 +351,4 @@ class CustomHasherMixin(object):
 
         custom_hasher([fn.__dict__, fn.__code__])
         """
-        if type(object_to_hash) == custom_class_proxy:
-            o2 = {}
-            for k, v in object_to_hash.items():
-                if not k.startswith("__"):
-                    o2[k] = v
-            object_to_hash = o2
-
-        if isinstance(object_to_hash, (set, tuple, list)):
-            return tuple([self.custom_hasher(e) for e in object_to_hash])
-
-        elif isinstance(object_to_hash, (pd.DataFrame, pd.Series)):
-            return hash_pandas_object(object_to_hash, index=False).sum()
-
-        elif object_to_hash is None:
-            # hash of None is unstable between systems
-            return -12345678987654321
-
-        elif not isinstance(object_to_hash, dict):
-            return hash(object_to_hash)
-
-        new_object_to_hash = copy.deepcopy(object_to_hash)
-        for k, v in new_object_to_hash.items():
-            new_object_to_hash[k] = self.custom_hasher(v)
-
-        return hash(tuple(frozenset(sorted(new_object_to_hash.items()))))
+        return Hasher(custom_class_proxy=custom_class_proxy).update(object_to_hash).intdigest()
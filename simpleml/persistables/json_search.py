@@ -0,0 +1,162 @@
+'''
+Compile parameter/metric predicates on JSON columns into SQL
+
+Predicates are dictionaries of `key` or `key__operator` to value, in the
+style of sqlalchemy-mixins filters:
+    {'criterion': 'gini', 'max_depth__gt': 10, 'n_estimators__in': [100, 200]}
+
+On postgres equality predicates on scalar values compile to JSONB
+containment (`@>`), which uses the GIN index on the column. Lists and
+dicts compare the whole value (containment would match supersets) and None
+matches null or missing keys, like on other backends. Comparisons compile to
+`CAST((column ->> 'key') AS FLOAT)`, which uses an expression index on the
+key if one exists (see `expression_index`). Other backends compile to
+their JSON extraction functions (unindexed)
+'''
+
+__author__ = 'Elisha Yadgaran'
+
+
+from sqlalchemy import DDL, event, cast, literal, func
+from sqlalchemy.dialects.postgresql import JSONB
+import json
+import numbers
+
+
+OPERATORS = {
+    'eq': lambda left, right: left == right,
+    'ne': lambda left, right: left != right,
+    'gt': lambda left, right: left > right,
+    'gte': lambda left, right: left >= right,
+    'lt': lambda left, right: left < right,
+    'lte': lambda left, right: left <= right,
+    'in': lambda left, right: left.in_(right),
+}
+
+
+def parse_predicate(key):
+    '''
+    Split `key__operator` into (key, operator), defaults to equality
+    '''
+    if '__' in key:
+        name, operator = key.rsplit('__', 1)
+        if operator in OPERATORS:
+            return name, operator
+    return key, 'eq'
+
+
+def json_value(column, key, sample=None):
+    '''
+    Typed accessor of a top level key, typed after the compared value
+    '''
+    if isinstance(sample, bool):
+        return column[key].as_boolean()
+    if isinstance(sample, numbers.Number):
+        return column[key].as_float()
+    return column[key].as_string()
+
+
+def json_equals(column, key, value, dialect_name):
+    '''
+    Equality of a top level key with a list or dict value. Other backends
+    compare the extracted JSON text, so dict keys must be in stored order
+    '''
+    if dialect_name == 'postgresql':
+        return column[key] == cast(literal(value, JSONB), JSONB)
+    return column[key] == func.json(json.dumps(value))
+
+
+def json_predicates(column, predicates, dialect_name):
+    '''
+    List of SQL expressions for the predicates on a JSON column
+    '''
+    expressions = []
+    containment = {}
+    for predicate, value in predicates.items():
+        key, operator = parse_predicate(predicate)
+        structured = isinstance(value, (list, tuple, dict))
+        if operator == 'eq' and dialect_name == 'postgresql' and value is not None and not structured:
+            containment[key] = value
+            continue
+
+        sample = value[0] if operator == 'in' and value else value
+        if structured and operator in ('eq', 'ne'):
+            equals = json_equals(column, key, value, dialect_name)
+            expressions.append(equals if operator == 'eq' else ~equals)
+        elif value is None and operator in ('eq', 'ne'):
+            accessor = column[key].as_string()
+            expressions.append(accessor.is_(None) if operator == 'eq' else accessor.isnot(None))
+        else:
+            expressions.append(OPERATORS[operator](json_value(column, key, sample), value))
+
+    if containment:
+        expressions.append(column.op('@>')(cast(literal(containment, JSONB), JSONB)))
+    return expressions
+
+
+def postgres_index_sql(table, name, definition, concurrently=False):
+    '''
+    `CREATE INDEX` statement. Concurrent builds do not block writes to the
+    table, but cannot run inside a transaction
+    '''
+    return 'CREATE INDEX {}IF NOT EXISTS "{}" ON "{}" {}'.format(
+        'CONCURRENTLY ' if concurrently else '', name, table.name, definition)
+
+
+def postgres_index_ddl(table, name, definition):
+    return DDL(postgres_index_sql(table, name, definition)).execute_if(dialect='postgresql')
+
+
+# Indexes declared with `add_postgres_index`, as (table, name, definition)
+POSTGRES_INDEXES = []
+
+
+def add_postgres_index(table, name, definition):
+    '''
+    Create a postgres only index (GIN or expression indexes on JSONB
+    columns) along with the table, and on existing tables through
+    `create_postgres_indexes`. Other backends skip it
+    '''
+    POSTGRES_INDEXES.append((table, name, definition))
+    event.listen(table, 'after_create', postgres_index_ddl(table, name, definition))
+
+
+def create_postgres_indexes(bind, metadata=None):
+    '''
+    Create the declared indexes (of tables in `metadata`, all if None) that
+    do not exist yet, eg on tables created before the index was declared.
+    Missing indexes are built with `CREATE INDEX CONCURRENTLY`, so `bind`
+    must not be in a transaction (eg an AUTOCOMMIT connection). No-op on
+    other backends
+    '''
+    if bind.dialect.name != 'postgresql':
+        return
+
+    indexes = [i for i in POSTGRES_INDEXES if metadata is None or i[0].metadata is metadata]
+    if not indexes:
+        return
+
+    # Even a no-op `IF NOT EXISTS` build waits on the table lock, skip existing indexes
+    existing = set(row[0] for row in bind.execute('SELECT indexname FROM pg_indexes'))
+    for table, name, definition in indexes:
+        if name not in existing:
+            bind.execute(postgres_index_sql(table, name, definition, concurrently=True))
+
+
+def gin_index(table, column_name):
+    '''
+    (name, definition) of a GIN index for containment queries on a column
+    '''
+    return '{}_{}_gin_index'.format(table.name, column_name), 'USING gin ("{}" jsonb_path_ops)'.format(column_name)
+
+
+def expression_index(table, column_name, key, leading_columns=()):
+    '''
+    (name, definition) of a btree index on `CAST((column ->> 'key') AS FLOAT)`
+    (optionally after plain columns), matching the comparisons compiled by
+    `json_predicates`
+    '''
+    expression = '''(CAST(("{}" ->> '{}') AS FLOAT))'''.format(column_name, key.replace("'", "''"))
+    columns = ['"{}"'.format(i) for i in leading_columns] + [expression]
+    name = '{}_{}_{}_index'.format(table.name, column_name, ''.join(i if i.isalnum() else '_' for i in key))
+    return name, '({})'.format(', '.join(columns))
@@ -0,0 +1,35 @@
+from sqlalchemy.types import TypeDecorator, JSON, Text
+from sqlalchemy.dialects.postgresql import JSONB
+import json
+
+__author__ = 'Elisha Yadgaran'
+
+
+class JSONType(TypeDecorator):
+    """Platform-independent JSON type.
+
+    Uses PostgreSQL's JSONB type, the native JSON type of backends
+    SQLAlchemy supports it for (SQLite, MySQL), otherwise uses TEXT,
+    storing serialized JSON.
+    """
+    impl = JSON
+
+    NATIVE_DIALECTS = ('postgresql', 'sqlite', 'mysql')
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(JSONB())
+        elif dialect.name in self.NATIVE_DIALECTS:
+            return dialect.type_descriptor(JSON())
+        else:
+            return dialect.type_descriptor(Text())
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name in self.NATIVE_DIALECTS:
+            return value
+        return json.dumps(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None or dialect.name in self.NATIVE_DIALECTS:
+            return value
+        return json.loads(value)
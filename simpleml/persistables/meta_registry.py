@@ -3,16 +3,29 @@ Meta class to auto register new classes
 '''
 from sqlalchemy.ext.declarative import declarative_base
 from abc import ABCMeta
+import importlib
+import logging
+import threading
 
 __author__ = 'Elisha Yadgaran'
 
 
+LOGGER = logging.getLogger(__name__)
+
+# Packages defining persistable classes. They are not imported with
+# simpleml; the registry imports them the first time it is asked for a
+# class it does not know
+LAZY_REGISTRY_PACKAGES = ['simpleml.datasets', 'simpleml.pipelines', 'simpleml.models', 'simpleml.metrics']
+
+
 class Registry(object):
     '''
     Importable class to maintain reference to the global registry
     '''
-    def __init__(self):
+    def __init__(self, lazy_packages=None):
         self.registry = {}
+        self.lazy_packages = list(lazy_packages or [])
+        self._lock = threading.RLock()
 
     def register(self, cls):
         if cls.__name__ in self.registry:
@@ -22,14 +35,62 @@ class Registry(object):
     def get_from_registry(self, class_name):
         return self.registry.get(class_name)
 
-    def get(self, class_name):
-        return self.get_from_registry(class_name)
+    def import_registry_modules(self, package_name):
+        '''
+        Import a package and, recursively, the modules it lists in
+        `REGISTRY_MODULES`, registering the classes they define
+        '''
+        package = importlib.import_module(package_name)
+        for module_name in getattr(package, 'REGISTRY_MODULES', []):
+            self.import_registry_modules('{}.{}'.format(package_name, module_name))
+
+    def load_lazy_packages(self):
+        '''
+        Import every pending lazy package (once). Packages that fail to
+        import (eg a missing optional dependency) are logged and skipped
+        '''
+        with self._lock:
+            while self.lazy_packages:
+                package_name = self.lazy_packages.pop(0)
+                try:
+                    self.import_registry_modules(package_name)
+                except Exception as e:
+                    LOGGER.warning('Unable to import {}: {}'.format(package_name, e))
+
+    def import_module(self, module_name):
+        '''
+        Import the module that defines a class. Returns False if it can not
+        be imported (eg moved since the class was saved, or failing at
+        import like the lazy packages)
+        '''
+        try:
+            with self._lock:
+                importlib.import_module(module_name)
+            return True
+        except Exception as e:
+            LOGGER.warning('Unable to import {}: {}'.format(module_name, e))
+            return False
+
+    def get(self, class_name, module_name=None):
+        '''
+        Registered class for class_name. On a miss, imports module_name (the
+        module the class was defined in, if known) and then every lazy package
+
+        :param module_name: fully qualified module path of the class
+        '''
+        cls = self.get_from_registry(class_name)
+        if cls is None and module_name is not None and self.import_module(module_name):
+            cls = self.get_from_registry(class_name)
+        if cls is None and self.lazy_packages:
+            self.load_lazy_packages()
+            cls = self.get_from_registry(class_name)
+        return cls
 
 
 # Importable registry
 # NEED to use consistent import pattern, otherwise will refer to different memory objects
 # from meta_register import SIMPLEML_REGISTRY as s1 != from simpleml.persistables.meta_register import SIMPLEML_REGISTRY as s2
-SIMPLEML_REGISTRY = Registry()
+SIMPLEML_REGISTRY = Registry(lazy_packages=LAZY_REGISTRY_PACKAGES)
 
 # Need to explicitly merge metaclasses to avoid conflicts
 MetaBase = type(declarative_base())
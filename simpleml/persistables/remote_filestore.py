@@ -0,0 +1,537 @@
+'''
+Remote filestores for external files
+
+Artifacts are transferred as fixed size parts with several parts in
+flight at once, so a single transfer can use all available bandwidth:
+    - uploads are multipart, each part is checksummed (md5) and verified
+      by the backend
+    - downloads are parallel ranged reads, reassembled in order
+    - the sha256 of the whole artifact is stored next to it on upload and
+      verified after every download
+    - every backend call is retried with exponential backoff
+
+Backends implement a handful of primitives (`BaseRemoteFilestore`):
+    - FilesystemRemoteFilestore: any mounted (eg network) filesystem
+    - S3Filestore: S3 compatible object stores (requires `boto3` unless a
+      client is passed). `LocalS3Client` is an in-memory stand-in for the
+      boto3 client to use it offline
+
+The filestore used by the `remote_pickled` save method is configured with
+`set_remote_filestore` or the SIMPLEML_REMOTE_FILESTORE environment
+variable (`file:///path/to/root` or `s3://bucket/prefix`)
+'''
+
+__author__ = 'Elisha Yadgaran'
+
+
+from simpleml.persistables.filestore import atomic_write
+from simpleml.utils.errors import FilestoreError
+from simpleml.utils.system_path import ensure_directory
+from abc import ABCMeta, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import base64
+import errno
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+import urlparse
+import uuid
+from os.path import join, exists
+
+# Optional dependency for S3
+try:
+    import boto3
+except ImportError:
+    boto3 = None
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Bytes per transferred part (S3 requires at least 5MB for all but the last)
+DEFAULT_PART_SIZE = 8 * 2 ** 20
+# Parts in flight at once per transfer
+DEFAULT_MAX_CONCURRENCY = int(os.getenv('SIMPLEML_REMOTE_CONCURRENCY', 8))
+DEFAULT_MAX_RETRIES = 3
+CHECKSUM_ALGORITHM = 'sha256'
+
+
+class BaseRemoteFilestore(object):
+    '''
+    Base class for remote filestores. Subclasses implement the backend
+    primitives, transfers (parallelism, retries, checksums) are shared
+
+    Missing objects are signaled by raising KeyError from the primitives
+    '''
+    __metaclass__ = ABCMeta
+
+    def __init__(self, part_size=DEFAULT_PART_SIZE, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 max_retries=DEFAULT_MAX_RETRIES, retry_backoff=0.5):
+        self.part_size = part_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+    @abstractmethod
+    def _create_upload(self, key):
+        '''
+        Start a multipart upload, returns an upload id
+        '''
+
+    @abstractmethod
+    def _upload_part(self, key, upload_id, part_number, data, md5):
+        '''
+        Upload one part (numbered from 1). The backend must reject data
+        that does not match the md5 digest. Returns a part token
+        '''
+
+    @abstractmethod
+    def _complete_upload(self, key, upload_id, parts):
+        '''
+        Assemble the uploaded parts, a list of (part_number, token)
+        '''
+
+    @abstractmethod
+    def _abort_upload(self, key, upload_id):
+        '''
+        Discard an unfinished upload
+        '''
+
+    @abstractmethod
+    def _read_range(self, key, start, end):
+        '''
+        Bytes [start, end) of an object
+        '''
+
+    @abstractmethod
+    def _put_checksum(self, key, checksum):
+        '''
+        Store the checksum of a completed object
+        '''
+
+    @abstractmethod
+    def _get_checksum(self, key):
+        '''
+        Stored checksum of an object (None if not recorded)
+        '''
+
+    @abstractmethod
+    def size(self, key):
+        '''
+        Size of an object in bytes
+        '''
+
+    @abstractmethod
+    def delete(self, key):
+        '''
+        Delete an object and its checksum
+        '''
+
+    def exists(self, key):
+        try:
+            self.size(key)
+            return True
+        except KeyError:
+            return False
+
+    def _retry(self, func, *args):
+        '''
+        Call func, retrying failures with exponential backoff. Missing
+        objects (KeyError) are not retried
+        '''
+        for attempt in xrange(self.max_retries + 1):
+            try:
+                return func(*args)
+            except KeyError:
+                raise
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                LOGGER.warning('Retrying {} after error: {}'.format(func.__name__, e))
+                time.sleep(self.retry_backoff * 2 ** attempt)
+
+    def _ordered_map(self, func, items):
+        '''
+        Yield func(item) for every item, in order, with at most
+        2 * max_concurrency calls in flight or buffered
+        '''
+        executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        pending = deque()
+        try:
+            for item in items:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= 2 * self.max_concurrency:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def upload(self, key, fileobj):
+        '''
+        Upload everything read from fileobj to key. Returns the checksum
+
+        :param fileobj: file-like object to upload from, read sequentially
+            from its current position
+        '''
+        digest = hashlib.new(CHECKSUM_ALGORITHM)
+
+        def parts():
+            part_number = 1
+            while True:
+                data = fileobj.read(self.part_size)
+                if not data and part_number > 1:
+                    break
+                digest.update(data)
+                yield part_number, data
+                if not data:
+                    break
+                part_number += 1
+
+        def upload_part(part):
+            part_number, data = part
+            md5 = hashlib.md5(data).hexdigest()
+            return part_number, self._retry(self._upload_part, key, upload_id, part_number, data, md5)
+
+        upload_id = self._retry(self._create_upload, key)
+        try:
+            uploaded = list(self._ordered_map(upload_part, parts()))
+            self._retry(self._complete_upload, key, upload_id, uploaded)
+        except Exception:
+            try:
+                self._abort_upload(key, upload_id)
+            except Exception as e:
+                LOGGER.warning('Unable to abort upload {} of {}: {}'.format(upload_id, key, e))
+            raise
+
+        checksum = digest.hexdigest()
+        self._retry(self._put_checksum, key, checksum)
+        return checksum
+
+    def download(self, key, fileobj):
+        '''
+        Download key into fileobj (written sequentially). Raises
+        FilestoreError if the content does not match the stored checksum
+        '''
+        try:
+            size = self._retry(self.size, key)
+        except KeyError:
+            raise FilestoreError('Remote file {} does not exist'.format(key))
+
+        def read_range(byte_range):
+            start, end = byte_range
+            data = self._read_range(key, start, end)
+            if len(data) != end - start:
+                raise FilestoreError('Short read of {} [{}, {})'.format(key, start, end))
+            return data
+
+        ranges = ((start, min(start + self.part_size, size)) for start in xrange(0, size, self.part_size))
+        digest = hashlib.new(CHECKSUM_ALGORITHM)
+        for data in self._ordered_map(lambda i: self._retry(read_range, i), ranges):
+            digest.update(data)
+            fileobj.write(data)
+
+        expected = self._retry(self._get_checksum, key)
+        if expected is not None and digest.hexdigest() != expected:
+            raise FilestoreError('Checksum mismatch downloading {}'.format(key))
+        return digest.hexdigest()
+
+
+class FilesystemRemoteFilestore(BaseRemoteFilestore):
+    '''
+    Remote filestore on a (typically network mounted) filesystem
+
+    Layout (relative to root):
+        key                      object content
+        key.sha256               object checksum
+        .uploads/<upload_id>/    parts of unfinished uploads
+    '''
+    def __init__(self, root, **kwargs):
+        super(FilesystemRemoteFilestore, self).__init__(**kwargs)
+        self.root = root
+
+    def _path(self, key):
+        return join(self.root, key)
+
+    def _upload_directory(self, upload_id):
+        return join(self.root, '.uploads', upload_id)
+
+    def _create_upload(self, key):
+        upload_id = uuid.uuid4().hex
+        ensure_directory(self._upload_directory(upload_id))
+        return upload_id
+
+    def _upload_part(self, key, upload_id, part_number, data, md5):
+        if hashlib.md5(data).hexdigest() != md5:
+            raise FilestoreError('Part {} of {} does not match its checksum'.format(part_number, key))
+        part_path = join(self._upload_directory(upload_id), '{:08d}'.format(part_number))
+        atomic_write(part_path, lambda f: f.write(data))
+        return md5
+
+    def _complete_upload(self, key, upload_id, parts):
+        directory = self._upload_directory(upload_id)
+
+        def assemble(fileobj):
+            for part_number, _ in sorted(parts):
+                with open(join(directory, '{:08d}'.format(part_number)), 'rb') as part_file:
+                    shutil.copyfileobj(part_file, fileobj)
+
+        atomic_write(self._path(key), assemble)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    def _abort_upload(self, key, upload_id):
+        shutil.rmtree(self._upload_directory(upload_id), ignore_errors=True)
+
+    def _read_range(self, key, start, end):
+        try:
+            with open(self._path(key), 'rb') as f:
+                f.seek(start)
+                return f.read(end - start)
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                raise KeyError(key)
+            raise
+
+    def _put_checksum(self, key, checksum):
+        atomic_write(self._path(key) + '.sha256', lambda f: f.write(checksum))
+
+    def _get_checksum(self, key):
+        path = self._path(key) + '.sha256'
+        if not exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read().strip()
+
+    def size(self, key):
+        try:
+            return os.path.getsize(self._path(key))
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                raise KeyError(key)
+            raise
+
+    def delete(self, key):
+        for path in (self._path(key), self._path(key) + '.sha256'):
+            if exists(path):
+                os.remove(path)
+
+
+class S3Filestore(BaseRemoteFilestore):
+    '''
+    Remote filestore on an S3 compatible object store
+
+    :param bucket: bucket name
+    :param prefix: key prefix for all objects
+    :param client: boto3 style S3 client (eg `LocalS3Client`). Defaults to
+        `boto3.client('s3', endpoint_url=endpoint_url)`
+    :param endpoint_url: custom endpoint for S3 compatible stores
+    '''
+    MISSING_CODES = ('404', 'NoSuchKey', 'NotFound')
+
+    def __init__(self, bucket, prefix='', client=None, endpoint_url=None, **kwargs):
+        super(S3Filestore, self).__init__(**kwargs)
+        if client is None:
+            if boto3 is None:
+                raise ImportError('boto3 is required to use the S3 filestore')
+            client = boto3.client('s3', endpoint_url=endpoint_url)
+
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.client = client
+
+    def _key(self, key):
+        return '/'.join([self.prefix, key]) if self.prefix else key
+
+    def _is_missing(self, error):
+        response = getattr(error, 'response', None) or {}
+        return str(response.get('Error', {}).get('Code')) in self.MISSING_CODES
+
+    def _call(self, method, **kwargs):
+        '''
+        Call a client method, translating missing objects to KeyError
+        '''
+        try:
+            return getattr(self.client, method)(Bucket=self.bucket, **kwargs)
+        except Exception as e:
+            if self._is_missing(e):
+                raise KeyError(kwargs.get('Key'))
+            raise
+
+    def _create_upload(self, key):
+        return self._call('create_multipart_upload', Key=self._key(key))['UploadId']
+
+    def _upload_part(self, key, upload_id, part_number, data, md5):
+        response = self._call(
+            'upload_part', Key=self._key(key), UploadId=upload_id, PartNumber=part_number,
+            Body=data, ContentMD5=base64.b64encode(md5.decode('hex')))
+        return response['ETag']
+
+    def _complete_upload(self, key, upload_id, parts):
+        self._call('complete_multipart_upload', Key=self._key(key), UploadId=upload_id,
+                   MultipartUpload={'Parts': [{'ETag': etag, 'PartNumber': part_number}
+                                              for part_number, etag in sorted(parts)]})
+
+    def _abort_upload(self, key, upload_id):
+        self._call('abort_multipart_upload', Key=self._key(key), UploadId=upload_id)
+
+    def _read_range(self, key, start, end):
+        response = self._call('get_object', Key=self._key(key), Range='bytes={}-{}'.format(start, end - 1))
+        return response['Body'].read()
+
+    def _put_checksum(self, key, checksum):
+        self._call('put_object', Key=self._key(key) + '.sha256', Body=checksum)
+
+    def _get_checksum(self, key):
+        try:
+            return self._call('get_object', Key=self._key(key) + '.sha256')['Body'].read().strip()
+        except KeyError:
+            return None
+
+    def size(self, key):
+        return self._call('head_object', Key=self._key(key))['ContentLength']
+
+    def delete(self, key):
+        self._call('delete_object', Key=self._key(key))
+        self._call('delete_object', Key=self._key(key) + '.sha256')
+
+
+class LocalS3ClientError(Exception):
+    '''
+    Error raised by `LocalS3Client`, shaped like botocore's ClientError
+    '''
+    def __init__(self, code, message=''):
+        super(LocalS3ClientError, self).__init__('{}: {}'.format(code, message))
+        self.response = {'Error': {'Code': code, 'Message': message}}
+
+
+class _Body(object):
+    def __init__(self, data):
+        self._data = data
+
+    def read(self):
+        return self._data
+
+
+class LocalS3Client(object):
+    '''
+    In-memory stand-in for the subset of the boto3 S3 client used by
+    `S3Filestore`, to use and test it offline. Validates part md5s and
+    minimum part sizes like S3 does
+    '''
+    def __init__(self, min_part_size=0):
+        self.min_part_size = min_part_size
+        self._objects = {}
+        self._uploads = {}
+        self._lock = threading.Lock()
+
+    def _object(self, Bucket, Key):
+        try:
+            return self._objects[(Bucket, Key)]
+        except KeyError:
+            raise LocalS3ClientError('NoSuchKey', Key)
+
+    def _upload(self, UploadId):
+        try:
+            return self._uploads[UploadId]
+        except KeyError:
+            raise LocalS3ClientError('NoSuchUpload', UploadId)
+
+    def create_multipart_upload(self, Bucket, Key):
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = {}
+        return {'Bucket': Bucket, 'Key': Key, 'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, ContentMD5=None):
+        md5 = hashlib.md5(Body)
+        if ContentMD5 is not None and base64.b64encode(md5.digest()) != ContentMD5:
+            raise LocalS3ClientError('BadDigest', 'Part {} does not match Content-MD5'.format(PartNumber))
+        etag = '"{}"'.format(md5.hexdigest())
+        with self._lock:
+            self._upload(UploadId)[PartNumber] = (etag, Body)
+        return {'ETag': etag}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        with self._lock:
+            uploaded = self._upload(UploadId)
+            parts = MultipartUpload['Parts']
+            for i, part in enumerate(parts):
+                etag, data = uploaded.get(part['PartNumber'], (None, None))
+                if etag != part['ETag']:
+                    raise LocalS3ClientError('InvalidPart', str(part['PartNumber']))
+                if i < len(parts) - 1 and len(data) < self.min_part_size:
+                    raise LocalS3ClientError('EntityTooSmall', str(part['PartNumber']))
+
+            self._objects[(Bucket, Key)] = ''.join(uploaded[part['PartNumber']][1] for part in parts)
+            del self._uploads[UploadId]
+        return {'Bucket': Bucket, 'Key': Key}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        with self._lock:
+            self._uploads.pop(UploadId, None)
+        return {}
+
+    def put_object(self, Bucket, Key, Body):
+        with self._lock:
+            self._objects[(Bucket, Key)] = Body
+        return {}
+
+    def get_object(self, Bucket, Key, Range=None):
+        with self._lock:
+            data = self._object(Bucket, Key)
+        if Range is not None:
+            start, end = Range.replace('bytes=', '').split('-')
+            data = data[int(start):int(end) + 1]
+        return {'Body': _Body(data), 'ContentLength': len(data)}
+
+    def head_object(self, Bucket, Key):
+        with self._lock:
+            return {'ContentLength': len(self._object(Bucket, Key))}
+
+    def delete_object(self, Bucket, Key):
+        with self._lock:
+            self._objects.pop((Bucket, Key), None)
+        return {}
+
+
+def remote_filestore_from_url(url, **kwargs):
+    '''
+    Remote filestore from a url: `file:///path/to/root` or `s3://bucket/prefix`
+    (S3 endpoint from SIMPLEML_S3_ENDPOINT_URL if set)
+    '''
+    parsed = urlparse.urlparse(url)
+    if parsed.scheme == 'file':
+        return FilesystemRemoteFilestore(parsed.path, **kwargs)
+    elif parsed.scheme == 's3':
+        kwargs.setdefault('endpoint_url', os.getenv('SIMPLEML_S3_ENDPOINT_URL'))
+        return S3Filestore(parsed.netloc, prefix=parsed.path, **kwargs)
+    raise ValueError('Unsupported remote filestore: {}'.format(url))
+
+
+_REMOTE_FILESTORE = {'store': None}
+
+
+def set_remote_filestore(store):
+    '''
+    Set the remote filestore used by the `remote_pickled` save method
+    '''
+    _REMOTE_FILESTORE['store'] = store
+
+
+def get_remote_filestore():
+    '''
+    Configured remote filestore (from SIMPLEML_REMOTE_FILESTORE if not set)
+    '''
+    if _REMOTE_FILESTORE['store'] is None:
+        url = os.getenv('SIMPLEML_REMOTE_FILESTORE')
+        if url is None:
+            raise FilestoreError('No remote filestore configured. Use `set_remote_filestore` '
+                                 'or set SIMPLEML_REMOTE_FILESTORE')
+        _REMOTE_FILESTORE['store'] = remote_filestore_from_url(url)
+    return _REMOTE_FILESTORE['store']
+
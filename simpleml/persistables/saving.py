@@ -3,29 +3,89 @@ Module to define the mixins that support different persistence
 patterns for external objects
 
 - Dataframe saving (as tables in dedicated schema)
+- Dataframe saving to local filestore in columnar (parquet) format
+- Dataframe saving as deltas against the previous version
+- Pickled object saving with numpy arrays out of band (memory mapped on load)
 - Pickled Object saving
     - In database as a binary blob
     - To local filestore
 - HDF5 object saving
     - In database as a binary blob
     - To local filestore
-- Remote filestore saving
-    - S3
-    - Google Cloud
-    - Azure
+- Remote filestore saving (pickled, parallel multipart transfers)
+    - S3 compatible object stores
+    - Mounted (network) filesystems
 '''
 
 __author__ = 'Elisha Yadgaran'
 
 
 from simpleml.persistables.binary_blob import BinaryBlob
-from simpleml.utils.system_path import PICKLED_FILESTORE_DIRECTORY
+from simpleml.persistables.compression import get_codec, codec_from_filepaths, READ_BLOCK_SIZE
+from simpleml.persistables.delta import encode_delta_from_hashes, apply_delta, removed_count,\
+    frames_identical, row_hashes, schema_signature, hashes_string_forms
+from simpleml.persistables.external_cache import EXTERNAL_FILE_CACHE
+from simpleml.persistables.filestore import ContentAddressedFilestore, LocalDiskCache
+from simpleml.persistables.remote_filestore import get_remote_filestore
+from simpleml.persistables.serialization import dump_with_array_sidecars, load_with_array_sidecars
+from simpleml.persistables.copy_streams import DataframeCopyStream, DEFAULT_CHUNKSIZE,\
+    PGCOPY_HEADER, PGCOPY_TRAILER, CURSOR_TYPE_OIDS, encode_binary_chunk, decode_binary_copy
+from simpleml.utils.errors import DatasetError
+from simpleml.utils.system_path import PICKLED_FILESTORE_DIRECTORY, PARQUET_FILESTORE_DIRECTORY,\
+    MMAP_FILESTORE_DIRECTORY, DISK_CACHE_DIRECTORY, ensure_directory
 from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+from contextlib import closing
 import cStringIO
 import dill as pickle
+import logging
+import numpy as np
+import os
+import pandas as pd
+import shutil
+import tempfile
+import uuid
 from os.path import join
 
 
+LOGGER = logging.getLogger(__name__)
+
+# Per column compression codec for parquet files
+PARQUET_COMPRESSION = 'snappy'
+
+# Versions between full snapshots for delta encoded dataframes
+DEFAULT_DELTA_SNAPSHOT_INTERVAL = 10
+
+
+def _import_pyarrow():
+    '''
+    Optional dependency for columnar storage, imported on first use
+    '''
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError('pyarrow is required to use the `disk_parquet` save method')
+    return pa, pq
+
+
+# Deduplicated store for pickled files
+PICKLED_FILESTORE = ContentAddressedFilestore(PICKLED_FILESTORE_DIRECTORY)
+
+# Local read-through cache of database stored artifacts
+DISK_CACHE = LocalDiskCache(DISK_CACHE_DIRECTORY)
+
+
+def release_external_files(filepaths):
+    '''
+    Drop the pickled filestore references held by a deleted persistable,
+    content nothing else references is removed from disk
+    '''
+    for key in ('disk_pickled', 'disk_delta', 'delta_row_hashes'):
+        for path in (filepaths or {}).get(key, []):
+            PICKLED_FILESTORE.release(path)
+
+
 class BaseExternalSaveMixin(object):
     __metaclass__ = ABCMeta
 
@@ -43,6 +103,34 @@ class BaseExternalSaveMixin(object):
         should set the self._external_file attribute
         '''
 
+    def _disk_cache_key(self, kind):
+        '''
+        Local disk cache key. Content is immutable for a given id and hash
+        '''
+        return '{}-{}.{}'.format(self.id, getattr(self, 'hash_', None), kind)
+
+    def _open_through_disk_cache(self, kind, writer):
+        '''
+        Open the local disk cache copy of an artifact, populating it with
+        `writer` (callable writing the stored bytes into a file) on a miss.
+        Returns None if the cache is disabled or cannot be written
+        '''
+        cache_key = self._disk_cache_key(kind)
+        cached_file = DISK_CACHE.open(cache_key)
+        if cached_file is None:
+            try:
+                if DISK_CACHE.put(cache_key, writer):
+                    cached_file = DISK_CACHE.open(cache_key)
+            except (IOError, OSError) as e:
+                LOGGER.warning('Unable to cache {} on local disk: {}'.format(self.id, e))
+        return cached_file
+
+    def _get_codec(self):
+        '''
+        Compression codec for serialized externals, configured in state
+        '''
+        return get_codec(self.state.get('compression'), self.state.get('compression_level'))
+
 
 class DataframeTableSaveMixin(BaseExternalSaveMixin):
     '''
@@ -70,33 +158,95 @@ class DataframeTableSaveMixin(BaseExternalSaveMixin):
         '''
         self._load_dataframe_from_table()
 
-    def _save_dataframe_to_table(self):
+    def _save_dataframe_to_table(self, copy_format='csv'):
         '''
         Shared method to save dataframe into a new table with name = GUID
+
+        :param copy_format: `csv` or `binary`, wire format used for `copy from`.
+            Binary is faster for numeric data and preserves dtypes on load
         '''
-        self.filepaths = {"database": [(self._schema, str(self.id))]}
+        if copy_format == 'binary':
+            self.filepaths = {"database_binary": [(self._schema, str(self.id))]}
+        else:
+            self.filepaths = {"database": [(self._schema, str(self.id))]}
+
         self.df_to_sql(self._engine, self.dataframe,
-                       str(self.id), schema=self._schema)
+                       str(self.id), schema=self._schema, copy_format=copy_format)
 
     def _load_dataframe_from_table(self):
         '''
         Shared method to load dataframe from database
+
+        Reads through the local disk cache so repeat loads on a host do
+        not touch the database
         '''
-        schema, tablename = self.filepaths['database'][0]
-        self._external_file = self.load_sql(
-            'select * from "{}"."{}"'.format(schema, tablename),
-            self._engine
-        )
+        cache_key = self._disk_cache_key('dataframe')
+        cached_file = DISK_CACHE.open(cache_key)
+        if cached_file is not None:
+            with closing(cached_file):
+                self._external_file = pickle.load(cached_file)
+
+        else:
+            self._external_file = self._read_dataframe_from_table()
+
+            try:
+                DISK_CACHE.put(cache_key, lambda f: pickle.dump(
+                    self._external_file, f, protocol=pickle.HIGHEST_PROTOCOL))
+            except (IOError, OSError) as e:
+                LOGGER.warning('Unable to cache {} on local disk: {}'.format(self.id, e))
 
         # Indicate externals were loaded
         self.unloaded_externals = False
 
+    @staticmethod
+    def _supports_copy(engine):
+        '''
+        `copy` and named cursors are postgres only, other backends go
+        through generic pandas sql
+        '''
+        return engine.dialect.name == 'postgresql'
+
+    def _read_dataframe_from_table(self, columns=None):
+        '''
+        Read the dataframe (or only `columns` of it) from database
+        '''
+        if not self._supports_copy(self._engine):
+            key = 'database_binary' if 'database_binary' in self.filepaths else 'database'
+            schema, tablename = self.filepaths[key][0]
+            return pd.read_sql_query('SELECT {} FROM "{}"."{}"'.format(
+                self._select_list(columns), schema, tablename), self._engine)
+
+        if 'database_binary' in self.filepaths:
+            schema, tablename = self.filepaths['database_binary'][0]
+            return self.copy_to_df(self._engine, tablename, schema=schema, columns=columns)
+
+        schema, tablename = self.filepaths['database'][0]
+        return self.cursor_to_df(self._engine, tablename, schema=schema, columns=columns)
+
+    def _iter_dataframe_from_table(self, chunksize=DEFAULT_CHUNKSIZE, columns=None):
+        '''
+        Shared method to stream the dataframe (or only `columns` of it)
+        from database in chunks without materializing the whole table
+        '''
+        key = 'database_binary' if 'database_binary' in self.filepaths else 'database'
+        schema, tablename = self.filepaths[key][0]
+        if not self._supports_copy(self._engine):
+            return pd.read_sql_query('SELECT {} FROM "{}"."{}"'.format(
+                self._select_list(columns), schema, tablename), self._engine, chunksize=chunksize)
+        return self.iter_cursor_to_df(self._engine, tablename, schema=schema, chunksize=chunksize,
+                                      columns=columns)
+
     @staticmethod
     def df_to_sql(engine, df, table, dtype=None, schema='public',
-                    if_exists='replace', sep='|', encoding='utf8', index=False):
+                    if_exists='replace', sep='|', encoding='utf8', index=False,
+                    chunksize=DEFAULT_CHUNKSIZE, threaded=True, copy_format='csv'):
         '''
         Utility to bulk insert pandas dataframe via `copy from`
 
+        Rows are serialized in chunks and streamed into the copy
+        command, so memory stays bounded by a few chunks and encoding
+        overlaps with the database write
+
         :param df: dataframe to insert
         :param table: destination table
         :param dtype: column schema of destination table
@@ -106,24 +256,208 @@ class DataframeTableSaveMixin(BaseExternalSaveMixin):
         :param sep: separator key between cells
         :param encoding: character encoding to use
         :param index: whether to output index with data
+        :param chunksize: number of rows to serialize at a time
+        :param threaded: whether to serialize on a background thread
+        :param copy_format: `csv` or `binary` (postgres binary copy format,
+            `sep` and `encoding` are ignored). Binary only supports numeric,
+            boolean, datetime and string columns; values are cast to the
+            created column types
+
+        Backends without `copy` (eg SQLite) use batched pandas inserts
         '''
+        if not DataframeTableSaveMixin._supports_copy(engine):
+            df.to_sql(table, con=engine, if_exists=if_exists, index=index,
+                      schema=schema, dtype=dtype, chunksize=chunksize)
+            return
 
         # Create Table
         df.head(0).to_sql(table, con=engine, if_exists=if_exists,
                           index=index, schema=schema, dtype=dtype)
 
-        # Prepare data
-        output = cStringIO.StringIO()
-        df.to_csv(output, sep=sep, header=False, encoding=encoding, index=index)
-        output.seek(0)
+        if copy_format == 'binary' and index:
+            df = df.reset_index()
 
         # Insert data
         connection = engine.raw_connection()
-        cursor = connection.cursor()
-        cursor.copy_from(output, '"' + '"."'.join([schema, table]) + '"', sep=sep, null='',
-                         columns=['"{}"'.format(i) for i in df.columns])
-        connection.commit()
-        connection.close()
+        try:
+            cursor = connection.cursor()
+            qualified_table = '"' + '"."'.join([schema, table]) + '"'
+            columns = ['"{}"'.format(i) for i in df.columns]
+
+            if copy_format == 'binary':
+                # Encode against the created column types, not the frame dtypes
+                type_oids = DataframeTableSaveMixin._table_description(cursor, qualified_table, df.columns)[1]
+
+                def encoder(chunk):
+                    return encode_binary_chunk(chunk, type_oids)
+
+                with DataframeCopyStream(df, encoder, chunksize=chunksize, threaded=threaded,
+                                         header=PGCOPY_HEADER, footer=PGCOPY_TRAILER) as stream:
+                    cursor.copy_expert('COPY {} ({}) FROM STDIN WITH (FORMAT binary)'.format(
+                        qualified_table, ', '.join(columns)), stream)
+
+            else:
+                def encoder(chunk):
+                    return chunk.to_csv(None, sep=sep, header=False, encoding=encoding, index=index)
+
+                with DataframeCopyStream(df, encoder, chunksize=chunksize, threaded=threaded) as stream:
+                    cursor.copy_from(stream, qualified_table, sep=sep, null='', columns=columns)
+
+            connection.commit()
+        finally:
+            connection.close()
+
+    @classmethod
+    def copy_to_df(cls, engine, table, schema='public', columns=None):
+        '''
+        Utility to read a table into a pandas dataframe via binary `copy to`
+
+        Column dtypes come from the table definition instead of being
+        re-inferred from text
+
+        :param table: source table
+        :param schema: source schema
+        :param columns: subset of columns to read (defaults to all)
+        '''
+        qualified_table = '"' + '"."'.join([schema, table]) + '"'
+
+        connection = engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            column_names, type_oids = cls._table_description(cursor, qualified_table, columns)
+
+            column_list = '' if columns is None else ' ({})'.format(cls._select_list(columns))
+            output = cStringIO.StringIO()
+            cursor.copy_expert('COPY {}{} TO STDOUT WITH (FORMAT binary)'.format(
+                qualified_table, column_list), output)
+        finally:
+            connection.close()
+
+        return decode_binary_copy(output.getvalue(), column_names, type_oids)
+
+    @staticmethod
+    def _select_list(columns=None):
+        '''
+        Quoted column list for a select (all columns if None)
+        '''
+        if columns is None:
+            return '*'
+        return ', '.join('"{}"'.format(unicode(column).replace('"', '""')) for column in columns)
+
+    @classmethod
+    def _table_description(cls, cursor, qualified_table, columns=None):
+        '''
+        Column names and postgres type oids of a table (or the subset of `columns`)
+        '''
+        cursor.execute('SELECT {} FROM {} LIMIT 0'.format(cls._select_list(columns), qualified_table))
+        return [column[0] for column in cursor.description], [column[1] for column in cursor.description]
+
+    @staticmethod
+    def _fill_column(array, values, start):
+        '''
+        Write a chunk of column values into a preallocated array. Upcasts the
+        array if the chunk holds nulls the dtype cannot represent, and grows
+        it (doubling) if the chunk does not fit. Returns the, possibly new, array
+        '''
+        end = start + len(values)
+        if array.dtype.kind in 'iub' and any(value is None for value in values):
+            # Match pandas sql behavior: integers with nulls become floats,
+            # booleans with nulls stay python objects
+            array = array.astype(np.float64 if array.dtype.kind in 'iu' else object)
+
+        if end > len(array):
+            grown = np.empty(max(end, 2 * len(array)), dtype=array.dtype)
+            grown[:start] = array[:start]
+            array = grown
+
+        array[start:end] = values
+        return array
+
+    @classmethod
+    def iter_cursor_to_df(cls, engine, table, schema='public', chunksize=DEFAULT_CHUNKSIZE, columns=None):
+        '''
+        Utility to stream a table as pandas dataframe chunks through a named
+        (server side) cursor. Only `chunksize` rows are held on the client
+        at a time
+
+        :param table: source table
+        :param schema: source schema
+        :param chunksize: number of rows per yielded dataframe
+        :param columns: subset of columns to read (defaults to all)
+        '''
+        qualified_table = '"' + '"."'.join([schema, table]) + '"'
+
+        connection = engine.raw_connection()
+        try:
+            column_names, type_oids = cls._table_description(connection.cursor(), qualified_table, columns)
+
+            cursor = connection.cursor(name='simpleml_{}'.format(uuid.uuid4().hex))
+            cursor.itersize = chunksize
+            cursor.execute('SELECT {} FROM {}'.format(cls._select_list(columns), qualified_table))
+
+            while True:
+                rows = cursor.fetchmany(chunksize)
+                if not rows:
+                    break
+
+                arrays = [
+                    cls._fill_column(np.empty(len(rows), dtype=CURSOR_TYPE_OIDS.get(oid, object)), values, 0)
+                    for values, oid in zip(zip(*rows), type_oids)
+                ]
+                yield pd.DataFrame(OrderedDict(zip(column_names, arrays)), columns=column_names)
+
+            cursor.close()
+        finally:
+            connection.close()
+
+    @classmethod
+    def cursor_to_df(cls, engine, table, schema='public', fetchsize=DEFAULT_CHUNKSIZE, columns=None):
+        '''
+        Utility to read a table into a pandas dataframe through a named
+        (server side) cursor. Rows are fetched `fetchsize` at a time and
+        written column-wise into arrays preallocated from the row count,
+        so the result set is never buffered twice. The count and the select
+        share a repeatable read snapshot, the arrays still grow or are
+        truncated to the rows actually fetched
+
+        :param table: source table
+        :param schema: source schema
+        :param fetchsize: number of rows to pull per round trip
+        :param columns: subset of columns to read (defaults to all)
+        '''
+        qualified_table = '"' + '"."'.join([schema, table]) + '"'
+
+        connection = engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            # First statement of the transaction, so the count and the select see the same rows
+            cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+            column_names, type_oids = cls._table_description(cursor, qualified_table, columns)
+            cursor.execute('SELECT count(*) FROM {}'.format(qualified_table))
+            row_count = cursor.fetchone()[0]
+
+            arrays = [np.empty(row_count, dtype=CURSOR_TYPE_OIDS.get(oid, object)) for oid in type_oids]
+
+            cursor = connection.cursor(name='simpleml_{}'.format(uuid.uuid4().hex))
+            cursor.itersize = fetchsize
+            cursor.execute('SELECT {} FROM {}'.format(cls._select_list(columns), qualified_table))
+
+            start = 0
+            while True:
+                rows = cursor.fetchmany(fetchsize)
+                if not rows:
+                    break
+
+                for i, values in enumerate(zip(*rows)):
+                    arrays[i] = cls._fill_column(arrays[i], values, start)
+                start += len(rows)
+
+            cursor.close()
+        finally:
+            connection.close()
+
+        arrays = [array if len(array) == start else array[:start].copy() for array in arrays]
+        return pd.DataFrame(OrderedDict(zip(column_names, arrays)), columns=column_names)
 
 
 class DatabasePickleSaveMixin(BaseExternalSaveMixin):
@@ -156,27 +490,55 @@ class DatabasePickleSaveMixin(BaseExternalSaveMixin):
         Shared method to save files into binary schema
 
         Hardcoded to only store pickled objects in database so overwrite to use
-        other storage mechanism
+        other storage mechanism. Pickles (through the compression codec)
+        directly into a chunked blob stream
         '''
-        pickled_file = pickle.dumps(self._external_file, protocol=pickle.HIGHEST_PROTOCOL)
-        pickled_record = BinaryBlob.create(
-            object_type=self.object_type, object_id=self.id, binary_blob=pickled_file)
-        self.filepaths = {"database_pickled": [str(pickled_record.id)]}
+        codec = self._get_codec()
+        with BinaryBlob.writer(object_type=self.object_type, object_id=self.id) as blob:
+            with codec.writer(blob) as pickled_file:
+                pickle.dump(self._external_file, pickled_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        self.filepaths = {"database_pickled": [str(blob.blob_id)],
+                          "compression": codec.to_dict()}
 
     def _load_pickle_from_database(self):
         '''
         Shared method to load files from database
 
         Hardcoded to only pull from pickled so overwrite to use
-        other storage mechanism
+        other storage mechanism. Reads through the local disk cache so
+        repeat loads on a host do not touch the database
         '''
         pickled_id = self.filepaths['database_pickled'][0]
-        pickled_file = BinaryBlob.find(pickled_id).binary_blob
-        self._external_file = pickle.loads(pickled_file)
+        codec = codec_from_filepaths(self.filepaths)
+
+        stored_file = self._open_through_disk_cache(
+            'pickled', lambda f: self._copy_pickle_from_database(pickled_id, f))
+        if stored_file is None:
+            stored_file = self._open_pickle_from_database(pickled_id)
+
+        with codec.reader(stored_file) as pickled_file:
+            self._external_file = pickle.load(pickled_file)
 
         # Indicate externals were loaded
         self.unloaded_externals = False
 
+    @staticmethod
+    def _open_pickle_from_database(pickled_id):
+        '''
+        Stream of the stored (compressed) bytes of a pickled blob
+        '''
+        legacy_blob = BinaryBlob.find(pickled_id).binary_blob
+        if legacy_blob is not None:
+            # Blobs saved before chunked storage hold the whole payload
+            return cStringIO.StringIO(str(legacy_blob))
+        return BinaryBlob.reader(pickled_id)
+
+    @classmethod
+    def _copy_pickle_from_database(cls, pickled_id, fileobj):
+        with closing(cls._open_pickle_from_database(pickled_id)) as stored_file:
+            shutil.copyfileobj(stored_file, fileobj, READ_BLOCK_SIZE)
+
 
 class DiskPickleSaveMixin(BaseExternalSaveMixin):
     '''
@@ -205,24 +567,379 @@ class DiskPickleSaveMixin(BaseExternalSaveMixin):
     def _save_pickle_to_disk(self):
         '''
         Shared method to save files to disk in pickled format
+
+        Files are content addressed by the digest of the pickled bytes, so
+        saving an artifact identical to an existing one only adds a
+        reference to the existing file
         '''
-        with open(join(PICKLED_FILESTORE_DIRECTORY, str(self.id)), 'wb') as pickled_file:
-            pickle.dump(self._external_file, pickled_file, protocol=pickle.HIGHEST_PROTOCOL)
-        self.filepaths = {"disk_pickled": [str(self.id)]}
+        codec = self._get_codec()
+        path = PICKLED_FILESTORE.put(
+            lambda pickled_file: pickle.dump(self._external_file, pickled_file,
+                                             protocol=pickle.HIGHEST_PROTOCOL),
+            codec=codec)
+        self.filepaths = {"disk_pickled": [path], "compression": codec.to_dict()}
 
     def _load_pickle_from_disk(self):
         '''
         Shared method to load files from disk in pickled format
         '''
         pickled_id = self.filepaths['disk_pickled'][0]
-        with open(join(PICKLED_FILESTORE_DIRECTORY, pickled_id), 'rb') as pickled_file:
+        codec = codec_from_filepaths(self.filepaths)
+        with PICKLED_FILESTORE.open(pickled_id, codec=codec) as pickled_file:
             self._external_file = pickle.load(pickled_file)
 
         # Indicate externals were loaded
         self.unloaded_externals = False
 
 
-class AllSaveMixin(DataframeTableSaveMixin, DatabasePickleSaveMixin, DiskPickleSaveMixin):
+class DiskParquetSaveMixin(BaseExternalSaveMixin):
+    '''
+    Mixin class to save dataframes to disk in columnar (parquet) format
+
+    Columns are written typed and compressed. The file is memory mapped on
+    read, which avoids buffering the compressed bytes, but every column read
+    is still decompressed and converted into process memory. Selecting
+    columns is what bounds memory, unselected columns are never read
+
+    Expects the following available attributes:
+        - self._external_file
+        - self.id
+        - self.dataframe
+
+    Sets the following attributes:
+        - self.filepaths
+        - self.unloaded_externals
+    '''
+    def _save_external_files(self):
+        '''
+        Unless overwritten only use this mixin's paradigm
+        '''
+        self._save_dataframe_to_parquet()
+
+    def _load_external_files(self):
+        '''
+        Unless overwritten only use this mixin's paradigm
+        '''
+        self._load_dataframe_from_parquet()
+
+    def _save_dataframe_to_parquet(self):
+        '''
+        Shared method to save dataframe to disk in parquet format
+        '''
+        pa, pq = _import_pyarrow()
+        filename = '{}.parquet'.format(self.id)
+        table = pa.Table.from_pandas(self.dataframe, preserve_index=True)
+        pq.write_table(table, join(ensure_directory(PARQUET_FILESTORE_DIRECTORY), filename),
+                       compression=PARQUET_COMPRESSION)
+        self.filepaths = {"disk_parquet": [filename]}
+
+    def _load_dataframe_from_parquet(self):
+        '''
+        Shared method to load dataframe from disk in parquet format
+        '''
+        self._external_file = self._read_dataframe_from_parquet()
+
+        # Indicate externals were loaded
+        self.unloaded_externals = False
+
+    def _read_dataframe_from_parquet(self, columns=None):
+        '''
+        Read the dataframe (or only `columns` of it) from disk. Parquet is
+        columnar so unselected columns are never read
+        '''
+        _, pq = _import_pyarrow()
+        filename = self.filepaths['disk_parquet'][0]
+        table = pq.read_table(join(PARQUET_FILESTORE_DIRECTORY, filename), columns=columns,
+                              memory_map=True, use_pandas_metadata=True)
+        return table.to_pandas()
+
+
+class DiskMmapSaveMixin(BaseExternalSaveMixin):
+    '''
+    Mixin class to save objects to disk in pickled format with numpy arrays
+    written out of band as `.npy` files. Arrays are memory mapped on load so
+    processes scoring the same model on a host share one page cache copy
+
+    Note: objects that copy array state into their own buffers when
+    unpickled (eg cython sklearn tree structures) still allocate that copy
+
+    Expects the following available attributes:
+        - self._external_file
+        - self.id
+
+    Sets the following attributes:
+        - self.filepaths
+        - self.unloaded_externals
+    '''
+    def _save_external_files(self):
+        '''
+        Unless overwritten only use this mixin's paradigm
+        '''
+        self._save_mmap_to_disk()
+
+    def _load_external_files(self):
+        '''
+        Unless overwritten only use this mixin's paradigm
+        '''
+        self._load_mmap_from_disk()
+
+    def _save_mmap_to_disk(self):
+        '''
+        Shared method to save files to disk as a pickle plus array sidecars
+
+        Written into a temporary directory first and moved into place so
+        readers never see a partial artifact
+        '''
+        directory = str(self.id)
+        tmp_directory = tempfile.mkdtemp(dir=ensure_directory(MMAP_FILESTORE_DIRECTORY), prefix='.tmp-')
+        try:
+            with open(join(tmp_directory, 'object.pkl'), 'wb') as pickled_file:
+                dump_with_array_sidecars(self._external_file, pickled_file, tmp_directory)
+            os.rename(tmp_directory, join(MMAP_FILESTORE_DIRECTORY, directory))
+        except Exception:
+            shutil.rmtree(tmp_directory, ignore_errors=True)
+            raise
+
+        self.filepaths = {"disk_mmap": [directory]}
+
+    def _load_mmap_from_disk(self):
+        '''
+        Shared method to load files from disk, memory mapping array sidecars
+        '''
+        directory = join(MMAP_FILESTORE_DIRECTORY, self.filepaths['disk_mmap'][0])
+        with open(join(directory, 'object.pkl'), 'rb') as pickled_file:
+            self._external_file = load_with_array_sidecars(pickled_file, directory)
+
+        # Indicate externals were loaded
+        self.unloaded_externals = False
+
+
+class RemotePickleSaveMixin(BaseExternalSaveMixin):
+    '''
+    Mixin class to save objects to the configured remote filestore in
+    pickled format (see `simpleml.persistables.remote_filestore`)
+
+    Expects the following available attributes:
+        - self._external_file
+        - self.id
+
+    Sets the following attributes:
+        - self.filepaths
+        - self.unloaded_externals
+    '''
+    def _save_external_files(self):
+        '''
+        Unless overwritten only use this mixin's paradigm
+        '''
+        self._save_pickle_to_remote()
+
+    def _load_external_files(self):
+        '''
+        Unless overwritten only use this mixin's paradigm
+        '''
+        self._load_pickle_from_remote()
+
+    def _save_pickle_to_remote(self):
+        '''
+        Shared method to pickle (through the compression codec) into a local
+        spool file and upload it with a parallel multipart transfer
+        '''
+        codec = self._get_codec()
+        key = 'pickled/{}.pkl{}'.format(self.id, codec.extension)
+
+        with tempfile.TemporaryFile() as spool_file:
+            with codec.writer(spool_file) as pickled_file:
+                pickle.dump(self._external_file, pickled_file, protocol=pickle.HIGHEST_PROTOCOL)
+            spool_file.seek(0)
+            get_remote_filestore().upload(key, spool_file)
+
+        self.filepaths = {"remote_pickled": [key], "compression": codec.to_dict()}
+
+    def _load_pickle_from_remote(self):
+        '''
+        Shared method to download (in parallel, checksum verified) and
+        unpickle. Reads through the local disk cache
+        '''
+        key = self.filepaths['remote_pickled'][0]
+        codec = codec_from_filepaths(self.filepaths)
+        store = get_remote_filestore()
+
+        stored_file = self._open_through_disk_cache('remote', lambda f: store.download(key, f))
+        if stored_file is None:
+            stored_file = tempfile.TemporaryFile()
+            store.download(key, stored_file)
+            stored_file.seek(0)
+
+        with codec.reader(stored_file) as pickled_file:
+            self._external_file = pickle.load(pickled_file)
+
+        # Indicate externals were loaded
+        self.unloaded_externals = False
+
+
+class DiskDeltaSaveMixin(BaseExternalSaveMixin):
+    '''
+    Mixin class to save dataframes as deltas against the previous version
+    with the same name (see `simpleml.persistables.delta`). Storage is
+    proportional to the rows added and removed. A full snapshot is written
+    for the first version, every `delta_snapshot_interval` versions, and
+    whenever the delta does not reconstruct the dataframe exactly
+    (eg schema or dtype changes). Row hashes are stored with every version
+    so saving the next one does not load its parent. Deleting a version
+    rewrites the versions encoded against it as snapshots
+
+    Expects the following available attributes:
+        - self._external_file
+        - self.id
+        - self.name
+        - persistable table columns (name, version, has_external_files)
+
+    Sets the following attributes:
+        - self.filepaths
+        - self.unloaded_externals
+    '''
+    def _save_external_files(self):
+        '''
+        Unless overwritten only use this mixin's paradigm
+        '''
+        self._save_delta_to_disk()
+
+    def _load_external_files(self):
+        '''
+        Unless overwritten only use this mixin's paradigm
+        '''
+        self._load_delta_from_disk()
+
+    def _get_delta_parent(self):
+        '''
+        Latest saved version with the same name
+        '''
+        cls = self.__class__
+        return cls.filter(
+            cls.name == self.name,
+            cls.has_external_files == True,
+            cls.id != self.id
+        ).order_by(cls.version.desc()).first()
+
+    def _encode_against_parent(self, df, hashes):
+        '''
+        Delta payload and filepaths against the parent version, None if a
+        snapshot should be written instead. Matches rows against the row
+        hashes stored with the parent, so the parent dataframe is only
+        loaded when equal hashes do not imply equal values
+        '''
+        parent = self._get_delta_parent()
+        if parent is None or hashes is None:
+            return None
+
+        parent_filepaths = parent.filepaths or {}
+        interval = self.state.get('delta_snapshot_interval', DEFAULT_DELTA_SNAPSHOT_INTERVAL)
+        depth = parent_filepaths.get('delta_depth', 0)
+        if depth + 1 >= interval:
+            return None
+        # Parents saved another way (or before row hashes were stored) have no signature
+        if parent_filepaths.get('delta_schema') != schema_signature(df):
+            return None
+
+        with PICKLED_FILESTORE.open(parent_filepaths['delta_row_hashes'][0]) as hashes_file:
+            parent_hashes = pickle.load(hashes_file)
+        added, runs = encode_delta_from_hashes(parent_hashes, df, hashes)
+
+        # Only worth it for changes that are small relative to the frame
+        if len(added) > len(df) / 2 or len(runs) > len(df) / 4 + 2:
+            return None
+        if hashes_string_forms(df):
+            parent.load(load_externals=True)
+            if not frames_identical(apply_delta(parent._external_file, added, runs), df):
+                return None
+
+        filepaths = {'delta_parent': str(parent.id), 'delta_depth': depth + 1,
+                     'delta_added': len(added), 'delta_removed': removed_count(parent_hashes, runs)}
+        return {'added': added, 'runs': runs}, filepaths
+
+    def _save_delta_to_disk(self):
+        '''
+        Shared method to save the dataframe as a delta (or snapshot) in the
+        pickled filestore, with its row hashes for the next version to diff against
+        '''
+        df = self.dataframe
+        try:
+            hashes = row_hashes(df)
+        except TypeError:
+            # Unhashable cell values, always a snapshot
+            hashes = None
+
+        encoded = self._encode_against_parent(df, hashes)
+        if encoded is None:
+            payload, filepaths = df, {'delta_parent': None, 'delta_depth': 0}
+        else:
+            payload, filepaths = encoded
+
+        codec = self._get_codec()
+        path = PICKLED_FILESTORE.put(
+            lambda f: pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL), codec=codec)
+        filepaths.update({"disk_delta": [path], "compression": codec.to_dict()})
+
+        if hashes is not None:
+            hashes_path = PICKLED_FILESTORE.put(
+                lambda f: pickle.dump(hashes, f, protocol=pickle.HIGHEST_PROTOCOL))
+            filepaths.update({'delta_row_hashes': [hashes_path], 'delta_schema': schema_signature(df)})
+        self.filepaths = filepaths
+
+    def _load_delta_from_disk(self):
+        '''
+        Shared method to load a snapshot, or reconstruct the dataframe from
+        the parent version and the delta
+        '''
+        path = self.filepaths['disk_delta'][0]
+        with PICKLED_FILESTORE.open(path, codec=codec_from_filepaths(self.filepaths)) as pickled_file:
+            payload = pickle.load(pickled_file)
+
+        parent_id = self.filepaths.get('delta_parent')
+        if parent_id is None:
+            self._external_file = payload
+        else:
+            parent = self.__class__.find(parent_id)
+            if parent is None:
+                raise DatasetError('Delta parent {} of {} no longer exists'.format(parent_id, self.id))
+            parent.load(load_externals=True)
+            self._external_file = apply_delta(parent._external_file, payload['added'], payload['runs'])
+
+        # Indicate externals were loaded
+        self.unloaded_externals = False
+
+    def _snapshot_delta_children(self, exclude=()):
+        '''
+        Rewrite the versions encoded as deltas against this one as full
+        snapshots, so this version can be deleted. Returns the filepaths
+        replaced (to release once the changes are durable)
+
+        :param exclude: versions being deleted as well, left untouched
+        '''
+        if not (self.filepaths or {}).get('disk_delta'):
+            return []
+
+        cls = self.__class__
+        released = []
+        # Children always share the name of their parent
+        for child in cls.filter(cls.name == self.name, cls.has_external_files == True).all():
+            if child in exclude or (child.filepaths or {}).get('delta_parent') != str(self.id):
+                continue
+            child.load(load_externals=True)
+            df = child._external_file
+            codec = child._get_codec()
+            path = PICKLED_FILESTORE.put(
+                lambda f: pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL), codec=codec)
+
+            released.append(dict(child.filepaths, delta_row_hashes=[]))
+            child.filepaths = dict(child.filepaths, delta_parent=None, delta_depth=0,
+                                   disk_delta=[path], compression=codec.to_dict())
+        return released
+
+
+class AllSaveMixin(DataframeTableSaveMixin, DatabasePickleSaveMixin, DiskPickleSaveMixin,
+                   DiskParquetSaveMixin, DiskMmapSaveMixin, RemotePickleSaveMixin,
+                   DiskDeltaSaveMixin):
     def _save_external_files(self):
         '''
         Wrapper method around save mixins for different persistence patterns
@@ -231,20 +948,71 @@ class AllSaveMixin(DataframeTableSaveMixin, DatabasePickleSaveMixin, DiskPickleS
 
         if save_method == 'database':
             self._save_dataframe_to_table()
+        elif save_method == 'database_binary':
+            self._save_dataframe_to_table(copy_format='binary')
         elif save_method == 'database_pickled':
             self._save_pickle_to_database()
         elif save_method == 'disk_pickled':
             self._save_pickle_to_disk()
+        elif save_method == 'disk_parquet':
+            self._save_dataframe_to_parquet()
+        elif save_method == 'disk_mmap':
+            self._save_mmap_to_disk()
+        elif save_method == 'remote_pickled':
+            self._save_pickle_to_remote()
+        elif save_method == 'disk_delta':
+            self._save_delta_to_disk()
 
     def _load_external_files(self):
         '''
         Wrapper method around save mixins for different persistence patterns
+
+        Checks the process-wide cache of loaded externals first
+        '''
+        cache_key = str(self.id)
+        hit, external_file = EXTERNAL_FILE_CACHE.get(cache_key)
+        if hit:
+            self._external_file = external_file
+            self.unloaded_externals = False
+            return
+
+        self._load_external_files_from_storage()
+        EXTERNAL_FILE_CACHE.put(cache_key, self._external_file)
+
+    def _load_external_columns(self, columns):
         '''
+        Load only `columns` of a dataframe external. The projection is
+        pushed down to storage that supports it (tables, parquet), other
+        formats are loaded in full and sliced
+        '''
+        hit, external_file = EXTERNAL_FILE_CACHE.get(str(self.id))
+        if hit:
+            return external_file[columns]
+
         save_method = self.state['save_method']
 
-        if save_method == 'database':
+        if save_method in ('database', 'database_binary'):
+            return self._read_dataframe_from_table(columns=columns)
+        elif save_method == 'disk_parquet':
+            return self._read_dataframe_from_parquet(columns=columns)
+
+        self._load_external_files()
+        return self._external_file[columns]
+
+    def _load_external_files_from_storage(self):
+        save_method = self.state['save_method']
+
+        if save_method in ('database', 'database_binary'):
             self._load_dataframe_from_table()
         elif save_method == 'database_pickled':
             self._load_pickle_from_database()
         elif save_method == 'disk_pickled':
             self._load_pickle_from_disk()
+        elif save_method == 'disk_parquet':
+            self._load_dataframe_from_parquet()
+        elif save_method == 'disk_mmap':
+            self._load_mmap_from_disk()
+        elif save_method == 'remote_pickled':
+            self._load_pickle_from_remote()
+        elif save_method == 'disk_delta':
+            self._load_delta_from_disk()
@@ -0,0 +1,84 @@
+'''
+Pickle extensions for serializing external files
+
+Large numpy arrays are written out of band as `.npy` sidecar files next to
+the pickle stream and memory mapped back on load. Processes loading the
+same artifact on a host then share one page cache copy of the arrays
+instead of each allocating their own.
+'''
+
+__author__ = 'Elisha Yadgaran'
+
+
+import dill as pickle
+import numpy as np
+from os.path import join
+
+
+# Arrays smaller than this (bytes) stay inline in the pickle stream
+DEFAULT_MMAP_THRESHOLD = 2 ** 16
+# Copy-on-write maps: pages are shared until a process writes to them
+DEFAULT_MMAP_MODE = 'c'
+
+
+class ArraySidecarPickler(pickle.Pickler):
+    '''
+    Pickler that writes large numpy arrays to `.npy` files in `directory`
+    and only references them (by filename) in the pickle stream
+    '''
+    def __init__(self, file, directory, threshold=DEFAULT_MMAP_THRESHOLD,
+                 protocol=pickle.HIGHEST_PROTOCOL, **kwargs):
+        pickle.Pickler.__init__(self, file, protocol, **kwargs)
+        self.directory = directory
+        self.threshold = threshold
+        self.filenames = []
+        # id -> (array, filename), keeps a reference so ids are not reused
+        self._saved = {}
+
+    def persistent_id(self, obj):
+        # Subclasses (masked arrays, matrices) carry state `np.save` drops
+        if type(obj) not in (np.ndarray, np.memmap) \
+                or obj.dtype.hasobject or obj.nbytes < self.threshold:
+            return None
+
+        if id(obj) not in self._saved:
+            filename = 'array_{}.npy'.format(len(self.filenames))
+            np.save(join(self.directory, filename), obj, allow_pickle=False)
+            self.filenames.append(filename)
+            self._saved[id(obj)] = (obj, filename)
+
+        return ('ndarray', self._saved[id(obj)][1])
+
+
+class ArraySidecarUnpickler(pickle.Unpickler):
+    '''
+    Unpickler counterpart to `ArraySidecarPickler`. Arrays are memory
+    mapped from the sidecar files in `directory`
+    '''
+    def __init__(self, file, directory, mmap_mode=DEFAULT_MMAP_MODE, **kwargs):
+        pickle.Unpickler.__init__(self, file, **kwargs)
+        self.directory = directory
+        self.mmap_mode = mmap_mode
+
+    def persistent_load(self, pid):
+        kind, filename = pid
+        if kind != 'ndarray':
+            raise pickle.UnpicklingError('Unsupported persistent id: {}'.format(pid))
+        return np.load(join(self.directory, filename), mmap_mode=self.mmap_mode, allow_pickle=False)
+
+
+def dump_with_array_sidecars(obj, file, directory, threshold=DEFAULT_MMAP_THRESHOLD):
+    '''
+    Pickle obj into file with large arrays as sidecar files in directory.
+    Returns the list of sidecar filenames
+    '''
+    pickler = ArraySidecarPickler(file, directory, threshold=threshold)
+    pickler.dump(obj)
+    return pickler.filenames
+
+
+def load_with_array_sidecars(file, directory, mmap_mode=DEFAULT_MMAP_MODE):
+    '''
+    Unpickle obj from file, memory mapping sidecar arrays from directory
+    '''
+    return ArraySidecarUnpickler(file, directory, mmap_mode=mmap_mode).load()
@@ -0,0 +1,97 @@
+'''
+Base file-like stream helpers shared by the persistence layer
+'''
+
+__author__ = 'Elisha Yadgaran'
+
+
+class ChunkedReader(object):
+    '''
+    Read-only file-like object over a sequence of byte chunks
+
+    Subclasses implement `_next_chunk`, returning the next chunk of bytes
+    or None at the end of the stream. Implements `read` and `readline`
+    (as required by pickle and psycopg2 `copy_from`)
+    '''
+    def __init__(self):
+        self._buffer = ''
+        self._offset = 0
+        self._exhausted = False
+
+    def _next_chunk(self):
+        raise NotImplementedError
+
+    def _fill(self):
+        '''
+        Make sure the internal buffer has unread bytes, returns False
+        when the stream is exhausted
+        '''
+        while self._offset >= len(self._buffer):
+            if self._exhausted:
+                return False
+
+            chunk = self._next_chunk()
+            if chunk is None:
+                self._exhausted = True
+                return False
+
+            self._buffer = chunk
+            self._offset = 0
+
+        return True
+
+    def read(self, size=-1):
+        '''
+        File-like read. Returns up to `size` bytes (all remaining bytes
+        if size is negative) and an empty string at the end of the stream
+        '''
+        pieces = []
+        remaining = size
+
+        while remaining != 0 and self._fill():
+            if remaining < 0:
+                end = len(self._buffer)
+            else:
+                end = min(self._offset + remaining, len(self._buffer))
+                remaining -= end - self._offset
+
+            pieces.append(self._buffer[self._offset:end])
+            self._offset = end
+
+        return ''.join(pieces)
+
+    def readline(self, size=-1):
+        '''
+        File-like readline. Returns bytes up to and including the next newline
+        '''
+        pieces = []
+        remaining = size
+
+        while remaining != 0 and self._fill():
+            newline = self._buffer.find('\n', self._offset)
+            end = len(self._buffer) if newline == -1 else newline + 1
+            if remaining > 0:
+                end = min(end, self._offset + remaining)
+                remaining -= end - self._offset
+
+            pieces.append(self._buffer[self._offset:end])
+            self._offset = end
+
+            if pieces[-1].endswith('\n'):
+                break
+
+        return ''.join(pieces)
+
+    def close(self):
+        '''
+        Release buffered bytes
+        '''
+        self._exhausted = True
+        self._buffer = ''
+        self._offset = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,103 @@
+'''
+Per name version allocation for persistables
+
+Versions come from a counter row per (table, name[, scope]) that is incremented
+atomically, instead of `select max(version)` followed by an insert. The
+row lock is held only for the increment, so concurrent workers saving the
+same name never allocate the same version or retry on the unique
+constraint. A failed save leaves a gap in the version sequence
+
+Tables versioned over more than the name (eg metrics, per name and model)
+pass the extra columns as `scope`; they are part of the counter key
+'''
+
+from simpleml.persistables.base_sqlalchemy import BaseSQLAlchemy
+from sqlalchemy import MetaData, Column, String, Integer, select, func, and_
+from sqlalchemy.dialects.postgresql import insert as postgres_insert
+from sqlalchemy.exc import IntegrityError
+
+__author__ = 'Elisha Yadgaran'
+
+
+class VersionCounter(BaseSQLAlchemy):
+    __tablename__ = 'persistable_versions'
+    metadata = MetaData()
+
+    table_name = Column(String, primary_key=True)
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False)
+
+    @classmethod
+    def allocate(cls, table, name, **scope):
+        '''
+        Next version of `name` in persistable `table`. Counters start after
+        the existing versions of the name, so tables populated before the
+        counter existed continue their sequence
+
+        :param scope: additional `column=value` pairs versions are
+            constrained over (eg `model_id=model.id` for metrics)
+        '''
+        engine = cls.metadata.bind
+        if engine.dialect.name == 'postgresql':
+            return cls._allocate_returning(engine, table, name, scope)
+        return cls._allocate_generic(engine, table, name, scope)
+
+    @staticmethod
+    def _counter_key(name, scope):
+        '''
+        Counter row name, the persistable name qualified by the scope values
+        '''
+        return ':'.join([name] + ['{}={}'.format(column, scope[column]) for column in sorted(scope)])
+
+    @classmethod
+    def _counter_filter(cls, table, name, scope):
+        counter = cls.__table__
+        return and_(counter.c.table_name == table.name, counter.c.name == cls._counter_key(name, scope))
+
+    @staticmethod
+    def _seed(table, name, scope):
+        filters = [table.c.name == name] + [table.c[column] == value for column, value in scope.items()]
+        return select([func.coalesce(func.max(table.c.version), 0) + 1]).where(and_(*filters)).as_scalar()
+
+    @classmethod
+    def _allocate_returning(cls, engine, table, name, scope):
+        '''
+        `update ... returning`, falling back to an upsert for the first
+        version of a name. One statement (one round trip) in the common case
+        '''
+        counter = cls.__table__
+        with engine.begin() as connection:
+            version = connection.execute(
+                counter.update().where(cls._counter_filter(table, name, scope))
+                .values(version=counter.c.version + 1).returning(counter.c.version)).scalar()
+            if version is not None:
+                return version
+
+            upsert = postgres_insert(counter).values(
+                table_name=table.name, name=cls._counter_key(name, scope), version=cls._seed(table, name, scope))
+            return connection.execute(upsert.on_conflict_do_update(
+                index_elements=[counter.c.table_name, counter.c.name],
+                set_={'version': counter.c.version + 1}).returning(counter.c.version)).scalar()
+
+    @classmethod
+    def _allocate_generic(cls, engine, table, name, scope):
+        '''
+        Increment and read back in one transaction for backends without
+        `returning` (the update takes the write lock before the read).
+        Concurrent first inserts of a name retry as an increment
+        '''
+        counter = cls.__table__
+        while True:
+            try:
+                with engine.begin() as connection:
+                    updated = connection.execute(
+                        counter.update().where(cls._counter_filter(table, name, scope))
+                        .values(version=counter.c.version + 1)).rowcount
+                    if not updated:
+                        connection.execute(counter.insert().values(
+                            table_name=table.name, name=cls._counter_key(name, scope),
+                            version=cls._seed(table, name, scope)))
+                    return connection.execute(
+                        select([counter.c.version]).where(cls._counter_filter(table, name, scope))).scalar()
+            except IntegrityError:
+                continue
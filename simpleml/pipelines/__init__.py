@@ -1,9 +1,9 @@
 '''
-Import modules to register class names in global registry
+Modules imported on demand (see `Registry.get`) to register class
+names in global registry
 '''
-import base_pipeline
-import dataset_pipelines
-import production_pipelines
-
 
 __author__ = 'Elisha Yadgaran'
+
+
+REGISTRY_MODULES = ['base_pipeline', 'dataset_pipelines', 'production_pipelines']
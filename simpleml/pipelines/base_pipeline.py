@@ -1,10 +1,9 @@
 from simpleml.persistables.base_persistable import BasePersistable
 from simpleml.persistables.saving import AllSaveMixin
-from simpleml.pipelines.external_pipelines import DefaultPipeline, SklearnPipeline
 from simpleml.pipelines.validation_split_mixins import TRAIN_SPLIT
 from simpleml.utils.errors import PipelineError
 from sqlalchemy import Column
-from sqlalchemy.dialects.postgresql import JSONB
+from simpleml.persistables.json_type import JSONType
 import logging
 
 __author__ = 'Elisha Yadgaran'
@@ -26,7 +25,7 @@ class BasePipeline(BasePersistable, AllSaveMixin):
     __abstract__ = True
 
     # Additional pipeline specific metadata
-    params = Column(JSONB, default={})
+    params = Column(JSONType, default={})
 
     def __init__(self, has_external_files=True, transformers=[],
                  **kwargs):
@@ -63,6 +62,9 @@ class BasePipeline(BasePersistable, AllSaveMixin):
 
         :param external_pipeline_class: str of class to use, can be 'default' or 'sklearn'
         '''
+        # Imported on use to keep sklearn out of `import simpleml`
+        from simpleml.pipelines.external_pipelines import DefaultPipeline, SklearnPipeline
+
         if external_pipeline_class == 'default':
             return DefaultPipeline(transformers)
         elif external_pipeline_class == 'sklearn':
@@ -105,7 +107,7 @@ class BasePipeline(BasePersistable, AllSaveMixin):
         transformer_params = self.get_params()
         pipeline_config = self.config
 
-        return hash(self.custom_hasher((dataset_hash, transformers, transformer_params, pipeline_config)))
+        return self.custom_hasher((dataset_hash, transformers, transformer_params, pipeline_config))
 
     def save(self, **kwargs):
         '''
@@ -10,7 +10,6 @@ __author__ = 'Elisha Yadgaran'
 
 
 from abc import ABCMeta, abstractmethod
-from sklearn.model_selection import train_test_split
 
 
 TRAIN_SPLIT = 'TRAIN'
@@ -36,10 +35,11 @@ class NoSplitMixin(SplitMixin):
 
         TODO: Work in support for generators (k-fold)
         '''
+        X, y = self.dataset.X, self.dataset.y
         return {
-            TRAIN_SPLIT: (self.dataset.X, self.dataset.y),
-            VALIDATION_SPLIT: (self.dataset.X.head(0), self.dataset.y.head(0)),
-            TEST_SPLIT: (self.dataset.X.head(0), self.dataset.y.head(0))
+            TRAIN_SPLIT: (X, y),
+            VALIDATION_SPLIT: (X.head(0), y.head(0)),
+            TEST_SPLIT: (X.head(0), y.head(0))
         }
 
 
@@ -74,6 +74,9 @@ class RandomSplitMixin(SplitMixin):
         '''
         Overwrite method to split by percentage
         '''
+        # Imported on use to keep sklearn out of `import simpleml`
+        from sklearn.model_selection import train_test_split
+
         train_size = self.config.get('train_size')
         validation_size = self.config.get('validation_size')
         test_size = self.config.get('test_size')
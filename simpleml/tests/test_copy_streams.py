@@ -0,0 +1,113 @@
+from simpleml.persistables.copy_streams import DataframeCopyStream, PGCOPY_HEADER, PGCOPY_TRAILER,\
+    encode_binary_chunk, decode_binary_copy
+import numpy as np
+import pandas as pd
+import unittest
+
+
+def encode_csv(chunk):
+    return chunk.to_csv(None, sep='|', header=False, index=False)
+
+
+class DataframeCopyStreamTests(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({'a': np.arange(7), 'b': ['row {}'.format(i) for i in range(7)]},
+                               columns=['a', 'b'])
+        self.expected = 'header\n' + encode_csv(self.df) + 'footer'
+
+    def stream(self, threaded, encoder=encode_csv):
+        return DataframeCopyStream(self.df, encoder, chunksize=2, max_queued_chunks=1, threaded=threaded,
+                                   header='header\n', footer='footer')
+
+    def test_reads_span_chunk_boundaries(self):
+        for threaded in (True, False):
+            with self.stream(threaded) as stream:
+                pieces = []
+                while True:
+                    piece = stream.read(3)
+                    if not piece:
+                        break
+                    self.assertLessEqual(len(piece), 3)
+                    pieces.append(piece)
+            self.assertEqual(''.join(pieces), self.expected)
+
+            with self.stream(threaded) as stream:
+                self.assertEqual(stream.read(), self.expected)
+                self.assertEqual(stream.read(), '')
+
+    def test_readline_returns_whole_lines(self):
+        for threaded in (True, False):
+            with self.stream(threaded) as stream:
+                lines = list(iter(stream.readline, ''))
+            self.assertEqual(lines, self.expected.splitlines(True))
+
+            with self.stream(threaded) as stream:
+                self.assertEqual(stream.readline(3), 'hea')
+                self.assertEqual(stream.readline(), 'der\n')
+
+    def test_producer_errors_are_raised_to_the_reader(self):
+        def failing_encoder(chunk):
+            if chunk.index[0] >= 4:
+                raise ValueError('Unable to encode')
+            return encode_csv(chunk)
+
+        for threaded in (True, False):
+            with self.stream(threaded, failing_encoder) as stream:
+                self.assertEqual(stream.readline(), 'header\n')
+                with self.assertRaises(ValueError):
+                    stream.read()
+
+    def test_close_stops_a_blocked_producer(self):
+        stream = self.stream(True)
+        self.assertEqual(stream.read(1), 'h')
+        stream.close()
+        self.assertFalse(stream._thread.is_alive())
+        self.assertEqual(stream.read(), '')
+
+
+class BinaryCopyTests(unittest.TestCase):
+    def roundtrip(self, df, type_oids):
+        payload = PGCOPY_HEADER + encode_binary_chunk(df, type_oids) + PGCOPY_TRAILER
+        return decode_binary_copy(payload, list(df.columns), type_oids)
+
+    def test_fixed_width_roundtrip(self):
+        df = pd.DataFrame({'a': np.arange(5, dtype=np.int64), 'b': np.linspace(0, 1, 5),
+                           'c': [True, False] * 2 + [True]}, columns=['a', 'b', 'c'])
+        pd.util.testing.assert_frame_equal(self.roundtrip(df, [20, 701, 16]), df)
+
+    def test_nulls_text_and_timestamps_roundtrip(self):
+        df = pd.DataFrame({
+            'a': [1., None, 3.],
+            'flag': [True, None, False],
+            'text': [u'a|b\tc\nd', None, u'caf\xe9'],
+            'when': pd.to_datetime(['2018-01-01 12:30:00.000001', None, '1999-12-31']),
+            'utc': pd.to_datetime(['2018-01-01', '2018-06-01', None]).tz_localize('UTC'),
+        }, columns=['a', 'flag', 'text', 'when', 'utc'])
+        decoded = self.roundtrip(df, [701, 16, 25, 1114, 1184])
+
+        pd.util.testing.assert_frame_equal(decoded, df)
+        self.assertEqual(decoded['text'].iloc[0], u'a|b\tc\nd')
+
+    def test_values_are_cast_to_the_column_type(self):
+        df = pd.DataFrame({'a': [1., 2.], 'b': np.array([1, 2], dtype=np.int64)})
+        decoded = self.roundtrip(df, [23, 701])
+        self.assertEqual(list(decoded['a']), [1, 2])
+        self.assertEqual(decoded['a'].dtype, np.int32)
+        self.assertEqual(decoded['b'].dtype, np.float64)
+
+    def test_lossy_integer_casts_raise(self):
+        for values in ([1.5, 2.], [np.nan, 1.], [np.inf, 1.]):
+            with self.assertRaises(ValueError):
+                encode_binary_chunk(pd.DataFrame({'a': values}), [20])
+
+    def test_out_of_range_values_raise(self):
+        with self.assertRaises(ValueError):
+            encode_binary_chunk(pd.DataFrame({'a': np.array([2 ** 40], dtype=np.int64)}), [23])
+        with self.assertRaises(ValueError):
+            encode_binary_chunk(pd.DataFrame({'a': [2. ** 16]}), [21])
+        with self.assertRaises(TypeError):
+            encode_binary_chunk(pd.DataFrame({'a': [1]}), [1700])
+
+
+if __name__ == '__main__':
+    unittest.main()
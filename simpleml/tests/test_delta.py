@@ -0,0 +1,41 @@
+from simpleml.persistables.delta import encode_delta, encode_delta_from_hashes, apply_delta, frames_identical,\
+    removed_count, row_hashes, schema_signature, hashes_string_forms
+import numpy as np
+import pandas as pd
+import unittest
+
+
+class DeltaEncodingTests(unittest.TestCase):
+    def setUp(self):
+        self.parent = pd.DataFrame({'a': np.arange(100), 'b': np.random.rand(100)})
+
+    def test_appended_rows_encode_as_two_runs(self):
+        appended = pd.DataFrame({'a': [100, 101], 'b': [0.5, 0.25]}, index=[100, 101])
+        df = pd.concat([self.parent.iloc[10:], appended])
+        added, runs = encode_delta(self.parent, df)
+
+        self.assertEqual(len(added), 2)
+        self.assertEqual(len(runs), 2)
+        self.assertEqual(removed_count(self.parent, runs), 10)
+        self.assertTrue(frames_identical(apply_delta(self.parent, added, runs), df))
+
+    def test_reordered_and_duplicated_rows_reconstruct(self):
+        df = self.parent.iloc[[5, 3, 3, 99, 0]]
+        added, runs = encode_delta(self.parent, df)
+
+        self.assertEqual(len(added), 1)
+        self.assertTrue(frames_identical(apply_delta(self.parent, added, runs), df))
+
+    def test_encode_from_stored_hashes(self):
+        df = self.parent.iloc[::2]
+        added, runs = encode_delta_from_hashes(row_hashes(self.parent), df, row_hashes(df))
+
+        self.assertEqual(len(added), 0)
+        self.assertEqual(removed_count(row_hashes(self.parent), runs), 50)
+        self.assertTrue(frames_identical(apply_delta(self.parent, added, runs), df))
+
+    def test_schema_signature_tracks_dtypes(self):
+        self.assertEqual(schema_signature(self.parent), schema_signature(self.parent.iloc[:10]))
+        self.assertNotEqual(schema_signature(self.parent), schema_signature(self.parent.astype(float)))
+        self.assertFalse(hashes_string_forms(self.parent))
+        self.assertTrue(hashes_string_forms(self.parent.astype(object)))
@@ -0,0 +1,36 @@
+from simpleml.persistables import external_cache
+from simpleml.persistables.external_cache import ExternalFileCache
+import unittest
+
+
+class ExternalFileCacheTests(unittest.TestCase):
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = ExternalFileCache(max_bytes=100)
+        cache.put('a', 'a', size=40)
+        cache.put('b', 'b', size=40)
+        cache.get('a')
+        cache.put('c', 'c', size=40)
+
+        self.assertEqual(cache.get('b'), (False, None))
+        self.assertEqual(cache.get('a'), (True, 'a'))
+        self.assertEqual(cache.get('c'), (True, 'c'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['bytes'], 80)
+
+    def test_values_over_budget_are_not_cached(self):
+        cache = ExternalFileCache(max_bytes=100)
+        self.assertFalse(cache.put('a', 'a', size=101))
+        self.assertEqual(cache.get('a'), (False, None))
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_disabled_cache_skips_size_estimate(self):
+        def estimate_size(obj):
+            raise AssertionError('estimated size with the cache disabled')
+
+        original, external_cache.estimate_size = external_cache.estimate_size, estimate_size
+        try:
+            cache = ExternalFileCache(max_bytes=0)
+            self.assertFalse(cache.put('a', 'a'))
+        finally:
+            external_cache.estimate_size = original
+        self.assertEqual(cache.stats()['entries'], 0)
@@ -0,0 +1,100 @@
+from simpleml.persistables.filestore import ContentAddressedFilestore, LocalDiskCache
+from simpleml.persistables.compression import get_codec
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class ContentAddressedFilestoreTests(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = ContentAddressedFilestore(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_identical_content_is_stored_once(self):
+        path1 = self.store.put(lambda f: f.write('content'))
+        modified = os.path.getmtime(self.store.absolute_path(path1))
+        path2 = self.store.put(lambda f: f.write('content'))
+
+        self.assertEqual(path1, path2)
+        self.assertEqual(os.path.getmtime(self.store.absolute_path(path2)), modified)
+        self.assertEqual(self.store.references(path1), 2)
+
+    def test_different_content_is_stored_separately(self):
+        path1 = self.store.put(lambda f: f.write('content'))
+        path2 = self.store.put(lambda f: f.write('other content'))
+
+        self.assertNotEqual(path1, path2)
+        with self.store.open(path2) as f:
+            self.assertEqual(f.read(), 'other content')
+
+    def test_release_deletes_unreferenced_content(self):
+        path = self.store.put(lambda f: f.write('content'))
+        self.store.put(lambda f: f.write('content'))
+
+        self.assertEqual(self.store.release(path), 1)
+        self.assertTrue(self.store.exists(path))
+        self.assertEqual(self.store.release(path), 0)
+        self.assertFalse(self.store.exists(path))
+
+    def test_failed_write_does_not_leak_reference(self):
+        def writer(f):
+            f.write('content')
+            raise IOError('disk full')
+
+        with self.assertRaises(IOError):
+            self.store.put(writer)
+        path = self.store.relative_path(self.store.digest(lambda f: f.write('content')), get_codec())
+        self.assertEqual(self.store.references(path), 0)
+        self.assertFalse(self.store.exists(path))
+        self.assertEqual([i for i in os.listdir(self.root) if i.startswith('.tmp-')], [])
+
+    def test_content_is_serialized_once(self):
+        calls = []
+
+        def writer(f):
+            calls.append(f)
+            f.write('content')
+
+        path1 = self.store.put(writer, codec=get_codec('gzip'))
+        path2 = self.store.put(writer, codec=get_codec('gzip'))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(path1, path2)
+        self.assertEqual(self.store.references(path1), 2)
+        self.assertEqual([i for i in os.listdir(self.root) if i.startswith('.tmp-')], [])
+        with self.store.open(path1, codec=get_codec('gzip')) as f:
+            self.assertEqual(f.read(), 'content')
+
+
+class LocalDiskCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache = LocalDiskCache(self.root, max_bytes=10)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_miss_then_hit(self):
+        self.assertIsNone(self.cache.open('key'))
+        self.cache.put('key', lambda f: f.write('content'))
+        with self.cache.open('key') as f:
+            self.assertEqual(f.read(), 'content')
+
+    def test_least_recently_used_entries_are_evicted(self):
+        self.cache.put('old', lambda f: f.write('12345'))
+        os.utime(self.cache.absolute_path('old'), (0, 0))
+        self.cache.put('new', lambda f: f.write('123456'))
+
+        self.assertIsNone(self.cache.open('old'))
+        with self.cache.open('new') as f:
+            self.assertEqual(f.read(), '123456')
+
+    def test_content_over_budget_is_not_cached(self):
+        self.cache.put('small', lambda f: f.write('12345'))
+        self.assertFalse(self.cache.put('large', lambda f: f.write('12345678901')))
+
+        self.assertIsNone(self.cache.open('large'))
+        self.assertEqual(os.listdir(self.root), ['small'])
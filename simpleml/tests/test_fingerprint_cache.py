@@ -0,0 +1,83 @@
+from simpleml.persistables import fingerprint_cache
+from simpleml.persistables.fingerprint_cache import FingerprintCache, file_source_identity, fingerprint_key
+from simpleml.datasets.raw_datasets.csv_raw_dataset import CSVRawDataset
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class FingerprintCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = FingerprintCache(os.path.join(self.directory, 'fingerprints.sqlite'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_hash_roundtrip(self):
+        key = fingerprint_key('RawDataset', {'label_columns': []}, ('query', 'select 1', '10'))
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, -1234567890123456789)
+        self.assertEqual(FingerprintCache(self.cache.path).get(key), -1234567890123456789)
+
+        self.cache.invalidate(key)
+        self.assertIsNone(self.cache.get(key))
+
+    def test_file_identity_changes_with_content(self):
+        path = os.path.join(self.directory, 'data.csv')
+        with open(path, 'w') as f:
+            f.write('a,b\n1,2\n')
+        identity = file_source_identity(path)
+        self.assertEqual(identity, file_source_identity(path))
+
+        with open(path, 'a') as f:
+            f.write('3,4\n')
+        self.assertNotEqual(identity, file_source_identity(path))
+
+
+class CSVRawDatasetTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'data.csv')
+        with open(self.path, 'w') as f:
+            f.write('a,b\n1,2\n')
+        self.original_cache = fingerprint_cache.FINGERPRINT_CACHE
+        fingerprint_cache.FINGERPRINT_CACHE = FingerprintCache(os.path.join(self.directory, 'fingerprints.sqlite'))
+
+    def tearDown(self):
+        fingerprint_cache.FINGERPRINT_CACHE = self.original_cache
+        shutil.rmtree(self.directory)
+
+    def memoized_hash(self):
+        dataset = CSVRawDataset(name='csv', filepath=self.path)
+        builds = []
+        build_dataframe = dataset.build_dataframe
+
+        def counting_build():
+            builds.append(1)
+            build_dataframe()
+
+        dataset.build_dataframe = counting_build
+        return dataset._memoized_hash(), len(builds)
+
+    def test_hash_is_memoized_until_the_file_changes(self):
+        hash_, builds = self.memoized_hash()
+        self.assertEqual(builds, 1)
+        self.assertEqual(self.memoized_hash(), (hash_, 0))
+
+        with open(self.path, 'a') as f:
+            f.write('3,4\n')
+        new_hash, builds = self.memoized_hash()
+        self.assertEqual(builds, 1)
+        self.assertNotEqual(new_hash, hash_)
+
+    def test_key_includes_the_build_code(self):
+        dataset = CSVRawDataset(name='csv', filepath=self.path)
+        key = dataset._fingerprint_key()
+        dataset._build_identity = lambda: 'def build_dataframe(self): pass'
+        self.assertNotEqual(dataset._fingerprint_key(), key)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+from simpleml.persistables.hashing import CustomHasherMixin, dataframe_block_digests,\
+    dataframe_fingerprint, changed_blocks
+import datetime
+import numpy as np
+import pandas as pd
+import scipy.sparse as sparse
+import subprocess
+import sys
+import unittest
+
+
+STABILITY_SCRIPT = '''
+from simpleml.persistables.hashing import CustomHasherMixin
+print(CustomHasherMixin().custom_hasher({'name': 'model', 'params': {'a': [1, 2.5, None], 'b': set(['x', 'y'])}}))
+'''
+
+
+class CustomHasherTests(unittest.TestCase):
+    def setUp(self):
+        self.hasher = CustomHasherMixin().custom_hasher
+
+    def test_hash_is_stable_across_processes(self):
+        # -R randomizes string hashing, like the default on python 3
+        digests = set(subprocess.check_output([sys.executable, '-R', '-c', STABILITY_SCRIPT]).strip()
+                      for _ in range(2))
+        self.assertEqual(len(digests), 1)
+
+    def test_dict_and_set_order_is_ignored(self):
+        self.assertEqual(self.hasher({'a': 1, 'b': 2}), self.hasher(dict([('b', 2), ('a', 1)])))
+        self.assertEqual(self.hasher(set(range(100))), self.hasher(set(reversed(range(100)))))
+
+    def test_equal_values_across_types(self):
+        self.assertEqual(self.hasher('abc'), self.hasher(u'abc'))
+        self.assertEqual(self.hasher(1), self.hasher(np.int64(1)))
+        self.assertEqual(self.hasher(1.5), self.hasher(np.float32(1.5)))
+
+    def test_structure_is_encoded(self):
+        self.assertNotEqual(self.hasher(1), self.hasher('1'))
+        self.assertNotEqual(self.hasher([1, [2]]), self.hasher([[1], 2]))
+        self.assertNotEqual(self.hasher(['ab', 'c']), self.hasher(['a', 'bc']))
+
+    def test_dataframe_hash_ignores_index(self):
+        df = pd.DataFrame({'a': range(10), 'b': list('abcdefghij')})
+        self.assertEqual(self.hasher(df), self.hasher(df.set_index(df.index + 5)))
+        self.assertNotEqual(self.hasher(df), self.hasher(df.iloc[::-1].reset_index(drop=True)))
+
+    def test_arrays_hash_by_content(self):
+        array = np.arange(12, dtype=np.float64).reshape(3, 4)
+        self.assertEqual(self.hasher(array), self.hasher(np.asfortranarray(array)))
+        self.assertEqual(self.hasher({'weights': array}), self.hasher({'weights': array.copy()}))
+        self.assertNotEqual(self.hasher(array), self.hasher(array.reshape(4, 3)))
+        self.assertNotEqual(self.hasher(array), self.hasher(array.astype(np.float32)))
+        self.assertEqual(self.hasher(np.array(['a', None], dtype=object)),
+                         self.hasher(np.array([u'a', None], dtype=object)))
+
+    def test_sparse_matrices_hash_by_content(self):
+        dense = np.array([[0, 1, 0], [2, 0, 3]])
+        matrix = sparse.csr_matrix(dense)
+        self.assertEqual(self.hasher(matrix), self.hasher(sparse.coo_matrix(dense)))
+        # Duplicate, unsorted entries of the same matrix
+        duplicated = sparse.csr_matrix((np.array([1, 0, 3, 2]), [1, 1, 2, 0], [0, 2, 4]), shape=(2, 3))
+        self.assertEqual(self.hasher(matrix), self.hasher(duplicated))
+        self.assertNotEqual(self.hasher(matrix), self.hasher(matrix * 2))
+
+    def test_objects_without_stable_state_are_rejected(self):
+        class Slotted(object):
+            __slots__ = ('value',)
+
+        class Stateful(Slotted):
+            __slots__ = ()
+
+            def __getstate__(self):
+                return {'value': self.value}
+
+        stateful = Stateful()
+        stateful.value = 1
+        self.assertRaises(TypeError, self.hasher, Slotted())
+        self.assertEqual(self.hasher(stateful), self.hasher(stateful))
+        self.assertEqual(self.hasher(datetime.date(2020, 1, 1)), self.hasher(datetime.date(2020, 1, 1)))
+
+
+class DataframeBlockDigestTests(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({'a': np.arange(1000), 'b': np.arange(1000) * 0.5,
+                                'c': ['row_{}'.format(i) for i in range(1000)]})
+
+    def test_fingerprint_does_not_depend_on_workers(self):
+        self.assertEqual(dataframe_fingerprint(self.df, block_rows=100, workers=1),
+                         dataframe_fingerprint(self.df, block_rows=100, workers=4))
+
+    def test_changed_blocks_locate_the_change(self):
+        changed = self.df.copy()
+        changed.loc[450, 'c'] = 'edited'
+        changed = changed.append(self.df.iloc[:10], ignore_index=True)
+
+        self.assertEqual(changed_blocks(dataframe_block_digests(self.df, block_rows=100, workers=2),
+                                        dataframe_block_digests(changed, block_rows=100, workers=2)),
+                         [4, 10])
+
+    def test_column_names_and_dtypes_are_hashed(self):
+        self.assertNotEqual(dataframe_fingerprint(self.df), dataframe_fingerprint(self.df.rename(columns={'a': 'z'})))
+        self.assertNotEqual(dataframe_fingerprint(self.df), dataframe_fingerprint(self.df.astype({'a': 'int32'})))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,19 @@
+from simpleml.utils.initialization import Database
+import unittest
+
+
+class DatabaseEngineTests(unittest.TestCase):
+    def test_engine_is_shared_per_url_and_pool(self):
+        database = Database(database='SimpleMLEngineTest')
+        self.assertIs(database.engine, database.engine)
+        self.assertIs(database.engine, Database(database='SimpleMLEngineTest').engine)
+        self.assertIsNot(database.engine, Database(database='SimpleMLEngineTest', pool_size=1).engine)
+
+    def test_pool_settings_are_applied(self):
+        engine = Database(database='SimpleMLEngineTest', pool_size=3, max_overflow=2).engine
+        self.assertEqual(engine.pool.size(), 3)
+        self.assertEqual(engine.pool._max_overflow, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
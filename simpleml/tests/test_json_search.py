@@ -0,0 +1,77 @@
+from simpleml.persistables.json_search import parse_predicate, json_predicates, create_postgres_indexes
+from simpleml.models.base_model import BaseModel
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql, sqlite
+import unittest
+
+
+class JsonPredicateTests(unittest.TestCase):
+    def compile(self, predicates, dialect):
+        return [str(i.compile(dialect=dialect)) for i in
+                json_predicates(BaseModel.params, predicates, dialect.name)]
+
+    def test_parse_predicate(self):
+        self.assertEqual(parse_predicate('max_depth__gt'), ('max_depth', 'gt'))
+        self.assertEqual(parse_predicate('max_depth'), ('max_depth', 'eq'))
+        self.assertEqual(parse_predicate('class__weight'), ('class__weight', 'eq'))
+
+    def test_postgres_equality_uses_containment(self):
+        compiled = self.compile({'criterion': 'gini', 'max_depth__gt': 10}, postgresql.dialect())
+        self.assertEqual(len(compiled), 2)
+        self.assertIn('CAST((models.params ->> %(params_1)s) AS FLOAT) >', compiled[0])
+        self.assertIn('models.params @> CAST(', compiled[1])
+
+    def test_postgres_structured_and_null_values_use_equality(self):
+        compiled = self.compile({'hidden_layer_sizes': [10], 'class_weight': None}, postgresql.dialect())
+        self.assertEqual(len(compiled), 2)
+        self.assertFalse(any('@>' in i for i in compiled))
+        self.assertTrue(any(') = CAST(' in i and 'AS JSONB)' in i for i in compiled))
+        self.assertTrue(any(i.endswith('IS NULL') for i in compiled))
+
+    def test_other_dialects_extract(self):
+        compiled = self.compile({'criterion': 'gini', 'max_depth__lte': 10}, sqlite.dialect())
+        self.assertTrue(all(i.startswith('JSON_EXTRACT(models.params') for i in compiled))
+
+
+class FakePostgresConnection(object):
+    '''
+    Records statements, reports `existing` as the indexes in the database
+    '''
+    def __init__(self, existing=()):
+        self.dialect = postgresql.dialect()
+        self.existing = existing
+        self.statements = []
+
+    def execute(self, statement):
+        self.statements.append(statement)
+        if 'pg_indexes' in statement:
+            return [(i,) for i in self.existing]
+
+
+class PostgresIndexTests(unittest.TestCase):
+    def test_missing_indexes_are_created_concurrently(self):
+        connection = FakePostgresConnection(existing=['models_metadata_gin_index'])
+        create_postgres_indexes(connection, BaseModel.metadata)
+
+        created = connection.statements[1:]
+        self.assertIn('CREATE INDEX CONCURRENTLY IF NOT EXISTS "models_params_gin_index" ON "models" '
+                      'USING gin ("params" jsonb_path_ops)', created)
+        self.assertFalse(any('models_metadata_gin_index' in i for i in created))
+
+    def test_new_tables_create_indexes_with_the_table(self):
+        statements = []
+        engine = create_engine('postgresql://', strategy='mock',
+                               executor=lambda sql, *args, **kwargs: statements.append(str(sql)))
+        BaseModel.__table__.create(bind=engine)
+        self.assertIn('CREATE INDEX IF NOT EXISTS "models_params_gin_index" ON "models" '
+                      'USING gin ("params" jsonb_path_ops)', statements)
+
+    def test_other_dialects_are_skipped(self):
+        connection = FakePostgresConnection()
+        connection.dialect = sqlite.dialect()
+        create_postgres_indexes(connection, BaseModel.metadata)
+        self.assertEqual(connection.statements, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,9 @@
+from simpleml.persistables.meta_registry import Registry
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
 
 
@@ -10,3 +16,50 @@ class MetaClassTests(unittest.TestCase):
 
     def test_duplicate_class_error(self):
         pass
+
+    def test_lazy_registration(self):
+        # Fresh interpreter so no persistable modules are imported yet
+        script = '\n'.join([
+            'import sys',
+            'import simpleml',
+            'from simpleml.persistables.meta_registry import SIMPLEML_REGISTRY',
+            'assert "sklearn" not in sys.modules',
+            'assert "SklearnAdaBoostClassifier" not in SIMPLEML_REGISTRY.registry',
+            'cls = SIMPLEML_REGISTRY.get("SklearnAdaBoostClassifier")',
+            'assert cls.__module__ == "simpleml.models.classifiers.sklearn.ensemble"',
+            'assert SIMPLEML_REGISTRY.get("UnknownClass") is None',
+        ])
+        subprocess.check_call([sys.executable, '-c', script])
+
+    def test_registration_from_module_path(self):
+        # Only the stored module is imported; unknown modules fall back to
+        # the lazy packages
+        script = '\n'.join([
+            'import sys',
+            'from simpleml.persistables.meta_registry import SIMPLEML_REGISTRY',
+            'module = "simpleml.models.classifiers.sklearn.ensemble"',
+            'cls = SIMPLEML_REGISTRY.get("SklearnAdaBoostClassifier", module)',
+            'assert cls.__module__ == module',
+            'assert "simpleml.models.classifiers.sklearn.svm" not in sys.modules',
+            'cls = SIMPLEML_REGISTRY.get("SklearnSVC", "simpleml.models.moved")',
+            'assert cls.__module__ == "simpleml.models.classifiers.sklearn.svm"',
+        ])
+        subprocess.check_call([sys.executable, '-c', script])
+
+    def test_failed_lazy_package_is_skipped(self):
+        registry = Registry(lazy_packages=['simpleml.missing_package'])
+        self.assertIsNone(registry.get('UnknownClass'))
+        self.assertEqual(registry.lazy_packages, [])
+
+    def test_failing_module_falls_back_to_lazy_packages(self):
+        directory = tempfile.mkdtemp()
+        with open(os.path.join(directory, 'simpleml_failing_module.py'), 'w') as module_file:
+            module_file.write('raise RuntimeError("missing configuration")\n')
+        sys.path.insert(0, directory)
+        try:
+            registry = Registry(lazy_packages=['simpleml.missing_package'])
+            self.assertIsNone(registry.get('UnknownClass', 'simpleml_failing_module'))
+            self.assertEqual(registry.lazy_packages, [])
+        finally:
+            sys.path.remove(directory)
+            shutil.rmtree(directory)
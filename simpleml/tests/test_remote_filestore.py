@@ -0,0 +1,37 @@
+from simpleml.persistables.remote_filestore import FilesystemRemoteFilestore, S3Filestore, LocalS3Client
+from simpleml.utils.errors import FilestoreError
+import cStringIO
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class RemoteFilestoreTests(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.content = os.urandom(3 * 1024 + 17)
+        self.stores = [
+            FilesystemRemoteFilestore(self.root, part_size=1024, retry_backoff=0),
+            S3Filestore('bucket', client=LocalS3Client(min_part_size=1024), part_size=1024, retry_backoff=0),
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_multipart_roundtrip(self):
+        for store in self.stores:
+            store.upload('key', cStringIO.StringIO(self.content))
+            downloaded = cStringIO.StringIO()
+            store.download('key', downloaded)
+
+            self.assertEqual(store.size('key'), len(self.content))
+            self.assertEqual(downloaded.getvalue(), self.content)
+
+    def test_corrupted_download_raises(self):
+        for store in self.stores:
+            store.upload('key', cStringIO.StringIO(self.content))
+            store._put_checksum('key', 'corrupted')
+
+            with self.assertRaises(FilestoreError):
+                store.download('key', cStringIO.StringIO())
@@ -0,0 +1,155 @@
+from simpleml.persistables import saving
+from simpleml.persistables.saving import DataframeTableSaveMixin, DiskParquetSaveMixin
+import numpy as np
+import pandas as pd
+import shutil
+import tempfile
+import unittest
+import uuid
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+class FakeCursor(object):
+    '''
+    Psycopg2 cursor over an in memory table. `count` is the row count
+    reported by `SELECT count(*)`, to mimic rows changing between statements
+    '''
+    def __init__(self, columns, rows, count):
+        self.columns = columns
+        self.rows = rows
+        self.count = count
+        self.description = None
+        self.statements = []
+        self._results = iter([])
+
+    def execute(self, statement):
+        self.statements.append(statement)
+        if 'LIMIT 0' in statement:
+            self.description = self.columns
+        elif 'count(*)' in statement:
+            self._results = iter([(self.count,)])
+        elif statement.startswith('SELECT'):
+            self._results = iter(self.rows)
+
+    def fetchone(self):
+        return next(self._results)
+
+    def fetchmany(self, size):
+        return [row for _, row in zip(range(size), self._results)]
+
+    def close(self):
+        pass
+
+
+class FakeEngine(object):
+    def __init__(self, columns, rows, count=None):
+        self.cursor = FakeCursor(columns, rows, len(rows) if count is None else count)
+
+    def raw_connection(self):
+        engine = self
+
+        class Connection(object):
+            def cursor(self, name=None):
+                return engine.cursor
+
+            def close(self):
+                pass
+
+        return Connection()
+
+
+class CursorToDataframeTests(unittest.TestCase):
+    def setUp(self):
+        self.columns = [('a', 20), ('b', 701), ('c', 25)]
+        self.rows = [(i, i / 2., 'row {}'.format(i)) for i in range(7)]
+        self.expected = pd.DataFrame({'a': np.arange(7, dtype=np.int64), 'b': np.arange(7) / 2.,
+                                      'c': ['row {}'.format(i) for i in range(7)]}, columns=['a', 'b', 'c'])
+
+    def test_fill_column_upcasts_nulls_and_grows(self):
+        array = np.empty(3, dtype=np.int64)
+        array = DataframeTableSaveMixin._fill_column(array, (1, 2), 0)
+        array = DataframeTableSaveMixin._fill_column(array, (3, None), 2)
+
+        self.assertEqual(array.dtype, np.float64)
+        self.assertEqual(len(array), 6)
+        np.testing.assert_array_equal(array[:4], [1, 2, 3, np.nan])
+
+        flags = DataframeTableSaveMixin._fill_column(np.empty(2, dtype=np.bool_), (True, None), 0)
+        self.assertEqual(list(flags), [True, None])
+
+    def test_rows_match_the_count(self):
+        engine = FakeEngine(self.columns, self.rows)
+        df = DataframeTableSaveMixin.cursor_to_df(engine, 'table', fetchsize=3)
+        pd.util.testing.assert_frame_equal(df, self.expected)
+        self.assertTrue(engine.cursor.statements[0].startswith('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ'))
+
+    def test_fewer_rows_than_counted_are_truncated(self):
+        engine = FakeEngine(self.columns, self.rows, count=10)
+        df = DataframeTableSaveMixin.cursor_to_df(engine, 'table', fetchsize=3)
+        pd.util.testing.assert_frame_equal(df, self.expected)
+
+    def test_more_rows_than_counted_grow_the_arrays(self):
+        engine = FakeEngine(self.columns, self.rows, count=2)
+        df = DataframeTableSaveMixin.cursor_to_df(engine, 'table', fetchsize=3)
+        pd.util.testing.assert_frame_equal(df, self.expected)
+
+    def test_iterator_yields_chunks(self):
+        rows = self.rows[:5] + [(None, None, None)] + self.rows[6:]
+        engine = FakeEngine(self.columns, rows)
+        chunks = list(DataframeTableSaveMixin.iter_cursor_to_df(engine, 'table', chunksize=3, columns=['a', 'b', 'c']))
+
+        self.assertEqual([len(chunk) for chunk in chunks], [3, 3, 1])
+        self.assertEqual(chunks[0]['a'].dtype, np.int64)
+        # Nulls only upcast the chunk holding them
+        self.assertEqual(chunks[1]['a'].dtype, np.float64)
+        self.assertTrue(np.isnan(chunks[1]['a'].iloc[2]))
+        self.assertIsNone(chunks[1]['c'].iloc[2])
+        self.assertIn('SELECT "a", "b", "c" FROM "public"."table"', engine.cursor.statements)
+
+
+class ParquetDataset(DiskParquetSaveMixin):
+    def __init__(self, dataframe=None):
+        self.id = uuid.uuid4()
+        self.dataframe = dataframe
+
+
+@unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+class DiskParquetSaveTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.original_directory = saving.PARQUET_FILESTORE_DIRECTORY
+        saving.PARQUET_FILESTORE_DIRECTORY = self.directory
+        self.df = pd.DataFrame({'a': np.arange(5), 'b': np.linspace(0, 1, 5),
+                                'c': ['x', None, 'y', 'z', 'x'],
+                                'd': pd.date_range('2018-01-01', periods=5)},
+                               index=pd.Index(range(10, 15), name='key'), columns=['a', 'b', 'c', 'd'])
+
+    def tearDown(self):
+        saving.PARQUET_FILESTORE_DIRECTORY = self.original_directory
+        shutil.rmtree(self.directory)
+
+    def saved(self):
+        dataset = ParquetDataset(self.df)
+        dataset._save_external_files()
+        loaded = ParquetDataset()
+        loaded.filepaths = dataset.filepaths
+        return loaded
+
+    def test_roundtrip_keeps_dtypes_and_index(self):
+        loaded = self.saved()
+        loaded._load_external_files()
+
+        self.assertFalse(loaded.unloaded_externals)
+        pd.util.testing.assert_frame_equal(loaded._external_file, self.df)
+
+    def test_column_projection(self):
+        df = self.saved()._read_dataframe_from_parquet(columns=['b', 'c'])
+        pd.util.testing.assert_frame_equal(df, self.df[['b', 'c']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+from simpleml.persistables.serialization import dump_with_array_sidecars, load_with_array_sidecars
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class ArraySidecarSerializationTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def roundtrip(self, obj, threshold=0):
+        with open(os.path.join(self.directory, 'object.pkl'), 'wb') as f:
+            filenames = dump_with_array_sidecars(obj, f, self.directory, threshold=threshold)
+        with open(os.path.join(self.directory, 'object.pkl'), 'rb') as f:
+            return filenames, load_with_array_sidecars(f, self.directory)
+
+    def test_large_arrays_are_memory_mapped(self):
+        array = np.arange(1000, dtype=np.float64)
+        filenames, loaded = self.roundtrip({'coef': array, 'same': array})
+
+        self.assertEqual(filenames, ['array_0.npy'])
+        self.assertIsInstance(loaded['coef'], np.memmap)
+        np.testing.assert_array_equal(loaded['coef'], array)
+
+    def test_small_and_object_arrays_stay_inline(self):
+        obj = {'small': np.arange(3), 'labels': np.array(['a', None], dtype=object)}
+        filenames, loaded = self.roundtrip(obj, threshold=1024)
+
+        self.assertEqual(filenames, [])
+        self.assertNotIsInstance(loaded['small'], np.memmap)
+        self.assertEqual(list(loaded['labels']), ['a', None])
+
+    def test_masked_arrays_keep_their_mask(self):
+        array = np.ma.masked_array(np.arange(1000, dtype=np.float64), mask=np.arange(1000) % 2 == 0)
+        filenames, loaded = self.roundtrip({'masked': array})
+
+        self.assertEqual(filenames, [])
+        self.assertIsInstance(loaded['masked'], np.ma.MaskedArray)
+        np.testing.assert_array_equal(loaded['masked'].mask, array.mask)
+        np.testing.assert_array_equal(loaded['masked'].data, array.data)
@@ -0,0 +1,317 @@
+from simpleml.utils.initialization import Database, SQLiteDatabase
+from simpleml.persistables.base_persistable import BasePersistable
+from simpleml.datasets.raw_datasets.base_raw_dataset import BaseRawDataset
+from simpleml.datasets.processed_datasets.base_processed_dataset import BaseProcessedDataset
+from simpleml.pipelines.dataset_pipelines.base_dataset_pipeline import BaseNoSplitDatasetPipeline
+from simpleml.utils.scoring.load_persistable import PersistableLoader
+from simpleml.metrics.base_metric import BaseMetric
+from simpleml.models.base_model import BaseModel
+from simpleml.persistables.version_counter import VersionCounter
+from simpleml.persistables import saving, fingerprint_cache
+from simpleml.persistables.filestore import ContentAddressedFilestore, LocalDiskCache
+from simpleml.persistables.fingerprint_cache import FingerprintCache
+from simpleml.persistables.background_saving import wait_all
+from simpleml.persistables.external_cache import EXTERNAL_FILE_CACHE
+from simpleml.utils.errors import DatasetError
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import MetaData, Table, create_engine, event, inspect
+import numpy as np
+import pandas as pd
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import uuid
+
+
+class SQLiteRawDataset(BaseRawDataset):
+    def build_dataframe(self):
+        self._external_file = pd.DataFrame({'a': np.arange(100), 'b': np.linspace(0, 1, 100)})
+
+
+class FailingRawDataset(SQLiteRawDataset):
+    def _save_external_files(self):
+        raise IOError('Disk full')
+
+
+class SQLiteDatabaseTests(unittest.TestCase):
+    '''
+    Persistence against the embedded backend, no server required
+    '''
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        # Stores are bound to the SimpleML directory at import, swap them
+        # so artifacts and reference counts do not leak between runs
+        stores = [
+            (saving, 'PICKLED_FILESTORE', ContentAddressedFilestore(os.path.join(cls.directory, 'pickled'))),
+            (saving, 'DISK_CACHE', LocalDiskCache(os.path.join(cls.directory, 'cache'))),
+            (saving, 'PARQUET_FILESTORE_DIRECTORY', os.path.join(cls.directory, 'parquet')),
+            (saving, 'MMAP_FILESTORE_DIRECTORY', os.path.join(cls.directory, 'mmap')),
+            (fingerprint_cache, 'FINGERPRINT_CACHE',
+             FingerprintCache(os.path.join(cls.directory, 'fingerprints.sqlite'))),
+        ]
+        cls.replaced_stores = [(module, name, getattr(module, name)) for module, name, _ in stores]
+        for module, name, store in stores:
+            setattr(module, name, store)
+
+        cls.database = SQLiteDatabase(os.path.join(cls.directory, 'SimpleML.sqlite'))
+        cls.database.initialize()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.database.dispose()
+        for module, name, store in cls.replaced_stores:
+            setattr(module, name, store)
+        shutil.rmtree(cls.directory)
+
+    def test_journal_mode_is_wal(self):
+        self.assertEqual(self.database.engine.execute('PRAGMA journal_mode').scalar(), 'wal')
+
+    def test_dataset_roundtrip(self):
+        for save_method in ('database', 'database_pickled'):
+            dataset = SQLiteRawDataset(name='sqlite_{}'.format(save_method), save_method=save_method,
+                                       label_columns=['b'])
+            dataset.build_dataframe()
+            dataset.save()
+
+            loaded = BaseRawDataset.filter(BaseRawDataset.id == dataset.id).first()
+            self.assertEqual(loaded.config['label_columns'], ['b'])
+            loaded.load()
+            pd.util.testing.assert_frame_equal(loaded.dataframe, dataset.dataframe)
+
+    def test_column_projections_are_read_once(self):
+        dataset = SQLiteRawDataset(name='sqlite_projections', save_method='database', label_columns=['b'])
+        dataset.build_dataframe()
+        dataset.save()
+
+        loaded = BaseRawDataset.filter(BaseRawDataset.id == dataset.id).first()
+        loaded.load(load_externals=False)
+        reads = []
+        read = loaded._read_dataframe_from_table
+
+        def counting_read(*args, **kwargs):
+            reads.append(kwargs.get('columns'))
+            return read(*args, **kwargs)
+
+        loaded._read_dataframe_from_table = counting_read
+        for _ in range(3):
+            self.assertEqual(list(loaded.X.columns), ['a'])
+            self.assertEqual(list(loaded.y.columns), ['b'])
+        self.assertEqual(reads, [['a'], ['b']])
+
+    def test_load_many_queries_once_per_lineage_hop(self):
+        raw_dataset = SQLiteRawDataset(name='sqlite_lineage', label_columns=['b'])
+        raw_dataset.build_dataframe()
+        raw_dataset.save()
+        for _ in range(4):
+            pipeline = BaseNoSplitDatasetPipeline(name='sqlite_lineage')
+            pipeline.add_dataset(raw_dataset)
+            pipeline.fit()
+            pipeline.save()
+            dataset = BaseProcessedDataset(name='sqlite_lineage')
+            dataset.add_pipeline(pipeline)
+            dataset.build_dataframe()
+            dataset.save()
+        BaseProcessedDataset._session.expunge_all()
+
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(self.database.engine, 'before_cursor_execute', count_statement)
+        try:
+            datasets = PersistableLoader.load_many(BaseProcessedDataset)
+            self.assertEqual(len(datasets), 4)
+            self.assertTrue(all(i.pipeline.dataset.name == 'sqlite_lineage' for i in datasets))
+        finally:
+            event.remove(self.database.engine, 'before_cursor_execute', count_statement)
+        # Datasets, their pipelines and the raw dataset
+        self.assertEqual(len(statements), 3)
+
+    def test_load_many_removes_worker_sessions(self):
+        for _ in range(3):
+            dataset = SQLiteRawDataset(name='sqlite_load_many', save_method='database_pickled', label_columns=['b'])
+            dataset.build_dataframe()
+            dataset.save()
+        BaseRawDataset._session.expunge_all()
+        EXTERNAL_FILE_CACHE.clear()
+
+        session = BaseRawDataset._session
+        removed = []
+        remove = session.remove
+
+        def recording_remove():
+            removed.append(threading.current_thread().name)
+            remove()
+
+        session.remove = recording_remove
+        try:
+            datasets = PersistableLoader.load_many(BaseRawDataset, load_externals=True, max_workers=2)
+        finally:
+            del session.remove
+        datasets = [i for i in datasets if i.name == 'sqlite_load_many']
+        self.assertEqual(len(datasets), 3)
+        self.assertTrue(all(len(i._external_file) == 100 for i in datasets))
+        # One per dataset loaded on a worker
+        self.assertGreaterEqual(len(removed), 3)
+        self.assertNotIn(threading.current_thread().name, removed)
+
+    def test_delete_releases_pickled_file(self):
+        dataset = SQLiteRawDataset(name='sqlite_delete', label_columns=['b'])
+        dataset.build_dataframe()
+        dataset._external_file['a'] = np.random.rand(100)
+        dataset.save()
+
+        path = dataset.filepaths['disk_pickled'][0]
+        self.assertEqual(saving.PICKLED_FILESTORE.references(path), 1)
+        dataset.delete()
+        self.assertEqual(saving.PICKLED_FILESTORE.references(path), 0)
+        self.assertFalse(saving.PICKLED_FILESTORE.exists(path))
+
+    def test_failed_background_saves_raise_at_barrier(self):
+        def dataset(cls):
+            dataset = cls(name='sqlite_background', save_method='database', label_columns=['b'])
+            dataset.build_dataframe()
+            return dataset
+
+        dataset(FailingRawDataset).save_async()
+        # Synchronous saves and later submissions finalize the failed save first
+        dataset(SQLiteRawDataset).save()
+        pending = dataset(SQLiteRawDataset).save_async()
+
+        with self.assertRaises(IOError):
+            wait_all()
+        self.assertTrue(pending.done())
+        self.assertEqual(BaseRawDataset.filter(BaseRawDataset.name == 'sqlite_background').count(), 2)
+        # Raised once
+        wait_all()
+
+    def test_background_save_result_raises_once(self):
+        dataset = FailingRawDataset(name='sqlite_background_result', save_method='database', label_columns=['b'])
+        dataset.build_dataframe()
+        pending = dataset.save_async()
+        with self.assertRaises(IOError):
+            pending.result()
+        wait_all()
+
+    def test_delta_versions_save_load_and_delete(self):
+        def save_version(df):
+            dataset = SQLiteRawDataset(name='sqlite_delta', save_method='disk_delta', label_columns=['b'])
+            dataset._external_file = df
+            dataset.save()
+            return dataset
+
+        df = pd.DataFrame({'a': np.arange(100), 'b': np.random.rand(100)})
+        first = save_version(df)
+        second = save_version(df.iloc[5:])
+        third = save_version(pd.concat([df.iloc[5:], df.iloc[:2]]))
+        self.assertIsNone(first.filepaths['delta_parent'])
+        self.assertEqual(second.filepaths['delta_parent'], str(first.id))
+        self.assertEqual(second.filepaths['delta_removed'], 5)
+        self.assertEqual(third.filepaths['delta_parent'], str(second.id))
+        self.assertEqual(third.filepaths['delta_added'], 2)
+
+        def load(dataset_id):
+            EXTERNAL_FILE_CACHE.clear()
+            BaseRawDataset._session.expunge_all()
+            loaded = BaseRawDataset.filter(BaseRawDataset.id == dataset_id).first()
+            loaded.load()
+            return loaded
+
+        pd.util.testing.assert_frame_equal(load(third.id).dataframe, third.dataframe)
+
+        # Deleting a parent rewrites its children as snapshots
+        delta_path = second.filepaths['disk_delta'][0]
+        load(first.id).delete()
+        loaded = load(second.id)
+        self.assertIsNone(loaded.filepaths['delta_parent'])
+        self.assertEqual(saving.PICKLED_FILESTORE.references(delta_path), 0)
+        pd.util.testing.assert_frame_equal(loaded.dataframe, second.dataframe)
+        pd.util.testing.assert_frame_equal(load(third.id).dataframe, third.dataframe)
+
+        # Missing parents are reported as such
+        orphan = load(third.id)
+        orphan.filepaths = dict(orphan.filepaths, delta_parent=str(uuid.uuid4()))
+        EXTERNAL_FILE_CACHE.clear()
+        with self.assertRaises(DatasetError):
+            orphan._load_external_files()
+        BaseRawDataset._session.expunge(orphan)
+
+    def test_concurrent_version_allocation(self):
+        table = BaseRawDataset.__table__
+        executor = ThreadPoolExecutor(max_workers=8)
+        versions = list(executor.map(lambda _: VersionCounter.allocate(table, 'sqlite_versions'), range(40)))
+        executor.shutdown()
+        self.assertEqual(sorted(versions), range(1, 41))
+
+    def test_version_allocation_is_scoped(self):
+        table = BaseMetric.__table__
+        model_id, other_model_id = uuid.uuid4(), uuid.uuid4()
+        versions = [VersionCounter.allocate(table, 'sqlite_metric', model_id=i)
+                    for i in (model_id, model_id, other_model_id)]
+        self.assertEqual(versions, [1, 2, 1])
+
+    def test_leaderboard_ranks_latest_metric_versions(self):
+        models, metrics = BaseModel.__table__, BaseMetric.__table__
+        model_ids = [uuid.uuid4(), uuid.uuid4()]
+        with self.database.engine.begin() as connection:
+            for version, model_id in enumerate(model_ids, 1):
+                connection.execute(models.insert().values(
+                    id=model_id, hash=version, registered_name='BaseModel', name='sqlite_leaderboard',
+                    version=version, params={'max_depth': version}))
+            # The first model was rescored lower
+            for model_id, version, value in ((model_ids[0], 1, 0.9), (model_ids[0], 2, 0.5),
+                                             (model_ids[1], 1, 0.7)):
+                connection.execute(metrics.insert().values(
+                    id=uuid.uuid4(), hash=version, registered_name='BaseMetric', name='sqlite_accuracy',
+                    version=version, model_id=model_id, values={'agg': value}))
+
+        ranked = PersistableLoader.leaderboard('sqlite_accuracy')
+        self.assertEqual([(model.id, value) for model, value in ranked],
+                         [(model_ids[1], 0.7), (model_ids[0], 0.5)])
+        self.assertEqual(PersistableLoader.search_models(metrics={'sqlite_accuracy__gt': 0.8}).all(), [])
+
+    def test_initialize_adds_missing_columns(self):
+        # Tables as created before `registered_module` existed
+        metadata = MetaData()
+        for table in BasePersistable.metadata.sorted_tables:
+            Table(table.name, metadata, *[column.copy() for column in table.c
+                                          if column.name != 'registered_module'])
+        engine = create_engine('sqlite://')
+        metadata.create_all(bind=engine)
+
+        with engine.begin() as connection:
+            Database.upgrade_tables(BasePersistable, connection)
+
+        # Nothing to add, nothing altered (and locked)
+        statements = []
+        event.listen(engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+        with engine.begin() as connection:
+            Database.upgrade_tables(BasePersistable, connection)
+        self.assertEqual([i for i in statements if i.startswith('ALTER')], [])
+        inspector = inspect(engine)
+        for table in BasePersistable.metadata.sorted_tables:
+            self.assertIn('registered_module', [i['name'] for i in inspector.get_columns(table.name)])
+
+    def test_load_row_saved_without_module(self):
+        dataset = SQLiteRawDataset(name='sqlite_no_module', save_method='database', label_columns=['b'])
+        dataset.build_dataframe()
+        dataset.save()
+        table = BaseRawDataset.__table__
+        with self.database.engine.begin() as connection:
+            connection.execute(table.update().where(table.c.id == dataset.id).values(registered_module=None))
+        BaseRawDataset._session.expunge_all()
+
+        loaded = BaseRawDataset.filter(BaseRawDataset.id == dataset.id).first()
+        self.assertIsNone(loaded.registered_module)
+        loaded.load()
+        self.assertIsInstance(loaded, SQLiteRawDataset)
+        pd.util.testing.assert_frame_equal(loaded.dataframe, dataset.dataframe)
+
+
+if __name__ == '__main__':
+    unittest.main()
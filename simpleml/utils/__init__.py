@@ -1,5 +1 @@
-# Create project directory on load
-import system_path
-
-
 __author__ = 'Elisha Yadgaran'
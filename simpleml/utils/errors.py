@@ -49,3 +49,10 @@ class ScoringError(SimpleMLError):
         super(MetricError, self).__init__(*args, **kwargs)
         custom_prefix = 'SimpleML Scoring Error: '
         self.message = custom_prefix + self.message
+
+
+class FilestoreError(SimpleMLError):
+    def __init__(self, *args, **kwargs):
+        super(FilestoreError, self).__init__(*args, **kwargs)
+        custom_prefix = 'SimpleML Filestore Error: '
+        self.message = custom_prefix + self.message
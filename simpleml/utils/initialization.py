@@ -11,11 +11,17 @@ import simpleml.datasets.processed_datasets.base_processed_dataset
 import simpleml.pipelines.production_pipelines.base_production_pipeline
 import simpleml.models.base_model
 import simpleml.metrics.base_metric
-from simpleml.persistables.dataset_storage import DatasetStorage, RawDatasetStorage
-from simpleml.persistables.binary_blob import BinaryBlob
+from simpleml.persistables.dataset_storage import DatasetStorage, RawDatasetStorage, DATASET_SCHEMA, RAW_DATASET_SCHEMA
+from simpleml.persistables.binary_blob import BinaryBlob, BINARY_STORAGE_SCHEMA
+from simpleml.persistables.version_counter import VersionCounter
+from simpleml.persistables.json_search import create_postgres_indexes
+from simpleml.utils.system_path import SIMPLEML_DIRECTORY, ensure_directory
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, exc, inspect
 from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
+import os
+import threading
 import psycopg2
 from psycopg2 import ProgrammingError
 
@@ -23,13 +29,67 @@ from psycopg2 import ProgrammingError
 __author__ = 'Elisha Yadgaran'
 
 
+# Connection pool defaults (overridable per Database)
+DEFAULT_POOL_SIZE = int(os.getenv('SIMPLEML_POOL_SIZE', 5))
+DEFAULT_MAX_OVERFLOW = int(os.getenv('SIMPLEML_MAX_OVERFLOW', 10))
+DEFAULT_POOL_RECYCLE = int(os.getenv('SIMPLEML_POOL_RECYCLE', 3600))
+
+# Columns added to persistable tables after their first release, as
+# (name, sql type). `create_all` does not alter existing tables, so they
+# are added on initialize
+ADDED_COLUMNS = [('registered_module', 'varchar')]
+
+# Embedded database file
+SQLITE_DATABASE_PATH = os.path.join(SIMPLEML_DIRECTORY, 'SimpleML.sqlite')
+
+# Engines are shared by every Database with the same url and pool settings
+_ENGINES = {}
+_ENGINES_LOCK = threading.Lock()
+
+
+def _make_fork_safe(engine):
+    '''
+    Connections are tagged with the pid that opened them. A forked child
+    checking out an inherited connection discards it (without closing the
+    parent's socket) and the pool opens a fresh one
+    '''
+    @event.listens_for(engine, 'connect')
+    def connect(dbapi_connection, connection_record):
+        connection_record.info['pid'] = os.getpid()
+
+    @event.listens_for(engine, 'checkout')
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        pid = os.getpid()
+        if connection_record.info['pid'] != pid:
+            connection_record.connection = connection_proxy.connection = None
+            raise exc.DisconnectionError(
+                'Connection record belongs to pid {}, attempting to check out in pid {}'.format(
+                    connection_record.info['pid'], pid))
+
+
+def dispose_engines():
+    '''
+    Close every pooled connection of every shared engine. Call before
+    forking (eg creating a process pool) so children do not inherit
+    connections; children would otherwise discard them on checkout
+    '''
+    with _ENGINES_LOCK:
+        for engine in _ENGINES.values():
+            engine.dispose()
+
+
 class Database(object):
     '''
     Basic configuration to interact with database
+
+    All tables share one pooled engine and one session factory per
+    database url (and pool settings)
     '''
     def __init__(self, database='SimpleML', user='simpleml',
                  password='simpleml', jdbc='postgresql',
-                 host='localhost', port=5432):
+                 host='localhost', port=5432,
+                 pool_size=DEFAULT_POOL_SIZE, max_overflow=DEFAULT_MAX_OVERFLOW,
+                 pool_pre_ping=True, pool_recycle=DEFAULT_POOL_RECYCLE):
         self.database_params = {
             'database': database,
             'user': user,
@@ -38,6 +98,13 @@ class Database(object):
             'host': host,
             'port': port
         }
+        self.pool_params = {
+            'pool_size': pool_size,
+            'max_overflow': max_overflow,
+            'pool_pre_ping': pool_pre_ping,
+            'pool_recycle': pool_recycle
+        }
+        self._session = None
 
     @property
     def database_name(self):
@@ -58,20 +125,81 @@ class Database(object):
 
     @property
     def engine(self):
-        return create_engine(self.engine_url)
+        '''
+        Shared pooled engine, created on first access
+        '''
+        key = (self.engine_url, tuple(sorted(self.pool_params.items())))
+        with _ENGINES_LOCK:
+            if key not in _ENGINES:
+                _ENGINES[key] = self._create_engine()
+            return _ENGINES[key]
+
+    def _create_engine(self):
+        engine = create_engine(self.engine_url, **self.pool_params)
+        _make_fork_safe(engine)
+        return engine
+
+    @property
+    def session(self):
+        '''
+        Thread local session factory bound to the shared engine
+        '''
+        if self._session is None:
+            self._session = scoped_session(sessionmaker(autocommit=True,
+                                                        autoflush=False,
+                                                        bind=self.engine))
+        return self._session
+
+    def dispose(self):
+        '''
+        Close the sessions and pooled connections of this database. The
+        engine stays usable and reconnects on demand
+        '''
+        if self._session is not None:
+            self._session.remove()
+        self.engine.dispose()
 
     @staticmethod
-    def create_tables(base, drop_tables=False):
+    def create_tables(base, drop_tables=False, bind=None):
         '''
         Creates database tables.
 
         :param drop_tables: Whether or not to drop the existing tables first.
+        :param bind: connection to use, defaults to the bound engine
         :return: None
         '''
         if drop_tables:
-            base.metadata.drop_all()
+            base.metadata.drop_all(bind=bind)
+
+        base.metadata.create_all(bind=bind)
+
+    @staticmethod
+    def upgrade_tables(base, bind):
+        '''
+        Adds the `ADDED_COLUMNS` missing from existing tables of a base.
+        Idempotent, rows saved before the upgrade get NULL values
+
+        Columns are checked in the catalog first, `ALTER TABLE` takes an
+        exclusive lock even when there is nothing to add
+
+        :param bind: connection to use
+        '''
+        inspector = inspect(bind)
+        # Concurrent workers may both find the column missing
+        if_not_exists = 'IF NOT EXISTS ' if bind.dialect.name == 'postgresql' else ''
+
+        for table in base.metadata.sorted_tables:
+            added_columns = [(name, sql_type) for name, sql_type in ADDED_COLUMNS if name in table.c]
+            if not added_columns:
+                continue
 
-        base.metadata.create_all()
+            existing = set(column['name'] for column in inspector.get_columns(table.name, schema=table.schema))
+            qualified_table = '"{}"'.format(table.name) if table.schema is None \
+                else '"{}"."{}"'.format(table.schema, table.name)
+            for name, sql_type in added_columns:
+                if name not in existing:
+                    bind.execute('ALTER TABLE {} ADD COLUMN {}"{}" {}'.format(
+                        qualified_table, if_not_exists, name, sql_type))
 
     def create_database(self):
         '''
@@ -97,7 +225,19 @@ class Database(object):
         except ProgrammingError:
             pass
 
-    def _initialize(self, base, create_database, drop_tables):
+    def _initialize(self, base):
+        '''
+        Bind a declarative base to the shared engine and inject the shared
+        session manager
+
+        :return: None
+        '''
+        base.metadata.bind = self.engine
+        base.query = self.session.query_property()
+        base.set_session(self.session)
+
+    def initialize(self, base_list=None, create_database=False, drop_tables=False,
+                   create_tables=True):
         '''
         Initialization method to set up database connection and inject
         session manager
@@ -105,39 +245,109 @@ class Database(object):
         :param create_database: Bool, whether to run database and user creation
             calls before starting up
         :param drop_tables: Bool, whether to drop existing tables in database
+        :param create_tables: Bool, whether to create missing tables. Workers
+            connecting to an initialized database can skip the table checks
         :return: None
         '''
-        engine = self.engine
-        session = scoped_session(sessionmaker(autocommit=True,
-                                              autoflush=False,
-                                              bind=engine))
-        base.metadata.bind = engine
-        base.query = session.query_property()
+        if base_list is None:
+            base_list = [BasePersistable, DatasetStorage, RawDatasetStorage, BinaryBlob, VersionCounter]
 
         if create_database:
             self.create_database()
 
-        self.create_tables(base, drop_tables=drop_tables)
+        for base in base_list:
+            self._initialize(base)
+
+        if create_tables or drop_tables:
+            # One connection for every table check
+            with self.engine.begin() as connection:
+                for base in base_list:
+                    self.create_tables(base, drop_tables=drop_tables, bind=connection)
+                    self.upgrade_tables(base, connection)
+
+            if self.engine.dialect.name == 'postgresql':
+                # Existing tables do not get indexes declared after they were
+                # created. Built concurrently, outside the startup transaction
+                with self.engine.connect() as connection:
+                    connection = connection.execution_options(isolation_level='AUTOCOMMIT')
+                    for base in base_list:
+                        create_postgres_indexes(connection, base.metadata)
+
+
+class SQLiteDatabase(Database):
+    '''
+    Embedded SQLite database for single node runs and tests, no server
+    required. Uses the WAL journal so readers do not block the writer
+
+    SQLite has no schemas: the dataset and binary schemas are separate
+    database files next to the main one, attached on every connection
+    under the schema name (all in memory for `:memory:`)
+    '''
+    SCHEMAS = (DATASET_SCHEMA, RAW_DATASET_SCHEMA, BINARY_STORAGE_SCHEMA)
+
+    def __init__(self, path=SQLITE_DATABASE_PATH, pool_size=DEFAULT_POOL_SIZE,
+                 max_overflow=DEFAULT_MAX_OVERFLOW):
+        super(SQLiteDatabase, self).__init__(
+            database=path, jdbc='sqlite', pool_size=pool_size, max_overflow=max_overflow,
+            pool_pre_ping=False, pool_recycle=-1)
+
+    @property
+    def in_memory(self):
+        return self.database_name == ':memory:'
 
-        base.set_session(session)
+    @property
+    def engine_url(self):
+        if self.in_memory:
+            return 'sqlite://'
+        return 'sqlite:///{}'.format(os.path.abspath(self.database_name))
 
-    def initialize(self, base_list=None, create_database=False, drop_tables=False):
+    def schema_path(self, schema):
         '''
-        Initialization method to set up database connection and inject
-        session manager
+        Database file attached for a schema
+        '''
+        if self.in_memory:
+            return ':memory:'
+        return '{}-{}{}'.format(os.path.splitext(os.path.abspath(self.database_name))[0],
+                                schema.lower(), os.path.splitext(self.database_name)[1])
+
+    def _create_engine(self):
+        self.create_database()
+        if self.in_memory:
+            # Every connection would be a new empty database, share one
+            engine = create_engine(self.engine_url, poolclass=StaticPool,
+                                   connect_args={'check_same_thread': False})
+        else:
+            # Pooled connections are handed between threads, never used concurrently
+            engine = create_engine(self.engine_url, poolclass=QueuePool,
+                                   pool_size=self.pool_params['pool_size'],
+                                   max_overflow=self.pool_params['max_overflow'],
+                                   connect_args={'check_same_thread': False, 'timeout': 30})
+            _make_fork_safe(engine)
+
+        @event.listens_for(engine, 'connect')
+        def connect(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for schema in self.SCHEMAS:
+                cursor.execute('ATTACH DATABASE ? AS "{}"'.format(schema), (self.schema_path(schema),))
+            if not self.in_memory:
+                for schema in ('main',) + self.SCHEMAS:
+                    cursor.execute('PRAGMA "{}".journal_mode=WAL'.format(schema))
+                    cursor.execute('PRAGMA "{}".synchronous=NORMAL'.format(schema))
+            cursor.execute('PRAGMA foreign_keys=ON')
+            cursor.close()
+
+        return engine
+
+    def create_database(self):
+        '''
+        SQLite creates database files on connect, only make sure the
+        directory exists
 
-        :param create_database: Bool, whether to run database and user creation
-            calls before starting up
-        :param drop_tables: Bool, whether to drop existing tables in database
         :return: None
         '''
-        if base_list is None:
-            base_list = [BasePersistable, DatasetStorage, RawDatasetStorage, BinaryBlob]
+        if not self.in_memory:
+            ensure_directory(os.path.dirname(os.path.abspath(self.database_name)))
 
-        for base in base_list:
-            self._initialize(base, create_database=create_database, drop_tables=drop_tables)
-            # Only create on the first go
-            create_database = False
 
 def run_sql_command(connection_params, command, autocommit=False):
     '''
@@ -1,25 +1,43 @@
 '''
 Helper module to track installed libraries
+
+Versions are looked up on first use (saving a persistable), so importing
+simpleml does not import every tracked library
 '''
 
 __author__ = 'Elisha Yadgaran'
 
-import simpleml
-import sqlalchemy
-import sqlalchemy_mixins
-import numpy as np
-import pandas as pd
-import dill
-import psycopg2
-import sklearn
+import importlib
+import threading
+
+TRACKED_LIBRARIES = [
+    'simpleml',
+    'sqlalchemy',
+    # 'sqlalchemy_mixins',
+    'numpy',
+    'pandas',
+    'dill',
+    'psycopg2',
+    'sklearn',
+]
+
+_INSTALLED_LIBRARIES = {}
+_LOCK = threading.Lock()
+
 
-INSTALLED_LIBRARIES = {
-    'simpleml': simpleml.__version__,
-    'sqlalchemy': sqlalchemy.__version__,
-    # 'sqlalchemy_mixins': sqlalchemy_mixins.__version__,
-    'numpy': np.__version__,
-    'pandas': pd.__version__,
-    'dill': dill.__version__,
-    'psycopg2': psycopg2.__version__,
-    'sklearn': sklearn.__version__
-}
+def get_installed_libraries():
+    '''
+    Dict of tracked library name -> installed version, None for libraries
+    that are not installed (memoized)
+    '''
+    with _LOCK:
+        if not _INSTALLED_LIBRARIES:
+            installed = {}
+            for library in TRACKED_LIBRARIES:
+                try:
+                    installed[library] = getattr(importlib.import_module(library), '__version__', None)
+                except ImportError:
+                    installed[library] = None
+            # Only memoize the complete dict
+            _INSTALLED_LIBRARIES.update(installed)
+        return _INSTALLED_LIBRARIES
@@ -10,11 +10,21 @@ from simpleml.pipelines.production_pipelines.base_production_pipeline import Bas
 from simpleml.models.base_model import BaseModel
 from simpleml.metrics.base_metric import BaseMetric
 from simpleml.utils.errors import SimpleMLError
+from simpleml.persistables.json_search import json_predicates, parse_predicate, expression_index, postgres_index_ddl
+from sqlalchemy import inspect, and_, exists, select, func
+from sqlalchemy.orm import selectinload, aliased
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import os
 
 
 __author__ = 'Elisha Yadgaran'
 
 
+# Threads loading external files in `load_many`
+DEFAULT_LOAD_WORKERS = int(os.getenv('SIMPLEML_LOAD_WORKERS', 4))
+
+
 class PersistableLoader(object):
     '''
     Wrapper class to load various persistables
@@ -61,3 +71,159 @@ class PersistableLoader(object):
         filters['name'] = name
         filters['model_id'] = model_id
         return cls.load_persistable(BaseMetric, filters)
+
+    @classmethod
+    def lineage_options(cls, persistable_cls, _path=None, _visited=None):
+        '''
+        Eager loading options for the full lineage of a persistable class
+        (eg metric -> model -> pipeline -> dataset -> dataset pipeline ->
+        raw dataset). Each relationship hop is one `select ... in` query
+        for the whole batch, regardless of how many objects are loaded.
+        Classes already on the path are not revisited (eg backrefs)
+        '''
+        mapper = inspect(persistable_cls)
+        visited = (_visited or frozenset()) | frozenset([mapper])
+
+        options = []
+        for relationship in mapper.relationships:
+            if relationship.mapper in visited:
+                continue
+            loader = selectinload(relationship.class_attribute) if _path is None \
+                else _path.selectinload(relationship.class_attribute)
+            options.append(loader)
+            options.extend(cls.lineage_options(relationship.mapper.class_, _path=loader, _visited=visited))
+        return options
+
+    @classmethod
+    def load_many(cls, persistable_cls, load_externals=False, max_workers=DEFAULT_LOAD_WORKERS, **filters):
+        '''
+        Load every persistable matching filters with its full lineage in a
+        fixed number of queries (one per lineage hop)
+
+        :param persistable_cls: table class to query (eg BaseMetric)
+        :param load_externals: whether to load the external files of the
+            matching persistables (not their lineage), in parallel
+        :param max_workers: threads loading external files
+        '''
+        persistables = persistable_cls.where(**filters)\
+            .options(*cls.lineage_options(persistable_cls))\
+            .order_by(persistable_cls.version.desc()).all()
+
+        # Lineage is already in the session, so relationship loads do not query
+        for persistable in persistables:
+            persistable.load(load_externals=False)
+
+        if load_externals:
+            with_externals = [i for i in persistables if i.has_external_files]
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+            try:
+                list(executor.map(cls._load_external_files_in_worker, with_externals))
+            finally:
+                executor.shutdown()
+
+        return persistables
+
+    @staticmethod
+    def _load_external_files_in_worker(persistable):
+        '''
+        Load external files on an executor thread. Some storage reads query
+        through the thread local scoped session (eg database pickles, delta
+        parents), so the thread's session is removed when done
+        '''
+        try:
+            persistable._load_external_files()
+        finally:
+            persistable._session.remove()
+
+    @classmethod
+    def load_metrics(cls, load_externals=False, **filters):
+        return cls.load_many(BaseMetric, load_externals=load_externals, **filters)
+
+    @staticmethod
+    def _metric_predicates(metrics, metric_key):
+        '''
+        Group `{metric_name__operator: value}` into
+        `{metric_name: {metric_key__operator: value}}`
+        '''
+        grouped = defaultdict(dict)
+        for predicate, value in (metrics or {}).items():
+            metric_name, operator = parse_predicate(predicate)
+            grouped[metric_name]['{}__{}'.format(metric_key, operator)] = value
+        return grouped
+
+    @staticmethod
+    def _latest_version(metric):
+        '''
+        Correlated subquery of the latest version of a metric (aliased
+        BaseMetric) for its model. Metrics are versioned per (name, model),
+        older versions are superseded
+        '''
+        latest = aliased(BaseMetric)
+        return select([func.max(latest.version)]).where(and_(
+            latest.model_id == metric.model_id, latest.name == metric.name)).as_scalar()
+
+    @classmethod
+    def search_models(cls, params=None, metrics=None, metric_key='agg', **filters):
+        '''
+        Query of models matching hyperparameter and metric predicates,
+        compiled into (indexed, on postgres) SQL. Predicates use the
+        `key__operator` syntax (eq, ne, gt, gte, lt, lte, in):
+
+            search_models(registered_name='SklearnRandomForestClassifier',
+                          params={'max_depth__gt': 10},
+                          metrics={'validation_roc_auc__gt': 0.8})
+
+        Returns models as stored (call `load()` on the ones used)
+
+        :param params: predicates on model params
+        :param metrics: predicates on the values of metrics (by metric name)
+            scored for the model, latest version of each metric only
+        :param metric_key: key of the metric values to compare (singular
+            value metrics are stored as {'agg': value})
+        '''
+        dialect_name = BaseModel.metadata.bind.dialect.name
+        query = BaseModel.where(**filters)
+        if params:
+            query = query.filter(*json_predicates(BaseModel.params, params, dialect_name))
+
+        for metric_name, predicates in cls._metric_predicates(metrics, metric_key).items():
+            metric = aliased(BaseMetric)
+            query = query.filter(exists().where(and_(
+                metric.model_id == BaseModel.id, metric.name == metric_name,
+                metric.version == cls._latest_version(metric),
+                *json_predicates(metric.values, predicates, dialect_name))))
+        return query
+
+    @classmethod
+    def leaderboard(cls, metric_name, limit=100, ascending=False, params=None, metrics=None,
+                    metric_key='agg', **filters):
+        '''
+        Top `limit` (model, metric value) pairs ranked by the latest version
+        of a metric for each model, optionally restricted with `search_models`
+        predicates. Walks the metric name/value index on postgres, so only
+        the returned rows are read
+
+        :param metric_name: metric to rank by
+        :param ascending: rank lowest values first (eg for losses)
+        '''
+        metric = aliased(BaseMetric)
+        value = metric.values[metric_key].as_float()
+        return cls.search_models(params=params, metrics=metrics, metric_key=metric_key, **filters)\
+            .join(metric, and_(metric.model_id == BaseModel.id, metric.name == metric_name,
+                               metric.version == cls._latest_version(metric)))\
+            .filter(value.isnot(None))\
+            .add_columns(value)\
+            .order_by(value.asc() if ascending else value.desc())\
+            .limit(limit).all()
+
+    @staticmethod
+    def create_search_index(persistable_cls, column_name, key):
+        '''
+        Create an expression index for range predicates on a frequently
+        searched key (eg `create_search_index(BaseModel, 'params', 'max_depth')`).
+        Postgres only, other backends are left unchanged
+
+        :param column_name: JSON column (`params`, `metadata`, `values`)
+        '''
+        table = persistable_cls.__table__
+        postgres_index_ddl(table, *expression_index(table, column_name, key)).execute(bind=table.bind)
@@ -6,17 +6,29 @@ Defaults to user's home directory if no environment variable is set
 
 __author__ = 'Elisha Yadgaran'
 
+import errno
 import os
 
 SIMPLEML_DIRECTORY = os.getenv('SIMPLEML_DIRECTORY_PATH', os.path.expanduser("~/.simpleml"))
 FILESTORE_DIRECTORY = os.path.join(SIMPLEML_DIRECTORY, 'filestore/')
 PICKLED_FILESTORE_DIRECTORY = os.path.join(FILESTORE_DIRECTORY, 'pickled/')
+PARQUET_FILESTORE_DIRECTORY = os.path.join(FILESTORE_DIRECTORY, 'parquet/')
+MMAP_FILESTORE_DIRECTORY = os.path.join(FILESTORE_DIRECTORY, 'mmap/')
+# Local copies of database stored artifacts
+DISK_CACHE_DIRECTORY = os.path.join(SIMPLEML_DIRECTORY, 'cache/')
+# Memoized dataset hashes keyed by source identity. Kept out of the disk
+# cache directory, which is evicted by size
+FINGERPRINT_CACHE_PATH = os.path.join(SIMPLEML_DIRECTORY, 'fingerprints.sqlite')
 
-if not os.path.exists(SIMPLEML_DIRECTORY):
-    os.makedirs(SIMPLEML_DIRECTORY)
 
-if not os.path.exists(FILESTORE_DIRECTORY):
-    os.makedirs(FILESTORE_DIRECTORY)
-
-if not os.path.exists(PICKLED_FILESTORE_DIRECTORY):
-    os.makedirs(PICKLED_FILESTORE_DIRECTORY)
+def ensure_directory(directory):
+    '''
+    Create directory (and parents) if missing, returns it. Directories are
+    created on first write instead of at import
+    '''
+    try:
+        os.makedirs(directory)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    return directory
@@ -114,7 +114,8 @@ class RawDatasetCreator(PersistableCreator):
             filters = {
                 'name': name,
                 'registered_name': registered_name,
-                'hash_': new_dataset._hash()
+                # Memoized by source identity when the dataset defines one
+                'hash_': new_dataset._memoized_hash()
             }
 
         else: